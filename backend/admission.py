@@ -0,0 +1,253 @@
+import asyncio
+import heapq
+import ipaddress
+import itertools
+import math
+import time
+from fastapi.responses import JSONResponse
+from backend.auth_manager import verify_token
+from core.config_manager import config
+from core.telemetry import span
+from core.ttl_cache import TTLCache
+
+# Admission control for the AI endpoints. Each request first takes a token from its
+# caller's bucket (per user, or per IP for anonymous callers), then needs one of
+# AI_MAX_IN_FLIGHT slots. When all slots are busy it waits in a bounded priority queue
+# (authenticated before anonymous); when the queue is full or the wait is too long it
+# gets a fast 503 instead of slowing everyone down. The slot is held until the response
+# (including an SSE stream) has been sent.
+AI_MAX_IN_FLIGHT = int(config.get("AI_MAX_IN_FLIGHT", "32"))
+AI_QUEUE_SIZE = int(config.get("AI_QUEUE_SIZE", "64"))
+AI_QUEUE_TIMEOUT = float(config.get("AI_QUEUE_TIMEOUT", "10"))
+
+# Token buckets: sustained requests per minute, and burst size
+USER_RATE_PER_MINUTE = float(config.get("USER_RATE_PER_MINUTE", "30"))
+USER_BURST = int(config.get("USER_BURST", "10"))
+ANON_RATE_PER_MINUTE = float(config.get("ANON_RATE_PER_MINUTE", "10"))
+ANON_BURST = int(config.get("ANON_BURST", "5"))
+# Batch quota per user, charged one token per item; the burst caps the size of a batch
+BATCH_ITEMS_PER_MINUTE = float(config.get("BATCH_ITEMS_PER_MINUTE", "300"))
+BATCH_ITEMS_BURST = int(config.get("BATCH_ITEMS_BURST", "1000"))
+
+# X-Forwarded-For is only believed when the connection comes from one of these proxies
+# (IPs or CIDRs, comma separated; "*" = any). Otherwise any client could send the header
+# and get a fresh bucket per request. Vercel sets the header itself, so it is trusted there.
+TRUSTED_PROXIES = config.get("TRUSTED_PROXIES", "*" if config.get("VERCEL") else "")
+
+ADMISSION_PATHS = ("/ai/run", "/modules/chat-with-data/analyze")
+# Batches take one rate-limit token per request at the door, then one token per item from the
+# user's batch quota (check_batch); each item then takes its own slot (see backend/batch.py)
+BATCH_PATHS = ("/ai/run/batch",)
+
+AUTHENTICATED = 0
+ANONYMOUS = 1
+# Batch items queue behind interactive requests
+BATCH = 2
+
+class Rejected(Exception):
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+    def response(self):
+        return JSONResponse(
+            {"detail": self.detail},
+            status_code=self.status_code,
+            headers={"Retry-After": str(max(1, math.ceil(self.retry_after)))},
+        )
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, burst: int):
+        self.rate = rate_per_second
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self, n: int = 1):
+        """Returns 0 if n tokens were taken, otherwise the seconds until they are available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= n:
+            self.tokens -= n
+            return 0.0
+        return (n - self.tokens) / self.rate
+
+class AdmissionController:
+    def __init__(self, max_in_flight: int = AI_MAX_IN_FLIGHT, queue_size: int = AI_QUEUE_SIZE, queue_timeout: float = AI_QUEUE_TIMEOUT):
+        self.max_in_flight = max_in_flight
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = {"rate_limited": 0, "queue_full": 0, "queue_timeout": 0}
+        # Idle buckets expire; a fresh bucket is full, which is what an idle caller would have anyway
+        self._buckets = TTLCache(maxsize=100000, ttl=600)
+        self._queue = []  # heap of (priority, sequence, future)
+        self._sequence = itertools.count()
+        self._hold_time = 1.0  # moving average of seconds a slot is held
+
+    def _bucket(self, key: str, priority: int):
+        bucket = self._buckets.get(key, None)
+        if bucket is None:
+            if priority == AUTHENTICATED:
+                bucket = TokenBucket(USER_RATE_PER_MINUTE / 60, USER_BURST)
+            elif priority == BATCH:
+                bucket = TokenBucket(BATCH_ITEMS_PER_MINUTE / 60, BATCH_ITEMS_BURST)
+            else:
+                bucket = TokenBucket(ANON_RATE_PER_MINUTE / 60, ANON_BURST)
+            self._buckets.set(key, bucket)
+        return bucket
+
+    def _queue_wait_estimate(self):
+        return self._hold_time * (len(self._queue) + 1) / self.max_in_flight
+
+    def check_rate(self, key: str, priority: int, n: int = 1):
+        wait = self._bucket(key, priority).take(n)
+        if wait:
+            self.rejected["rate_limited"] += 1
+            raise Rejected(429, "Too many requests. Please slow down.", wait)
+
+    def check_batch(self, user_id: str, items: int):
+        """Charges a batch to the user's batch quota, all items or none (429 if it can't cover them)"""
+        self.check_rate(f"batch:{user_id}", BATCH, items)
+
+    async def acquire(self, priority: int):
+        if self.in_flight < self.max_in_flight and not self._queue:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+
+        if len(self._queue) >= self.queue_size:
+            worst = max(self._queue)
+            if worst[0] <= priority:
+                self.rejected["queue_full"] += 1
+                raise Rejected(503, "Server is busy. Please retry shortly.", self._queue_wait_estimate())
+            # A higher-priority request takes the place of the lowest-priority waiter
+            self._queue.remove(worst)
+            heapq.heapify(self._queue)
+            self.rejected["queue_full"] += 1
+            worst[2].set_exception(Rejected(503, "Server is busy. Please retry shortly.", self._queue_wait_estimate()))
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._sequence), future)
+        heapq.heappush(self._queue, entry)
+        try:
+            # The slot is handed over by release(), so in_flight is already counted
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if entry in self._queue:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+            if future.done() and not future.exception():
+                # Granted at the last moment; pass the slot on
+                self.release(0.0)
+            self.rejected["queue_timeout"] += 1
+            raise Rejected(503, "Server is busy. Please retry shortly.", self._queue_wait_estimate())
+        except asyncio.CancelledError:
+            # Client went away while queued
+            if entry in self._queue:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+            elif future.done() and not future.exception():
+                self.release(0.0)
+            raise
+        self.admitted += 1
+
+    def release(self, held_seconds: float):
+        if held_seconds:
+            self._hold_time = 0.9 * self._hold_time + 0.1 * held_seconds
+        while self._queue:
+            _, _, future = heapq.heappop(self._queue)
+            if not future.done():
+                # Hand the slot straight to the next waiter
+                future.set_result(True)
+                return
+        self.in_flight -= 1
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queued": len(self._queue),
+            "queue_size": self.queue_size,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "avg_hold_seconds": round(self._hold_time, 3),
+        }
+
+admission = AdmissionController()
+
+_TRUST_ANY = TRUSTED_PROXIES.strip() == "*"
+_TRUSTED_NETWORKS = [] if _TRUST_ANY else [ipaddress.ip_network(p.strip(), strict=False) for p in TRUSTED_PROXIES.split(",") if p.strip()]
+
+def _trusted_proxy(address: str):
+    if _TRUST_ANY:
+        return True
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in _TRUSTED_NETWORKS)
+
+def _client_ip(scope):
+    client = scope.get("client")
+    peer = client[0] if client else "unknown"
+    headers = dict(scope.get("headers") or [])
+    forwarded = headers.get(b"x-forwarded-for")
+    if not forwarded or not _trusted_proxy(peer):
+        return peer
+    hops = [hop.strip() for hop in forwarded.decode("latin-1").split(",") if hop.strip()]
+    if _TRUST_ANY:
+        # The platform proxy sets the header; the original client comes first
+        return hops[0] if hops else peer
+    # Each trusted proxy appends the address it saw: the last hop that is not one of
+    # ours is the client (anything before it could have been sent by the client)
+    for hop in reversed(hops):
+        if not _trusted_proxy(hop):
+            return hop
+    return hops[0] if hops else peer
+
+async def _caller(scope):
+    """(bucket key, priority): the verified user id, or the client IP for anonymous callers"""
+    headers = dict(scope.get("headers") or [])
+    authorization = headers.get(b"authorization", b"").decode("latin-1")
+    if authorization:
+        try:
+            user = await verify_token(authorization.replace("Bearer ", ""))
+            user_id = user.get("id") if isinstance(user, dict) else user.id
+            return f"user:{user_id}", AUTHENTICATED
+        except Exception:
+            # Invalid tokens are rejected by the endpoint itself; here they count as anonymous
+            pass
+    return f"ip:{_client_ip(scope)}", ANONYMOUS
+
+class AdmissionMiddleware:
+    """Applies admission control to the AI endpoints (ADMISSION_PATHS)"""
+
+    def __init__(self, app, controller: AdmissionController = admission, paths: tuple = ADMISSION_PATHS):
+        self.app = app
+        self.controller = controller
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS" or not scope["path"].startswith(self.paths):
+            return await self.app(scope, receive, send)
+
+        key, priority = await _caller(scope)
+        try:
+            self.controller.check_rate(key, priority)
+            if scope["path"].startswith(BATCH_PATHS):
+                return await self.app(scope, receive, send)
+            with span("admission_queue"):
+                await self.controller.acquire(priority)
+        except Rejected as rejected:
+            return await rejected.response()(scope, receive, send)
+
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(time.monotonic() - start)
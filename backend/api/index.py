@@ -1,5 +1,6 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import sys
@@ -8,12 +9,29 @@ import os
 # Ensure the root directory is in sys.path so modules like 'core' and 'backend' can be imported
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from core.ai_gateway import run_ai
+from core.ai_gateway import arun_ai, invalidate_user_key, key_cache
+from core.provider_health import provider_health
+from core.db import db
+from core.response_cache import response_cache, plan_cache, cache_key, cache_bypassed, is_cacheable
+from core.sessions import session_store, finish_turn
+from core.prompt_builder import count_tokens
+from core.telemetry import span, prompt_tokens
 from backend.auth_manager import get_current_user
+from backend.uploads import UploadSizeLimitMiddleware
+from backend.admission import AdmissionMiddleware, admission, Rejected
+from backend.tracing import TracingMiddleware, metrics_response
+from backend.batch import run_batch, prefetch_keys, BATCH_MAX_ITEMS, BATCH_MAX_CONCURRENCY, BATCH_DEFAULT_CONCURRENCY
 from backend.modules import chat_with_data # Explicit Import
 
 app = FastAPI(title="Central AI Hub Backend")
 
+# Per-caller rate limits and a global in-flight cap for the AI endpoints (429/503 + Retry-After).
+# Added before CORS so it runs inside it and rejections still carry CORS headers.
+app.add_middleware(AdmissionMiddleware)
+
+# Reject oversized uploads (413) before they are spooled; also inside CORS
+app.add_middleware(UploadSizeLimitMiddleware)
+
 # CORS Setup
 app.add_middleware(
     CORSMiddleware,
@@ -21,8 +39,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After", "X-Cache", "X-File-Id", "X-Prompt-Tokens", "X-Session-Id", "X-Trace-Id", "Server-Timing"],
 )
 
+# Outermost: per-request trace and latency, so admission and auth time is included
+app.add_middleware(TracingMiddleware)
+
 # Register Modules
 app.include_router(chat_with_data.router)
 
@@ -31,11 +53,15 @@ class AIRequest(BaseModel):
     provider: str = "gemini"
     model: Optional[str] = None
     temperature: float = 0.7
+    # Continue a server-side conversation ("new" starts one); not used for batch items
+    session_id: Optional[str] = None
 
 @app.post("/ai/run")
-async def run_ai_endpoint(request: AIRequest, user: Any = Depends(get_current_user)):
+async def run_ai_endpoint(request: AIRequest, http_request: Request, http_response: Response, user: Any = Depends(get_current_user)):
     """
     Single endpoint for AI execution.
+    Identical requests from the same user are answered from the response cache
+    (X-Cache: HIT) unless sent with "Cache-Control: no-cache" or "X-Cache-Bypass: 1".
     """
     # Extract user ID safely
     if isinstance(user, dict):
@@ -43,19 +69,110 @@ async def run_ai_endpoint(request: AIRequest, user: Any = Depends(get_current_us
     else:
         user_id = user.id
 
+    # With a session, only the new messages are sent; earlier turns come from the server
+    session = session_store.get_or_create(request.session_id, user_id) if request.session_id else None
+    messages = session.messages() + request.messages if session else request.messages
+
+    key = cache_key("ai/run", user_id, request.provider, request.model, request.temperature, messages)
+    use_cache = not cache_bypassed(http_request)
+    cached = response_cache.get(key, None) if use_cache else None
+    if cached is not None:
+        http_response.headers["X-Cache"] = "HIT"
+        return _ai_run_reply(session, request.messages, cached)
+
     try:
-        response = run_ai(
-            user_id=user_id,
-            messages=request.messages,
-            provider=request.provider,
-            model=request.model,
-            temperature=request.temperature
-        )
-        return {"response": response}
+        prompt_tokens.observe(sum(count_tokens(m.get("content", "")) for m in messages), endpoint="ai/run")
+        with span("model"):
+            response = await arun_ai(
+                user_id=user_id,
+                messages=messages,
+                provider=request.provider,
+                model=request.model,
+                temperature=request.temperature
+            )
+        if is_cacheable(response):
+            response_cache.set(key, response)
+        http_response.headers["X-Cache"] = "MISS" if use_cache else "BYPASS"
+        return _ai_run_reply(session, request.messages, response)
     except Exception as e:
         print(f"Error in /ai/run: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _ai_run_reply(session, new_messages: list, response: str):
+    if not session:
+        return {"response": response}
+    question = next((m["content"] for m in reversed(new_messages) if m.get("role") == "user"), "")
+    finish_turn(session, question, response)
+    return {"response": response, "session_id": session.id}
+
+class AIBatchRequest(BaseModel):
+    requests: List[AIRequest]
+    concurrency: int = BATCH_DEFAULT_CONCURRENCY
+
+@app.post("/ai/run/batch")
+async def run_ai_batch_endpoint(batch: AIBatchRequest, http_request: Request, user: Any = Depends(get_current_user)):
+    """
+    Run many /ai/run requests with one auth check, at most `concurrency` at a time.
+    Streams NDJSON, one line per request as it completes:
+    {"index": 3, "response": "..."} or {"index": 3, "error": "..."}
+    """
+    user_id = user.get("id") if isinstance(user, dict) else user.id
+    if len(batch.requests) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch can hold at most {BATCH_MAX_ITEMS} requests")
+    try:
+        # One rate-limit token per item, so a batch can't get around the per-user limits
+        admission.check_batch(user_id, len(batch.requests))
+    except Rejected as rejected:
+        return rejected.response()
+
+    concurrency = max(1, min(batch.concurrency, BATCH_MAX_CONCURRENCY))
+    # One key lookup per provider; every item after that is a key cache hit
+    await prefetch_keys(user_id, batch.requests)
+    return StreamingResponse(
+        run_batch(user_id, batch.requests, concurrency, use_cache=not cache_bypassed(http_request)),
+        media_type="application/x-ndjson",
+    )
+
+@app.post("/ai/keys/invalidate")
+async def invalidate_keys_endpoint(provider: Optional[str] = None, user: Any = Depends(get_current_user)):
+    """
+    Drop the caller's cached BYOK keys. Call after saving or rotating a key.
+    """
+    user_id = user.get("id") if isinstance(user, dict) else user.id
+    invalidate_user_key(user_id, provider)
+    return {"invalidated": provider or "all"}
+
+@app.get("/ai/keys/cache-stats")
+async def key_cache_stats_endpoint(user: Any = Depends(get_current_user)):
+    return key_cache.stats()
+
+@app.get("/ai/providers/health")
+async def provider_health_endpoint(user: Any = Depends(get_current_user)):
+    """Rolling error rate, time-to-first-token percentiles and circuit state per provider"""
+    return provider_health.stats()
+
+@app.get("/ai/admission/stats")
+async def admission_stats_endpoint(user: Any = Depends(get_current_user)):
+    return admission.stats()
+
+@app.get("/ai/responses/cache-stats")
+async def response_cache_stats_endpoint(user: Any = Depends(get_current_user)):
+    return {"responses": response_cache.stats(), "plans": plan_cache.stats()}
+
+@app.get("/ai/db/stats")
+async def db_stats_endpoint(user: Any = Depends(get_current_user)):
+    """Data-access pool settings and per-query latency (p50/p95/max over recent calls)"""
+    return db.stats()
+
+@app.get("/ai/sessions/stats")
+async def session_stats_endpoint(user: Any = Depends(get_current_user)):
+    return session_store.stats()
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint(request: Request):
+    """Prometheus scrape target; set METRICS_TOKEN to require "Authorization: Bearer <token>" """
+    return metrics_response(request)
+
 @app.get("/")
 async def root():
     return {"message": "Central AI Hub Backend is running"}
@@ -1,18 +1,112 @@
+import hashlib
+import time
+import jwt
 from fastapi import Header, HTTPException
-from core.supabase_client import supabase
+from core.config_manager import config
+from core.db import db
+from core.telemetry import span
+from core.ttl_cache import TTLCache, MISSING
+
+# Local JWT verification settings.
+# HS256 tokens are checked with the project JWT secret (Dashboard > Settings > API).
+# Asymmetric tokens (RS256/ES256) are checked against the project's JWKS endpoint.
+JWT_SECRET = config.get("SUPABASE_JWT_SECRET")
+JWT_AUDIENCE = config.get("SUPABASE_JWT_AUDIENCE", "authenticated")
+JWKS_URL = f"{config.get_required('SUPABASE_URL').rstrip('/')}/auth/v1/.well-known/jwks.json"
+
+# Verified token -> user. Entries never outlive the token's own 'exp'.
+token_cache = TTLCache(
+    maxsize=int(config.get("AUTH_CACHE_SIZE", "10000")),
+    ttl=float(config.get("AUTH_CACHE_TTL", "300")),
+)
+
+_jwks_client = None
+
+class LocalVerificationUnavailable(Exception):
+    """Raised when a token cannot be checked locally and needs the remote lookup"""
+
+def _get_jwks_client():
+    global _jwks_client
+    if _jwks_client is None:
+        # PyJWKClient caches the key set, so the JWKS fetch happens once per key rotation
+        _jwks_client = jwt.PyJWKClient(JWKS_URL, cache_keys=True, lifespan=3600)
+    return _jwks_client
+
+def _user_from_claims(claims: dict):
+    return {
+        "id": claims["sub"],
+        "email": claims.get("email"),
+        "phone": claims.get("phone"),
+        "role": claims.get("role"),
+        "aud": claims.get("aud"),
+        "app_metadata": claims.get("app_metadata", {}),
+        "user_metadata": claims.get("user_metadata", {}),
+    }
+
+def verify_token_locally(token: str):
+    """
+    Verify signature, expiry and audience without a network call.
+    Raises jwt.InvalidTokenError for bad tokens and LocalVerificationUnavailable
+    when no verification key is configured for the token's algorithm.
+    """
+    alg = jwt.get_unverified_header(token).get("alg")
+    options = {"require": ["exp", "sub"]}
+
+    if alg == "HS256":
+        if not JWT_SECRET:
+            raise LocalVerificationUnavailable("SUPABASE_JWT_SECRET is not configured")
+        claims = jwt.decode(token, JWT_SECRET, algorithms=["HS256"], audience=JWT_AUDIENCE, options=options)
+    elif alg in ("RS256", "ES256"):
+        try:
+            signing_key = _get_jwks_client().get_signing_key_from_jwt(token)
+        except jwt.PyJWKClientError as e:
+            raise LocalVerificationUnavailable(str(e))
+        claims = jwt.decode(token, signing_key.key, algorithms=[alg], audience=JWT_AUDIENCE, options=options)
+    else:
+        raise LocalVerificationUnavailable(f"Unsupported JWT algorithm: {alg}")
+
+    return _user_from_claims(claims), claims["exp"]
+
+async def verify_token(token: str):
+    """
+    Resolve a bearer token to a user: cache -> local JWT check -> Supabase Auth (fallback).
+    Raises HTTPException(401) if the token is invalid.
+    """
+    with span("auth"):
+        return await _verify_token(token)
+
+async def _verify_token(token: str):
+    cache_key = hashlib.sha256(token.encode()).hexdigest()
+    user = token_cache.get(cache_key)
+    if user is not MISSING:
+        return user
+
+    try:
+        user, exp = verify_token_locally(token)
+        token_cache.set(cache_key, user, ttl=min(token_cache.ttl, exp - time.time()))
+        return user
+    except jwt.InvalidTokenError as e:
+        raise HTTPException(status_code=401, detail=f"Authentication Failed: {str(e)}")
+    except LocalVerificationUnavailable:
+        pass
+
+    # Fallback: remote lookup via Supabase Auth
+    try:
+        user = await db.get_user(token)
+    except Exception as e:
+        raise HTTPException(status_code=401, detail=f"Authentication Failed: {str(e)}")
+    if not user or not user.get("id"):
+        raise HTTPException(status_code=401, detail="Invalid Token")
+
+    exp = jwt.decode(token, options={"verify_signature": False}).get("exp", 0)
+    token_cache.set(cache_key, user, ttl=min(token_cache.ttl, exp - time.time()))
+    return user
 
 async def get_current_user(authorization: str = Header(None)):
     if not authorization:
         raise HTTPException(status_code=401, detail="Missing Authorization Header")
-    
+
     token = authorization.replace("Bearer ", "")
-    
-    try:
-        # verify token using real Supabase Auth
-        res = supabase.auth.get_user(token)
-        if not res or not res.user:
-             raise HTTPException(status_code=401, detail="Invalid Token")
-        return res.user
-    except Exception as e:
-        # If authentication fails, we must fail. No mocks.
-        raise HTTPException(status_code=401, detail=f"Authentication Failed: {str(e)}")
+
+    # If authentication fails, we must fail. No mocks.
+    return await verify_token(token)
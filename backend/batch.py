@@ -0,0 +1,67 @@
+import asyncio
+import json
+import time
+from backend.admission import admission, Rejected, BATCH, BATCH_ITEMS_BURST
+from core.ai_gateway import arun_ai, aget_user_key, is_error_reply, KEY_PROVIDERS
+from core.config_manager import config
+from core.response_cache import response_cache, cache_key, is_cacheable
+
+# /ai/run/batch: many /ai/run requests in one HTTP call. Auth is checked once, the user's
+# keys are looked up once (the items then hit the key cache), and items run through the
+# gateway with bounded parallelism, each taking its own admission slot. Results stream
+# back as NDJSON lines in completion order.
+# A batch larger than the batch quota's burst could never be admitted
+BATCH_MAX_ITEMS = min(int(config.get("BATCH_MAX_ITEMS", "1000")), BATCH_ITEMS_BURST)
+BATCH_MAX_CONCURRENCY = int(config.get("BATCH_MAX_CONCURRENCY", "32"))
+BATCH_DEFAULT_CONCURRENCY = 8
+
+async def prefetch_keys(user_id: str, items: list):
+    await asyncio.gather(*(aget_user_key(user_id, p) for p in {KEY_PROVIDERS[item.provider] for item in items if item.provider in KEY_PROVIDERS}))
+
+async def _run_item(user_id: str, index: int, item, use_cache: bool):
+    key = cache_key("ai/run", user_id, item.provider, item.model, item.temperature, item.messages)
+    cached = response_cache.get(key, None) if use_cache else None
+    if cached is not None:
+        return {"index": index, "response": cached, "cached": True}
+
+    try:
+        await admission.acquire(BATCH)
+    except Rejected as rejected:
+        return {"index": index, "error": rejected.detail, "retry_after": round(rejected.retry_after, 1)}
+    start = time.monotonic()
+    try:
+        response = await arun_ai(user_id=user_id, messages=item.messages, provider=item.provider, model=item.model, temperature=item.temperature)
+    except Exception as e:
+        return {"index": index, "error": str(e)}
+    finally:
+        admission.release(time.monotonic() - start)
+
+    if is_error_reply(response):
+        return {"index": index, "error": response}
+    if is_cacheable(response):
+        response_cache.set(key, response)
+    return {"index": index, "response": response}
+
+async def run_batch(user_id: str, items: list, concurrency: int, use_cache: bool = True):
+    """NDJSON lines, one per item as it completes: {"index", "response"} or {"index", "error"}"""
+    pending = asyncio.Queue()
+    for index, item in enumerate(items):
+        pending.put_nowait((index, item))
+    results = asyncio.Queue()
+
+    async def worker():
+        while True:
+            try:
+                index, item = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await results.put(await _run_item(user_id, index, item, use_cache))
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(items)))]
+    try:
+        for _ in range(len(items)):
+            yield json.dumps(await results.get(), default=str) + "\n"
+    finally:
+        # Client disconnected or the batch finished: stop whatever is still running
+        for task in workers:
+            task.cancel()
@@ -1,17 +1,22 @@
-from fastapi import APIRouter, Depends, UploadFile, File, Form
-from backend.auth_manager import get_current_user
-from core.ai_gateway import run_ai
-from core.supabase_client import supabase
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from backend.auth_manager import get_current_user, verify_token
+from backend.uploads import open_upload, cancel_on_disconnect
+from backend.parsing.formats import find_format, parse_upload, UploadParseError
+from backend.parsing.tabular import format_profile
+from backend.parsing.local_query import execute_local_plan
+from backend.parsing.upload_cache import upload_cache, hash_upload
+from core.ai_gateway import arun_ai, aget_user_key
+from core.prompt_builder import PromptBuilder, encode_rows, format_usage
+from core.response_cache import response_cache, plan_cache, normalize_question, fingerprint, cache_key, cache_bypassed, record_stream, replay
+from core.schema_catalog import schema_catalog
+from core.sessions import session_store, record_turn, finish_turn
+from core.table_router import get_routing_index
+from core.telemetry import span, instrument_stream, prompt_tokens
+from core.query_plan import build_planner_messages, parse_plan, validate_plan, heuristic_plan, describe_plan, execute_plan
 from pydantic import BaseModel
+import asyncio
 import json
-import pandas as pd
-import io
-from rapidfuzz import process, fuzz
-import PyPDF2
-import openpyxl
-import docx
-import csv
-from PIL import Image
+import time
 
 router = APIRouter(prefix="/modules/chat-with-data", tags=["chat-with-data"])
 
@@ -26,14 +31,149 @@ async def get_current_user_optional(request: Request):
 
     token = authorization.replace("Bearer ", "")
     try:
-        from core.supabase_client import supabase
-        res = supabase.auth.get_user(token)
-        if res and res.user:
-            return res.user
-        return None
+        return await verify_token(token)
     except Exception:
         return None
 
+async def _user_with_key(request: Request):
+    """get_current_user_optional, then warm the key cache for the verified user only"""
+    user = await get_current_user_optional(request)
+    if user:
+        await aget_user_key(user.id if not isinstance(user, dict) else user.get("id"), "gemini")
+    return user
+
+async def sse_chunks(stream_generator, file_id: str = None, session_id: str = None):
+    """Relay an arun_ai result (error string or async text stream) as SSE events"""
+    # Lets the client continue the conversation and ask about the upload without resending it
+    if session_id:
+        yield f"data: {json.dumps({'session_id': session_id})}\n\n"
+    if file_id:
+        yield f"data: {json.dumps({'file_id': file_id})}\n\n"
+    try:
+        # Check if it's a string (error message)
+        if isinstance(stream_generator, str):
+            yield f"data: {json.dumps({'chunk': stream_generator})}\n\n"
+            yield "data: [DONE]\n\n"
+            return
+
+        async for text in stream_generator:
+            yield f"data: {json.dumps({'chunk': text})}\n\n"
+
+        yield "data: [DONE]\n\n"
+
+    except Exception as e:
+        yield f"data: {json.dumps({'chunk': f'Error: {str(e)}'})}\n\n"
+        yield "data: [DONE]\n\n"
+
+async def ingest_upload(filename: str, fileobj, owner: str):
+    """
+    Parse an upload into the content-addressed cache, or reuse the owner's earlier parse of the
+    same bytes. Returns a CachedUpload, or None for unsupported file types.
+    """
+    file_id = await asyncio.to_thread(hash_upload, fileobj, owner)
+    cached = upload_cache.get(file_id, owner)
+    if cached:
+        return cached
+
+    # Parsing runs in the parser process pool (see backend/parsing/formats.py)
+    handler = find_format(filename)
+    if handler is None:
+        return None
+    with span("file_parse"):
+        return await parse_upload(handler, file_id, owner, filename, fileobj)
+
+# Prompt budget (characters) for document text; larger documents contribute their most relevant chunks
+DOCUMENT_BUDGETS = {"text": ("Uploaded File Content", 10000), "word": ("Uploaded Word Doc Content", 5000), "pdf": ("Uploaded PDF Content", 5000)}
+
+async def build_file_context(user_id: str, question: str, upload, use_cache: bool = True):
+    """Prompt context (and image, if any) for a cached upload"""
+    if upload.kind in DOCUMENT_BUDGETS:
+        label, budget = DOCUMENT_BUDGETS[upload.kind]
+        text, used, total = await asyncio.to_thread(upload.excerpts, question, budget)
+        source = upload.filename if used is None else f"{upload.filename}; excerpts: the {used} of {total} sections most relevant to the question"
+        return f"{label} ({source}):\n{text}\n", None
+    if upload.kind == "table":
+        profile = upload.profile()
+        file_context = format_profile(upload.filename, profile)
+        file_context += await query_uploaded_table(user_id, question, upload.filename, upload.iter_chunks, profile, use_cache)
+        return file_context, None
+
+    # Images: the preprocessed bytes go to Gemini as an inline blob, so nothing is
+    # decoded or re-encoded per question
+    try:
+        image_data = await asyncio.to_thread(upload.image_blob)
+        return f"Uploaded Image: {upload.filename} (Attached for analysis)\n", image_data
+    except Exception as img_err:
+        return f"Error reading Image: {str(img_err)}\n", None
+
+async def plan_query(user_id: str, question: str, table: str, column_types: list, use_cache: bool = True, previous: dict = None):
+    """Validated query plan from the planner model (cached per question, columns and previous plan), or None"""
+    key = cache_key(normalize_question(question), table, column_types, previous)
+    plan = plan_cache.get(key, None) if use_cache else None
+    if plan is None:
+        with span("query_plan"):
+            plan = parse_plan(await arun_ai(user_id, build_planner_messages(question, table, column_types, previous), temperature=0, provider="gemini"))
+        if not plan:
+            return None
+        plan = validate_plan(plan, [c["name"] for c in column_types])
+        plan_cache.set(key, plan)
+    return plan
+
+async def answer_stream(user_id: str, key: str, messages: list, temperature: float, image_data=None):
+    """arun_ai stream for the final answer; the full answer is cached under key once it completes"""
+    start = time.perf_counter()
+    stream_generator = await arun_ai(user_id, messages, temperature=temperature, provider="gemini", stream=True, image_data=image_data)
+    # An error string is relayed as is and not cached
+    if isinstance(stream_generator, str):
+        return stream_generator
+    return record_stream(key, instrument_stream(stream_generator, "analyze", start))
+
+def sse_response(stream_generator, file_id: str, cache_status: str, prompt_usage: dict = None, session_id: str = None):
+    from fastapi.responses import StreamingResponse
+    headers = {"X-Cache": cache_status}
+    if prompt_usage:
+        prompt_tokens.observe(prompt_usage["total"], endpoint="analyze")
+    if file_id:
+        headers["X-File-Id"] = file_id
+    if session_id:
+        headers["X-Session-Id"] = session_id
+    if prompt_usage:
+        # Estimated input tokens per prompt section, e.g. "instructions=180;data=412/2380;total=1260/6000"
+        headers["X-Prompt-Tokens"] = format_usage(prompt_usage)
+    return StreamingResponse(sse_chunks(stream_generator, file_id, session_id), media_type="text/event-stream", headers=headers)
+
+async def query_uploaded_table(user_id: str, question: str, filename: str, chunks, profile: dict, use_cache: bool = True):
+    """
+    Answer analytic questions about an uploaded table exactly: the model writes a query plan,
+    the plan runs locally over every row, and only the result table goes back into the prompt.
+    Returns extra file context, or "" when the question needs no computation.
+    """
+    column_types = [{"name": c["name"], "type": c["dtype"]} for c in profile["columns"]]
+    plan = await plan_query(user_id, question, filename, column_types, use_cache)
+    if not plan:
+        return ""
+    if not plan["aggregate"] and not plan["filters"] and not plan["order_by"]:
+        # Profile and sample already cover "describe this file" style questions
+        return ""
+
+    try:
+        result = await asyncio.to_thread(execute_local_plan, chunks(), plan)
+    except Exception as e:
+        return f"Query over the file failed ({describe_plan(plan)}): {str(e)}\n"
+    return (
+        f"Exact query result over the whole file ({describe_plan(plan)}; "
+        f"{result['matched_rows']} of {result['scanned_rows']} rows matched):\n"
+        f"{encode_rows(result['rows'])}\n"
+    )
+
+# We explicitly tell the AI to be permissive and infer intent
+DATABASE_INSTRUCTIONS = """        1. The user might have typos (e.g., "sers" instead of "users"). INFER their intent based on the available data.
+        2. Do NOT ask for clarification unless absolutely impossible to answer.
+        3. The query result was computed by the database. Counts, sums and averages in it are exact: state them directly, do not recount rows.
+        4. If the result is marked as a sample, say that any numbers are based on the sample.
+        5. The query result is a table: a header line of column names, then one line per row. "Same in every row" values apply to all rows.
+        6. Be helpful, direct, and smart."""
+
 @router.post("/analyze")
 async def analyze(
     request: Request,
@@ -41,8 +181,16 @@ async def analyze(
     table_name: str = Form("profiles"),
     mode: str = Form("database"), # 'general' or 'database'
     file: UploadFile = File(None),
-    user: Optional[object] = Depends(get_current_user_optional)
+    file_id: Optional[str] = Form(None), # content hash of an earlier upload (follow-up questions); "none" detaches it
+    session_id: Optional[str] = Form(None), # conversation to continue; omitted or unknown starts a new one
 ):
+    # Auth (then the verified user's Gemini key) and the schema catalog are independent
+    # lookups, so they run concurrently
+    lookups = [_user_with_key(request)]
+    if mode != "general":
+        lookups.append(schema_catalog.aget())
+    user, *catalog = await asyncio.gather(*lookups)
+
     # Handle both authenticated and unauthenticated users
     if user:
         user_id = user.id if not isinstance(user, dict) else user.get("id")
@@ -54,114 +202,72 @@ async def analyze(
     file_context = ""
     image_data = None
 
+    session = session_store.get_or_create(session_id, user_id)
+    # Uploads belong to the user, or to the conversation for anonymous callers
+    owner = f"user:{user_id}" if user else f"session:{session.id}"
+    if file_id == "none":
+        file_id = None
+        session.context.pop("file_id", None)
+    elif not file and not file_id and session.context.get("file_id"):
+        # Follow-up in the same conversation: keep talking about the file from earlier turns
+        file_id = session.context["file_id"]
+        if upload_cache.get(file_id, owner) is None:
+            file_id = None
+
+    upload = None
     if file:
+        # Size limit first (413); the spooled upload is then read in place, never as one bytes blob
+        fileobj, file_size = open_upload(file)
         try:
-            content = await file.read()
-            filename = file.filename.lower()
-            
-            # --- Text/Code Files ---
-            if filename.endswith(('.txt', '.md', '.py', '.js', '.html', '.css', '.json', '.xml', '.sql', '.sh')):
-                try:
-                    text_content = content.decode('utf-8')
-                    file_context = f"Uploaded File Content ({file.filename}):\n{text_content[:10000]}\n"
-                except UnicodeDecodeError:
-                    file_context = f"Uploaded File ({file.filename}) is binary or not UTF-8 encoded.\n"
-
-            # --- CSV (Lightweight, No Pandas) ---
-            elif filename.endswith('.csv'):
-                try:
-                    text_data = content.decode('utf-8')
-                    reader = csv.DictReader(io.StringIO(text_data))
-                    rows = list(reader)[:20] # Limit to 20 rows
-                    file_context = f"Uploaded CSV Data ({file.filename}):\n{json.dumps(rows, indent=2)}\n"
-                except Exception as csv_err:
-                    file_context = f"Error reading CSV: {str(csv_err)}\n"
-            
-            # --- Excel (Lightweight, No Pandas) ---
-            elif filename.endswith(('.xlsx', '.xls')):
-                try:
-                    wb = openpyxl.load_workbook(io.BytesIO(content), read_only=True, data_only=True)
-                    ws = wb.active
-                    rows = []
-                    headers = [cell.value for cell in next(ws.rows)]
-                    
-                    for row in ws.iter_rows(min_row=2, max_row=21, values_only=True):
-                        rows.append(dict(zip(headers, row)))
-                        
-                    file_context = f"Uploaded Excel Data ({file.filename}):\n{json.dumps(rows, default=str, indent=2)}\n"
-                except Exception as xl_err:
-                    file_context = f"Error reading Excel: {str(xl_err)}\n"
-
-            # --- Word Document ---
-            elif filename.endswith('.docx'):
-                try:
-                    doc = docx.Document(io.BytesIO(content))
-                    text = "\n".join([para.text for para in doc.paragraphs])
-                    file_context = f"Uploaded Word Doc Content ({file.filename}):\n{text[:5000]}\n"
-                except Exception as doc_err:
-                    file_context = f"Error reading Word Doc: {str(doc_err)}\n"
-
-            # --- PDF ---
-            elif filename.endswith('.pdf'):
-                try:
-                    pdf_reader = PyPDF2.PdfReader(io.BytesIO(content))
-                    text = ""
-                    for page in pdf_reader.pages[:5]: 
-                        text += page.extract_text() + "\n"
-                    file_context = f"Uploaded PDF Content ({file.filename}):\n{text[:5000]}\n"
-                except Exception as pdf_err:
-                    file_context = f"Error reading PDF: {str(pdf_err)}\n"
-            
-            # --- Images ---
-            elif filename.endswith(('.png', '.jpg', '.jpeg', '.webp', '.heic')):
-                try:
-                    # Open image to verify
-                    img = Image.open(io.BytesIO(content))
-                    # We pass the PIL Image object to the AI gateway
-                    image_data = img
-                    file_context = f"Uploaded Image: {file.filename} (Attached for analysis)\n"
-                except Exception as img_err:
-                    file_context = f"Error reading Image: {str(img_err)}\n"
-            
-            else:
+            # Parsing a large file can take a while; stop if the client gives up waiting
+            upload = await cancel_on_disconnect(request, ingest_upload(file.filename, fileobj, owner))
+            if upload is None:
                 file_context = f"Uploaded file type ({file.filename}) is not explicitly supported, but here is the raw info: {file.filename}\n"
-
+        except HTTPException:
+            raise
         except Exception as e:
-            file_context = f"Error reading file: {str(e)}\n"
+            file_context = f"{str(e)}\n" if isinstance(e, UploadParseError) else f"Error reading file: {str(e)}\n"
+    elif file_id:
+        # Follow-up question about an earlier upload: no bytes, no parsing
+        upload = upload_cache.get(file_id, owner)
+        if upload is None:
+            raise HTTPException(status_code=404, detail="File is no longer cached. Please upload it again.")
+
+    file_id = upload.file_id if upload else None
+    session.remember(file_id=file_id)
+    history = session.history()
+    # Repeated questions are answered from the response cache unless the client asks for a fresh answer
+    use_cache = not cache_bypassed(request)
 
     # --- GENERAL MODE ---
     if mode == "general":
+        # The answer depends only on the question and the file, so a hit skips parsing and the model
+        key = cache_key("general", normalize_question(question), file_id or file_context, fingerprint(history) if history else None)
+        cached = response_cache.get(key, None) if use_cache else None
+        if cached is not None:
+            finish_turn(session, question, cached)
+            return sse_response(replay(cached), file_id, "HIT", session_id=session.id)
+
+        if upload:
+            with span("file_context"):
+                file_context, image_data = await build_file_context(user_id, question, upload, use_cache)
+
         # Just run the AI with the file context (if any) and the question
+        prompt, usage = PromptBuilder().add("question", question, fixed=True).add("conversation", history).add("file", file_context).build()
+        conversation = f"Conversation so far:\n{prompt['conversation']}\n\n" if prompt["conversation"] else ""
         final_messages = [
-            {"role": "user", "content": f"{file_context}\n\nQuestion: {question}"}
+            {"role": "user", "content": f"{conversation}{prompt['file']}\n\nQuestion: {prompt['question']}"}
         ]
         
-        # Enable Streaming
-        from fastapi.responses import StreamingResponse
-        # Pass image_data if present
-        stream_generator = run_ai(user_id, final_messages, temperature=0.7, provider="gemini", stream=True, image_data=image_data)
-        
-        async def generate_chunks_general():
-            try:
-                if isinstance(stream_generator, str):
-                    yield f"data: {json.dumps({'chunk': stream_generator})}\n\n"
-                    yield "data: [DONE]\n\n"
-                    return
-
-                for chunk in stream_generator:
-                    if hasattr(chunk, 'text'):
-                        text = chunk.text
-                        if text: yield f"data: {json.dumps({'chunk': text})}\n\n"
-                    elif hasattr(chunk, 'choices'): 
-                        delta = chunk.choices[0].delta.content
-                        if delta: yield f"data: {json.dumps({'chunk': delta})}\n\n"
-                
-                yield "data: [DONE]\n\n"
-            except Exception as e:
-                yield f"data: {json.dumps({'chunk': f'Error: {str(e)}'})}\n\n"
-                yield "data: [DONE]\n\n"
-
-        return StreamingResponse(generate_chunks_general(), media_type="text/event-stream")
+        # Streaming; image_data is passed if present
+        stream_generator = await answer_stream(user_id, key, final_messages, 0.7, image_data)
+        if not isinstance(stream_generator, str):
+            stream_generator = record_turn(session, question, stream_generator)
+        return sse_response(stream_generator, file_id, "MISS" if use_cache else "BYPASS", usage, session.id)
+
+    if upload:
+        with span("file_context"):
+            file_context, image_data = await build_file_context(user_id, question, upload, use_cache)
 
     # --- DATABASE MODE (Default) ---
     # Step 1: Intelligent Table Selection with Fuzzy Matching
@@ -169,80 +275,54 @@ async def analyze(
     used_table = table_name 
     q_lower = question.lower()
     
-    # List of known tables - In a real app, you might fetch this dynamically from information_schema
-    possible_tables = ["subscribers", "orders", "products", "woocommerce", "users", "profiles"]
-    
-    # 1. Check for exact match first
-    found_exact = False
-    for t in possible_tables:
-        if t in q_lower:
-            used_table = t
-            found_exact = True
-            break
-            
-    # 2. If no exact match, try fuzzy matching against the question words
-    if not found_exact:
-        # We look for the "best match" table name in the question
-        # e.g. "sers" -> "users", "subs" -> "subscribers"
-        # We process the whole question against the table list
-        best_match = process.extractOne(q_lower, possible_tables, scorer=fuzz.partial_ratio)
-        
-        # If confidence is high enough (e.g., > 70%), use it
-        if best_match and best_match[1] > 70:
-             # Verify if the match is actually meaningful (length check or better scoring)
-             # Let's try a stricter extraction: extract from words
-             words = q_lower.split()
-             best_word_match = process.extractOne(used_table, words, scorer=fuzz.ratio)
-             
-             # If the user typed "sers", fuzz.ratio("sers", "users") is high.
-             # We want to find which table name is closest to ANY word in the input.
-             
-             highest_score = 0
-             best_table = used_table
-             
-             for t in possible_tables:
-                 # Check similarity of this table to any word in the question
-                 match = process.extractOne(t, words, scorer=fuzz.ratio)
-                 if match and match[1] > highest_score:
-                     highest_score = match[1]
-                     best_table = t
-            
-             if highest_score > 60: # Threshold for "probably meant this table"
-                 used_table = best_table
-
-    # Verify existence of the chosen table (Robust check)
-    try:
-        supabase.table(used_table).select("*").limit(1).execute()
-    except:
-        # If the guessed table doesn't exist, fall back to 'profiles' or just proceed and let it fail gracefully
-        pass
+    # Known tables come from the cached schema catalog (introspected once, not per request; fetched above)
+    catalog = catalog[0]
+
+    # Ranked candidates from table names, column names and synonyms ("subs" -> subscribers)
+    with span("table_routing"):
+        candidates = get_routing_index(catalog).route(q_lower)
 
-    # Step 2: AI-Driven Query Generation (Natural Language -> Supabase Filter)
+    # 1.0 is an exact table/synonym hit; >= 0.6 is "probably meant this table" (typos, prefixes)
+    if candidates and candidates[0][1] >= 0.6:
+        used_table = candidates[0][0]
+    elif session.context.get("table"):
+        # No table named: a follow-up ("and last month?") stays on the previous turn's table
+        used_table = session.context["table"]
+    # Allowlist: only tables in the catalog (which already leaves out SCHEMA_EXCLUDE_TABLES)
+    if used_table not in catalog:
+        raise HTTPException(status_code=403, detail=f"Table '{used_table}' is not available to Chat with Data")
+
+    # Step 2: AI-Driven Query Generation (Natural Language -> structured query plan)
+    # Counts, sums and group-bys run in Postgres; only the small result goes to the model.
     filter_instruction = ""
     db_context = "[]"
+    db_rows = None
+    column_types = catalog.get(used_table, [])
+    columns = [c["name"] for c in column_types]
     
+    previous = None
+    if session.context.get("table") == used_table and session.context.get("plan"):
+        previous = {"question": session.context["question"], "plan": session.context["plan"]}
+
     try:
-        # Fetch 1 row to get column names for context
-        schema_sample = supabase.table(used_table).select("*").limit(1).execute()
-        columns = list(schema_sample.data[0].keys()) if schema_sample.data else []
-        
-        query_builder = supabase.table(used_table).select("*")
-        
-        # Fuzzy Filter Logic: Check if "active" or similar words are in the query
-        # This is a basic example. For true robustness, we'd feed schema to AI and ask for SQL/JSON filter.
-        # But here we stick to Python logic for speed.
-        
-        if "status" in columns:
-            # Check for 'active'
-            if fuzz.partial_ratio("active", q_lower) > 80:
-                 query_builder = query_builder.eq("status", "active")
-                 filter_instruction += "(Filtered by status='active')"
-        
-        # Limit to 50 for context window safety
-        data_res = query_builder.limit(50).execute()
-        db_context = json.dumps(data_res.data)
+        plan = None
+        if columns:
+            plan = await plan_query(user_id, question, used_table, column_types, use_cache, previous)
+        plan = plan or heuristic_plan(question, columns)
+        filter_instruction = f"(Query: {describe_plan(plan)})"
+
+        # A rephrased follow-up that resolves to the same plan reuses the rows just fetched
+        result = session.recent_result(used_table, plan) if use_cache else None
+        if result is None:
+            with span("db_fetch"):
+                result = await execute_plan(used_table, plan)
+            session.remember(table=used_table, question=question, plan=plan, result=result, rows_at=time.monotonic())
+        db_rows = result["rows"]
+        if not result["exact"]:
+            filter_instruction += " (Aggregate could not run in the database; this is a sample of at most 50 rows, not the full table)"
         
-        if len(data_res.data) == 0:
+        if len(result["rows"]) == 0:
+             db_rows = None
              db_context = f"No data found in table '{used_table}' {filter_instruction}. The database might be empty or no matching records."
              
     except Exception as e:
@@ -250,6 +330,8 @@ async def analyze(
         
         # Enhanced Error Handling for Schema Cache Issues
         if "PGRST205" in str(e):
+            # Our catalog may be stale too; re-read it so the next question routes correctly
+            await schema_catalog.refresh()
             db_context = (
                 f"⚠️ **CRITICAL ERROR: Table '{used_table}' exists but is not visible to the API.**\n\n"
                 f"**CAUSE:** The Supabase Schema Cache is outdated.\n"
@@ -260,60 +342,49 @@ async def analyze(
                 f"(Original Error: {str(e)})"
             )
 
+    # The query result is the data-version fingerprint: once a row that matters changes,
+    # the result and therefore the key change, so cached answers never go stale.
+    key = cache_key("database", normalize_question(question), used_table, fingerprint(db_rows if db_rows is not None else db_context), file_id or file_context, fingerprint(history) if history else None)
+    cached = response_cache.get(key, None) if use_cache else None
+    if cached is not None:
+        finish_turn(session, question, cached, table=used_table)
+        return sse_response(replay(cached), file_id, "HIT", session_id=session.id)
+
     # Construct Prompt
-    # We explicitly tell the AI to be permissive and infer intent
+    # Sections share the token budget; rows go in as a compact table (header once), not JSON
+    prompt, usage = (
+        PromptBuilder()
+        .add("instructions", DATABASE_INSTRUCTIONS, fixed=True)
+        .add("question", question, fixed=True)
+        .add("schema", ", ".join(f"{c['name']} ({c['type']})" for c in column_types) or "Unknown")
+        .add("data", (lambda limit: encode_rows(db_rows, limit)) if db_rows is not None else db_context, weight=3)
+        .add("file", file_context, weight=2)
+        .add("conversation", history)
+        .build()
+    )
     final_messages = [
         {"role": "user", "content": f"""
         CONTEXT:
         - Table: {used_table}
-        - Schema Columns: {columns if 'columns' in locals() else 'Unknown'}
-        - Database Data Sample: {db_context}
-        - File Content: {file_context}
+        - Schema Columns: {prompt['schema']}
+        - Database Query: {filter_instruction or 'None'}
+        - Database Query Result:
+{prompt['data']}
+        - File Content: {prompt['file']}
+        - Conversation So Far:
+{prompt['conversation'] or 'None'}
         
-        USER QUESTION: "{question}"
+        USER QUESTION: "{prompt['question']}"
         
         INSTRUCTIONS:
-        1. The user might have typos (e.g., "sers" instead of "users"). INFER their intent based on the available data.
-        2. Do NOT ask for clarification unless absolutely impossible to answer.
-        3. If the data provides a clear answer (e.g., a count), state it directly.
-        4. If the user asks for "active subscribers" and you see "status: active" in the data, count them and answer.
-        5. Be helpful, direct, and smart.
+{prompt['instructions']}
         """}
     ]
     
     # Run AI
-    from fastapi.responses import StreamingResponse
-    
-    # We need to adapt the run_ai to support streaming or wrap it
-    # Since run_ai returns text or a generator, we need to handle both.
-    # Let's request streaming from run_ai
-    
+    # arun_ai returns either an error string or an async text stream; sse_chunks handles both.
     # Pass image_data here as well
-    stream_generator = run_ai(user_id, final_messages, temperature=0.5, provider="gemini", stream=True, image_data=image_data)
-    
-    async def generate_chunks():
-        try:
-            # Check if it's a string (error message)
-            if isinstance(stream_generator, str):
-                yield f"data: {json.dumps({'chunk': stream_generator})}\n\n"
-                yield "data: [DONE]\n\n"
-                return
-
-            # Gemini Stream
-            for chunk in stream_generator:
-                if hasattr(chunk, 'text'):
-                    text = chunk.text
-                    if text:
-                        yield f"data: {json.dumps({'chunk': text})}\n\n"
-                elif hasattr(chunk, 'choices'): # OpenAI Stream
-                    delta = chunk.choices[0].delta.content
-                    if delta:
-                        yield f"data: {json.dumps({'chunk': delta})}\n\n"
-                        
-            yield "data: [DONE]\n\n"
-            
-        except Exception as e:
-            yield f"data: {json.dumps({'chunk': f'Error: {str(e)}'})}\n\n"
-            yield "data: [DONE]\n\n"
-
-    return StreamingResponse(generate_chunks(), media_type="text/event-stream")
+    stream_generator = await answer_stream(user_id, key, final_messages, 0.5, image_data)
+    if not isinstance(stream_generator, str):
+        stream_generator = record_turn(session, question, stream_generator, table=used_table)
+    return sse_response(stream_generator, file_id, "MISS" if use_cache else "BYPASS", usage, session.id)
@@ -0,0 +1,141 @@
+import asyncio
+import inspect
+import io
+import os
+import shutil
+from core.config_manager import config
+from core.lazy_imports import lazy_import
+from backend.parsing.images import preprocess_image, heic_supported, HEIC_EXTENSIONS
+from backend.parsing.pdf import extract_pdf_file, PDF_TIME_BUDGET
+from backend.parsing.pool import run_job, CheckedFile, ParseCancelled
+from backend.parsing.tabular import profile_csv, profile_excel, iter_csv_chunks, iter_excel_chunks
+from backend.parsing.upload_cache import upload_cache, write_text, write_table, write_image
+
+docx = lazy_import("docx")
+
+# Upload formats. Each handler parses an upload into an upload-cache staging dir inside
+# the parser pool (backend/parsing/pool.py; processes, or threads on serverless), so a 50 MB workbook occupies one
+# parser worker instead of the event loop every request shares. Handlers have their own
+# timeout; a timed-out or abandoned (client disconnected) parse is cancelled.
+#
+# Worker handlers are plain functions handler(token, src_path, dest_dir, filename) that
+# run in a pool worker, read the upload through CheckedFile(src_path, token) and
+# return extra meta for the entry (or None). Async handlers (PDF, which fans pages out
+# over the pool itself) are called as handler(src_path, dest_dir, filename) in-process.
+TEXT_EXTENSIONS = ('.txt', '.md', '.py', '.js', '.html', '.css', '.json', '.xml', '.sql', '.sh')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.heic', '.heif')
+
+class UploadParseError(Exception):
+    """Upload could not be parsed; the message is shown to the model as file context"""
+
+class FormatHandler:
+    def __init__(self, kind: str, extensions: tuple, label: str, timeout: float, parse):
+        self.kind = kind  # upload cache kind (see DOCUMENT_BUDGETS in chat_with_data)
+        self.extensions = extensions
+        self.label = label
+        self.timeout = timeout
+        self.parse = parse
+        self.is_async = inspect.iscoroutinefunction(parse)
+
+FORMAT_HANDLERS = []
+
+def register_format(kind: str, extensions: tuple, label: str, timeout: float):
+    def decorator(parse):
+        FORMAT_HANDLERS.append(FormatHandler(kind, extensions, label, timeout, parse))
+        return parse
+    return decorator
+
+def find_format(filename: str):
+    name = filename.lower()
+    return next((h for h in FORMAT_HANDLERS if name.endswith(h.extensions)), None)
+
+def _timeout(kind: str, default: str):
+    return float(config.get(f"PARSE_TIMEOUT_{kind.upper()}", default))
+
+def _iter_utf8(fileobj, chunk_chars: int = 1024 * 1024):
+    text_stream = io.TextIOWrapper(fileobj, encoding='utf-8')
+    try:
+        for part in iter(lambda: text_stream.read(chunk_chars), ""):
+            yield part
+    finally:
+        text_stream.detach()
+
+@register_format("text", TEXT_EXTENSIONS, "Text File", _timeout("text", "15"))
+def parse_text(token, src: str, dest: str, filename: str):
+    with CheckedFile(src, token) as f:
+        try:
+            write_text(dest, _iter_utf8(f))
+        except UnicodeDecodeError:
+            raise UploadParseError(f"Uploaded File ({filename}) is binary or not UTF-8 encoded.")
+
+# --- CSV / Excel: whole-file column profile, stored as Parquet ---
+@register_format("table", ('.csv',), "CSV", _timeout("table", "60"))
+def parse_csv(token, src: str, dest: str, filename: str):
+    with CheckedFile(src, token) as f:
+        write_table(dest, iter_csv_chunks(f), profile_csv(f))
+
+@register_format("table", ('.xlsx', '.xls'), "Excel", _timeout("table", "60"))
+def parse_excel(token, src: str, dest: str, filename: str):
+    with CheckedFile(src, token) as f:
+        write_table(dest, iter_excel_chunks(f), profile_excel(f))
+
+@register_format("word", ('.docx',), "Word Doc", _timeout("word", "30"))
+def parse_docx(token, src: str, dest: str, filename: str):
+    with CheckedFile(src, token) as f:
+        doc = docx.Document(f)
+    paragraphs = []
+    for para in doc.paragraphs:
+        paragraphs.append(para.text)
+        if len(paragraphs) % 1000 == 0:
+            token.check()
+    write_text(dest, "\n".join(paragraphs))
+
+def _write_text_job(token, dest: str, text: str):
+    write_text(dest, text)
+
+# All pages, extracted in parallel over the pool within PDF_TIME_BUDGET (a partial text
+# notes where it stopped); the timeout only guards against a stuck worker
+@register_format("pdf", ('.pdf',), "PDF", _timeout("pdf", str(PDF_TIME_BUDGET + 15)))
+async def parse_pdf(src: str, dest: str, filename: str):
+    text = await extract_pdf_file(src)
+    # Chunk indexing is CPU work too
+    await run_job(_write_text_job, dest, dest, text, timeout=_timeout("text", "15"))
+
+# --- Images: oriented, downscaled and re-encoded once; questions reuse the result ---
+@register_format("image", IMAGE_EXTENSIONS, "Image", _timeout("image", "20"))
+def parse_image(token, src: str, dest: str, filename: str):
+    if filename.lower().endswith(HEIC_EXTENSIONS) and not heic_supported():
+        raise UploadParseError(f"HEIC images ({filename}) are not supported on this server. Please upload a JPEG or PNG.")
+    with CheckedFile(src, token) as f:
+        data, mime, info = preprocess_image(f)
+    write_image(dest, data)
+    return {"mime": mime, **info}
+
+def _copy_upload(fileobj, path: str):
+    fileobj.seek(0)
+    with open(path, "wb") as f:
+        shutil.copyfileobj(fileobj, f)
+
+async def parse_upload(handler: FormatHandler, file_id: str, owner: str, filename: str, fileobj):
+    """
+    Parse an upload with its format handler and store the result in the upload cache.
+    Raises UploadParseError (including on timeout); cancelling the caller cancels the parse.
+    """
+    staging = upload_cache.staging_dir()
+    try:
+        # Workers need a path: the spooled upload is copied next to the entry being built
+        src = os.path.join(staging, ".upload")
+        await asyncio.to_thread(_copy_upload, fileobj, src)
+        if handler.is_async:
+            meta = await asyncio.wait_for(handler.parse(src, staging, filename), handler.timeout)
+        else:
+            meta = await run_job(handler.parse, staging, src, staging, filename, timeout=handler.timeout)
+        os.remove(src)
+    except BaseException as e:
+        shutil.rmtree(staging, ignore_errors=True)
+        if isinstance(e, (asyncio.TimeoutError, ParseCancelled)):
+            raise UploadParseError(f"Reading the {handler.label} ({filename}) took longer than {handler.timeout:.0f} seconds. Try a smaller file.")
+        if isinstance(e, Exception) and not isinstance(e, UploadParseError):
+            raise UploadParseError(f"Error reading {handler.label}: {str(e)}")
+        raise
+    return await asyncio.to_thread(upload_cache.commit, file_id, owner, filename, handler.kind, staging, meta)
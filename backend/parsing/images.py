@@ -0,0 +1,55 @@
+import io
+from core.config_manager import config
+from core.lazy_imports import lazy_import
+
+Image = lazy_import("PIL.Image")
+ImageOps = lazy_import("PIL.ImageOps")
+
+# Uploaded images are normalized once, at upload time, and the result is what the upload
+# cache stores and every question sends: EXIF orientation applied, longest side at most
+# IMAGE_MAX_SIDE pixels (Gemini tiles images at 768 px, so more resolution only costs
+# upload time), re-encoded as JPEG (WebP when there is transparency) with all metadata
+# (EXIF, GPS, ICC) dropped.
+IMAGE_MAX_SIDE = int(config.get("IMAGE_MAX_SIDE", "1536"))
+IMAGE_QUALITY = int(config.get("IMAGE_QUALITY", "85"))
+
+HEIC_EXTENSIONS = ('.heic', '.heif')
+_heic_supported = None
+
+def heic_supported():
+    """Whether HEIC/HEIF (iPhone photos) can be decoded; registers the pillow-heif opener on first call"""
+    global _heic_supported
+    if _heic_supported is None:
+        try:
+            from pillow_heif import register_heif_opener
+            register_heif_opener()
+            _heic_supported = True
+        except ImportError:
+            _heic_supported = False
+    return _heic_supported
+
+def _has_alpha(img):
+    return img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+
+def preprocess_image(fileobj, max_side: int = IMAGE_MAX_SIDE, quality: int = IMAGE_QUALITY):
+    """
+    Decode, orient, downscale and re-encode an image. Blocking; run it in a thread.
+    Returns (bytes, mime type, info) where info has the original and final sizes.
+    """
+    heic_supported()
+    fileobj.seek(0)
+    img = Image.open(fileobj)
+    original_size = img.size
+    # JPEG can decode at 1/2, 1/4 or 1/8 scale directly, much faster than a full decode plus resize
+    img.draft("RGB", (max_side, max_side))
+    img = ImageOps.exif_transpose(img)
+    img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    out = io.BytesIO()
+    if _has_alpha(img):
+        img.convert("RGBA").save(out, format="WEBP", quality=quality, method=4)
+        mime = "image/webp"
+    else:
+        img.convert("RGB").save(out, format="JPEG", quality=quality, optimize=True)
+        mime = "image/jpeg"
+    return out.getvalue(), mime, {"original_size": list(original_size), "size": list(img.size)}
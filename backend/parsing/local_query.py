@@ -0,0 +1,144 @@
+import re
+from core.lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
+
+# Executes a validated query plan (see core/query_plan.py) over an uploaded table, one
+# chunk at a time. Filters are vectorized per chunk, aggregates are merged as partial
+# (sum, count, min, max) states and top-n keeps only the best rows seen so far, so the
+# result is exact over the whole file while memory stays bounded by the chunk size.
+
+def _coerce(series: "pd.Series", value: str):
+    if pd.api.types.is_bool_dtype(series):
+        return value.lower() in ("true", "1", "yes")
+    if pd.api.types.is_numeric_dtype(series):
+        return pd.to_numeric(value, errors="coerce")
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return pd.to_datetime(value, errors="coerce")
+    return value
+
+def _like_regex(pattern: str):
+    # SQL LIKE: % is any run of characters, _ is one character
+    return "".join(".*" if ch == "%" else "." if ch == "_" else re.escape(ch) for ch in pattern)
+
+def _mask(chunk: "pd.DataFrame", f: dict):
+    series = chunk[f["column"]]
+    op, value = f["op"], f["value"]
+    if op == "is":
+        if value.lower() in ("null", "none"):
+            return series.isna()
+        return series == (value.lower() == "true")
+    if op == "ilike":
+        return series.astype(str).str.fullmatch(_like_regex(value), case=False, na=False)
+
+    target = _coerce(series, value)
+    if op == "eq":
+        return series == target
+    if op == "neq":
+        return series != target
+    if op == "gt":
+        return series > target
+    if op == "gte":
+        return series >= target
+    if op == "lt":
+        return series < target
+    return series <= target
+
+def _filter(chunk: "pd.DataFrame", filters: list):
+    for f in filters:
+        if chunk.empty:
+            break
+        chunk = chunk[_mask(chunk, f)]
+    return chunk
+
+def _numeric(series: "pd.Series"):
+    return series if pd.api.types.is_numeric_dtype(series) else pd.to_numeric(series, errors="coerce")
+
+# Partial state columns per function, and how partial states are merged
+_STATE = {"count": ["count"], "sum": ["sum"], "avg": ["sum", "count"], "min": ["min"], "max": ["max"]}
+_MERGE = {"count": "sum", "sum": "sum", "min": "min", "max": "max"}
+
+def _partial_aggregate(chunk: "pd.DataFrame", agg: dict, group_by: list):
+    func = agg["func"]
+    if func == "count":
+        values = pd.Series(1, index=chunk.index)
+    elif func in ("sum", "avg"):
+        values = _numeric(chunk[agg["column"]])
+    else:
+        values = chunk[agg["column"]]
+
+    # Without group_by everything falls into one constant group, so both cases share a path
+    keys = [chunk[c] for c in group_by] if group_by else [pd.Series(0, index=chunk.index)]
+    grouped = values.groupby(keys, dropna=False)
+    ops = {
+        "count": grouped.size if func == "count" else grouped.count,
+        "sum": lambda: grouped.sum(min_count=1),
+        "min": grouped.min,
+        "max": grouped.max,
+    }
+    return pd.DataFrame({name: ops[name]() for name in _STATE[func]})
+
+def _merge_partials(state, partial: "pd.DataFrame"):
+    if state is None:
+        return partial
+    combined = pd.concat([state, partial])
+    return combined.groupby(level=list(range(combined.index.nlevels)), dropna=False).agg({name: _MERGE[name] for name in combined.columns})
+
+def _finalize(state: "pd.DataFrame", agg: dict, group_by: list, plan: dict):
+    func = agg["func"]
+    if func == "avg":
+        value = state["sum"] / state["count"]
+    else:
+        value = state[func]
+
+    if not group_by:
+        return [{f"{func}({agg['column'] or '*'})": _plain(value.iloc[0])}]
+
+    result = value.rename("value").reset_index()
+    result.columns = list(group_by) + ["value"]
+    desc = plan["order_by"]["desc"] if plan["order_by"] else True
+    result = result.sort_values("value", ascending=not desc, na_position="last").head(plan["limit"])
+    return _records(result)
+
+def _records(df: "pd.DataFrame"):
+    return [{k: _plain(v) for k, v in row.items()} for row in df.to_dict(orient="records")]
+
+def _plain(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    return value.item() if hasattr(value, "item") else value
+
+def execute_local_plan(chunks, plan: dict):
+    """
+    Run a validated plan over an iterable of DataFrame chunks.
+    Returns {"rows": [...], "matched_rows": int, "scanned_rows": int}.
+    """
+    agg = plan["aggregate"]
+    order = plan["order_by"]
+    state = None
+    kept = []
+    scanned = matched = 0
+
+    for chunk in chunks:
+        scanned += len(chunk)
+        chunk = _filter(chunk, plan["filters"])
+        matched += len(chunk)
+        if chunk.empty:
+            continue
+
+        if agg:
+            state = _merge_partials(state, _partial_aggregate(chunk, agg, plan["group_by"]))
+        elif order:
+            # Keep only the current top-n rows
+            combined = pd.concat(kept + [chunk]) if kept else chunk
+            kept = [combined.sort_values(order["column"], ascending=not order["desc"], na_position="last").head(plan["limit"])]
+        elif sum(len(k) for k in kept) < plan["limit"]:
+            kept.append(chunk)
+
+    if agg:
+        if state is None:
+            return {"rows": [] if plan["group_by"] else [{f"{agg['func']}({agg['column'] or '*'})": 0 if agg["func"] == "count" else None}], "matched_rows": 0, "scanned_rows": scanned}
+        return {"rows": _finalize(state, agg, plan["group_by"], plan), "matched_rows": matched, "scanned_rows": scanned}
+
+    rows = pd.concat(kept).head(plan["limit"]) if kept else pd.DataFrame()
+    return {"rows": _records(rows), "matched_rows": matched, "scanned_rows": scanned}
@@ -0,0 +1,85 @@
+import asyncio
+import math
+import tempfile
+import time
+from core.config_manager import config
+from core.lazy_imports import lazy_import
+from backend.parsing import pool
+from backend.parsing.pool import run_job
+
+PyPDF2 = lazy_import("PyPDF2")
+
+PDF_TIME_BUDGET = float(config.get("PDF_TIME_BUDGET", "20"))
+# Small documents are not worth splitting; one worker extracts them
+PDF_PARALLEL_MIN_PAGES = int(config.get("PDF_PARALLEL_MIN_PAGES", "16"))
+
+def _extract_range(token, path: str, start: int, end: int):
+    """Worker: text of pages [start, end), checking the job's cancel token between pages"""
+    reader = PyPDF2.PdfReader(path)
+    pages = []
+    for i in range(start, end):
+        token.check()
+        pages.append(reader.pages[i].extract_text() or "")
+    return "\n".join(pages)
+
+def _count_pages(token, path: str):
+    return len(PyPDF2.PdfReader(path).pages)
+
+def _page_ranges(page_count: int, workers: int):
+    # ~2 ranges per worker keeps cores busy when some pages are slower than others
+    size = max(1, math.ceil(page_count / (workers * 2)))
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+async def iter_pdf_file(path: str, time_budget: float = PDF_TIME_BUDGET, workers: int = None):
+    """
+    Extract every page, yielding (start_page, end_page, text) in page order.
+    Page ranges are parser pool jobs (run_job: they only enter the pool when a worker
+    is free). Once the time budget is spent, or the caller goes away, the remaining
+    ranges are cancelled and their workers stop at the next page; a final
+    (start, end, None) marks the cut-off.
+    """
+    deadline = time.monotonic() + time_budget
+    workers = workers or pool.PARSER_WORKERS
+    # Cancel markers of this extraction's jobs
+    with tempfile.TemporaryDirectory() as workdir:
+        page_count = await run_job(_count_pages, workdir, path, timeout=time_budget)
+
+        if page_count < PDF_PARALLEL_MIN_PAGES or workers <= 1:
+            remaining = max(0.1, deadline - time.monotonic())
+            text = await run_job(_extract_range, workdir, path, 0, page_count, timeout=remaining)
+            yield 0, page_count, text
+            return
+
+        ranges = _page_ranges(page_count, workers)
+        jobs = [asyncio.ensure_future(run_job(_extract_range, workdir, path, start, end, timeout=time_budget)) for start, end in ranges]
+        try:
+            # Awaiting in submission order streams results in page order
+            for (start, end), job in zip(ranges, jobs):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    yield start, page_count, None
+                    return
+                try:
+                    text = await asyncio.wait_for(asyncio.shield(job), remaining)
+                except asyncio.TimeoutError:
+                    yield start, page_count, None
+                    return
+                yield start, end, text
+        finally:
+            for job in jobs:
+                job.cancel()
+            # Let the jobs mark their tokens cancelled before the work dir goes away
+            await asyncio.gather(*jobs, return_exceptions=True)
+
+async def _join_pages(pages):
+    parts = []
+    async for start, end, text in pages:
+        if text is None:
+            parts.append(f"[Extraction stopped at page {start + 1} of {end}: time budget exceeded]")
+            break
+        parts.append(text)
+    return "\n".join(parts)
+
+async def extract_pdf_file(path: str, time_budget: float = PDF_TIME_BUDGET):
+    """Full document text; notes where extraction stopped if the time budget ran out"""
+    return await _join_pages(iter_pdf_file(path, time_budget))
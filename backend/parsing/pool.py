@@ -0,0 +1,129 @@
+import asyncio
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from core.config_manager import config
+
+# One parser pool per worker process, created on first use so plain text
+# requests (and cold starts) never pay for spawning it.
+PARSER_WORKERS = int(config.get("PARSER_WORKERS", str(os.cpu_count() or 1)))
+
+# "process" keeps CPU-heavy parsing off the event loop's core; "thread" is the default
+# on serverless runtimes (Vercel functions run on AWS Lambda), which cannot create the
+# shared-memory locks a process pool needs
+SERVERLESS = bool(config.get("VERCEL") or config.get("AWS_LAMBDA_FUNCTION_NAME"))
+PARSER_EXECUTOR = config.get("PARSER_EXECUTOR", "thread" if SERVERLESS else "process")
+
+_executor = None
+
+def get_process_pool():
+    global _executor
+    if _executor is None and PARSER_EXECUTOR == "thread":
+        _executor = ThreadPoolExecutor(max_workers=PARSER_WORKERS)
+    if _executor is None:
+        try:
+            _executor = ProcessPoolExecutor(max_workers=PARSER_WORKERS)
+        except (OSError, NotImplementedError) as e:
+            # Serverless runtimes (Vercel / AWS Lambda) have no /dev/shm, so multiprocessing
+            # locks cannot be created there; parse in threads instead
+            print(f"Process pool unavailable ({e}); parsing in threads")
+            _executor = ThreadPoolExecutor(max_workers=PARSER_WORKERS)
+    return _executor
+
+def configure(workers: int = None, executor: str = None):
+    """Change the worker count or executor kind; the pool and job slots are rebuilt on next use"""
+    global PARSER_WORKERS, PARSER_EXECUTOR, _executor
+    PARSER_WORKERS = workers or PARSER_WORKERS
+    PARSER_EXECUTOR = executor or PARSER_EXECUTOR
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+class ParseCancelled(Exception):
+    """A parser job passed its deadline or its request went away"""
+
+class CancelToken:
+    """
+    Cancellation that works across processes: a deadline plus a marker file the request
+    side creates. A running job cannot be interrupted from outside without breaking the
+    pool, so jobs call check() as they go and stop at the next call.
+    """
+
+    def __init__(self, marker: str, deadline: float):
+        self.marker = marker
+        self.deadline = deadline
+
+    def cancel(self):
+        try:
+            open(self.marker, "w").close()
+        except OSError:
+            # Work dir already removed; the deadline still stops the job
+            pass
+
+    def check(self):
+        if time.time() > self.deadline or os.path.exists(self.marker):
+            raise ParseCancelled()
+
+class CheckedFile(io.FileIO):
+    """File that checks a CancelToken on every read, so any parser reading it is cancellable"""
+
+    def __init__(self, path: str, token: CancelToken):
+        super().__init__(path, "rb")
+        self.token = token
+
+    def read(self, size=-1):
+        self.token.check()
+        return super().read(size)
+
+    def readinto(self, buffer):
+        self.token.check()
+        return super().readinto(buffer)
+
+# Jobs only enter the pool when a worker is free; until then they wait here, where
+# cancelling them costs nothing
+_slots = None
+_slots_loop = None
+_slots_size = 0
+job_stats = {"completed": 0, "failed": 0, "timed_out": 0, "cancelled": 0}
+
+def _job_slots():
+    global _slots, _slots_loop, _slots_size
+    loop = asyncio.get_running_loop()
+    # Sized from the current worker count, so configure() takes effect on the same loop
+    if _slots_loop is not loop or _slots_size != PARSER_WORKERS:
+        _slots, _slots_loop, _slots_size = asyncio.Semaphore(PARSER_WORKERS), loop, PARSER_WORKERS
+    return _slots
+
+async def run_job(fn, workdir: str, *args, timeout: float):
+    """
+    Run fn(token, *args) in the process pool once a worker is free, for at most timeout
+    seconds. On timeout or cancellation (client disconnect) the job's token is cancelled
+    so the worker stops at its next check. workdir holds the token's marker file.
+    """
+    async with _job_slots():
+        token = CancelToken(os.path.join(workdir, ".cancel"), time.time() + timeout)
+        future = asyncio.get_running_loop().run_in_executor(get_process_pool(), fn, token, *args)
+        try:
+            result = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            token.cancel()
+            job_stats["timed_out"] += 1
+            raise
+        except ParseCancelled:
+            # Hit its own deadline a moment before ours
+            job_stats["timed_out"] += 1
+            raise asyncio.TimeoutError()
+        except asyncio.CancelledError:
+            token.cancel()
+            job_stats["cancelled"] += 1
+            raise
+        except Exception:
+            job_stats["failed"] += 1
+            raise
+        job_stats["completed"] += 1
+        return result
+
+def pool_stats():
+    executor = "thread" if isinstance(_executor, ThreadPoolExecutor) else PARSER_EXECUTOR
+    return {"workers": PARSER_WORKERS, "executor": executor, "started": _executor is not None, "jobs": dict(job_stats)}
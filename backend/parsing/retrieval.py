@@ -0,0 +1,129 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+from core.config_manager import config
+
+# Lexical retrieval over uploaded documents. Extracted text is split into overlapping
+# chunks and indexed once with BM25 (postings stored next to the text in the upload
+# cache); each question then pulls only its best chunks into the prompt, so long
+# documents are answerable past the first pages while the prompt size stays fixed.
+CHUNK_CHARS = int(config.get("RETRIEVAL_CHUNK_CHARS", "1500"))
+CHUNK_OVERLAP = int(config.get("RETRIEVAL_CHUNK_OVERLAP", "200"))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "been", "but", "by", "can", "do", "does", "did", "for",
+    "from", "has", "have", "how", "i", "in", "is", "it", "its", "me", "my", "of", "on", "or", "so",
+    "that", "the", "their", "them", "there", "these", "they", "this", "those", "to", "was", "we",
+    "were", "what", "when", "where", "which", "who", "why", "will", "with", "you", "your",
+}
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+def tokenize(text: str):
+    """Lowercase word tokens without stopwords; a trailing plural 's' is dropped"""
+    tokens = []
+    for word in _WORD.findall(text.lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+def iter_chunks(text_stream, chunk_chars: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP):
+    """
+    Split a text file object into chunks of about chunk_chars, preferring paragraph and
+    line breaks, with `overlap` characters repeated so no sentence is lost at a boundary.
+    Yields (byte offset in the UTF-8 text, text).
+    """
+    buffer = ""
+    offset = 0
+    while True:
+        block = text_stream.read(chunk_chars * 4)
+        buffer += block
+        while len(buffer) >= chunk_chars or (not block and buffer):
+            if len(buffer) <= chunk_chars:
+                cut = len(buffer)
+            else:
+                window = buffer[:chunk_chars]
+                cut = max(window.rfind("\n\n"), window.rfind("\n"), window.rfind(". "))
+                if cut < chunk_chars // 2:
+                    cut = window.rfind(" ")
+                cut = cut + 1 if cut >= chunk_chars // 2 else chunk_chars
+            yield offset, buffer[:cut]
+            if cut >= len(buffer):
+                return
+            step = max(cut - overlap, 1)
+            offset += len(buffer[:step].encode("utf-8"))
+            buffer = buffer[step:]
+        if not block:
+            return
+
+class DocumentIndex:
+    """BM25 over the chunks of one document"""
+
+    def __init__(self, chunks: list, lengths: list, postings: dict):
+        self.chunks = chunks      # [byte offset, byte length] into the UTF-8 document text
+        self.lengths = lengths    # tokens per chunk
+        self.postings = postings  # term -> [[chunk, term frequency], ...]
+        self.avg_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+
+    @classmethod
+    def build(cls, text_stream):
+        chunks, lengths, postings = [], [], {}
+        for i, (offset, text) in enumerate(iter_chunks(text_stream)):
+            counts = Counter(tokenize(text))
+            chunks.append([offset, len(text.encode("utf-8"))])
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append([i, tf])
+        return cls(chunks, lengths, postings)
+
+    def save(self, path: str):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"chunks": self.chunks, "lengths": self.lengths, "postings": self.postings}, f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["chunks"], data["lengths"], data["postings"])
+
+    def search(self, question: str, limit: int = None):
+        """Chunk numbers ranked by BM25 score (best first); only chunks sharing a term with the question"""
+        n = len(self.chunks)
+        scores = Counter()
+        for term in set(tokenize(question)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk, tf in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[chunk] / (self.avg_length or 1))
+                scores[chunk] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return [chunk for chunk, _ in scores.most_common(limit)]
+
+def select_chunks(index: DocumentIndex, question: str, budget_chars: int):
+    """
+    Best chunks for the question that fit in budget_chars (measured in bytes, so never
+    over), returned in document order.
+    With no matching terms ("summarize this") the opening chunks are used.
+    """
+    ranked = index.search(question) or list(range(len(index.chunks)))
+    chosen, used = [], 0
+    for chunk in ranked:
+        length = index.chunks[chunk][1]
+        if used + length > budget_chars:
+            if used:
+                break
+            continue
+        chosen.append(chunk)
+        used += length
+    return sorted(chosen)
@@ -0,0 +1,161 @@
+import itertools
+import json
+from collections import Counter
+from core.config_manager import config
+from core.lazy_imports import lazy_import
+from core.prompt_builder import encode_rows
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+openpyxl = lazy_import("openpyxl")
+
+# Whole-file profiling for uploaded spreadsheets. The file is read in chunks and every
+# statistic is merged chunk by chunk, so memory stays bounded whatever the row count.
+PROFILE_CHUNK_ROWS = int(config.get("PROFILE_CHUNK_ROWS", "50000"))
+TOP_K = 5
+SAMPLE_ROWS = 10
+# Bounds for the per-column frequency table and distinct-count sketch
+MAX_TRACKED_VALUES = 1000
+SKETCH_SIZE = 1024
+
+class ColumnStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.dtypes = set()
+        self.count = 0
+        self.nulls = 0
+        self.min = None
+        self.max = None
+        self.sum = 0.0
+        self.numeric_count = 0
+        self.top = Counter()
+        self._hashes = np.array([], dtype=np.uint64)
+
+    def update(self, series: "pd.Series"):
+        self.count += len(series)
+        self.nulls += int(series.isna().sum())
+        values = series.dropna()
+        if values.empty:
+            return
+
+        self.dtypes.add(str(values.dtype) if values.dtype != object else pd.api.types.infer_dtype(values, skipna=True))
+
+        numeric = pd.to_numeric(values, errors="coerce") if values.dtype == object else values
+        if pd.api.types.is_numeric_dtype(numeric) and not pd.api.types.is_bool_dtype(numeric):
+            numeric = numeric.dropna()
+            if not numeric.empty:
+                self.min = numeric.min() if self.min is None else min(self.min, numeric.min())
+                self.max = numeric.max() if self.max is None else max(self.max, numeric.max())
+                self.sum += float(numeric.sum())
+                self.numeric_count += len(numeric)
+
+        # Frequency table: only each chunk's most common values are merged, so it stays bounded
+        self.top.update(values.value_counts().head(MAX_TRACKED_VALUES).to_dict())
+        if len(self.top) > MAX_TRACKED_VALUES:
+            self.top = Counter(dict(self.top.most_common(MAX_TRACKED_VALUES // 2)))
+
+        # K-minimum-values sketch for the distinct count
+        hashes = pd.util.hash_pandas_object(values, index=False).to_numpy(dtype=np.uint64)
+        self._hashes = np.unique(np.concatenate([self._hashes, np.unique(hashes)[:SKETCH_SIZE]]))[:SKETCH_SIZE]
+
+    def distinct_estimate(self):
+        if len(self._hashes) < SKETCH_SIZE:
+            return len(self._hashes)
+        kth = float(self._hashes[-1]) / float(np.iinfo(np.uint64).max)
+        return int((SKETCH_SIZE - 1) / kth)
+
+    def to_dict(self):
+        if len(self.dtypes) == 1:
+            dtype = next(iter(self.dtypes))
+        elif self.dtypes and self.dtypes <= {"int64", "float64"}:
+            # Chunks with nulls come back as float64
+            dtype = "float64"
+        else:
+            dtype = "mixed" if self.dtypes else "empty"
+        stats = {
+            "name": self.name,
+            "dtype": dtype,
+            "null_rate": round(self.nulls / self.count, 4) if self.count else 0.0,
+            "distinct": self.distinct_estimate(),
+            "top": [(str(_plain(value)), count) for value, count in self.top.most_common(TOP_K)],
+        }
+        if self.numeric_count:
+            stats.update({"min": _plain(self.min), "max": _plain(self.max), "mean": round(self.sum / self.numeric_count, 4)})
+        return stats
+
+def _plain(value):
+    return value.item() if hasattr(value, "item") else value
+
+class TableProfiler:
+    """Merges per-chunk statistics and keeps a uniform random sample of rows"""
+
+    def __init__(self, sample_rows: int = SAMPLE_ROWS, seed: int = 0):
+        self.columns = {}
+        self.rows = 0
+        self.sample_rows = sample_rows
+        self._rng = np.random.default_rng(seed)
+        self._sample = None
+
+    def update(self, chunk: "pd.DataFrame"):
+        self.rows += len(chunk)
+        for name in chunk.columns:
+            key = str(name)
+            if key not in self.columns:
+                self.columns[key] = ColumnStats(key)
+            self.columns[key].update(chunk[name])
+
+        # Sampling by smallest random key: a uniform sample over all chunks seen so far
+        keyed = chunk.assign(_sample_key=self._rng.random(len(chunk)))
+        combined = keyed if self._sample is None else pd.concat([self._sample, keyed])
+        self._sample = combined.nsmallest(self.sample_rows, "_sample_key")
+
+    def result(self):
+        sample = [] if self._sample is None else json.loads(
+            self._sample.drop(columns="_sample_key").to_json(orient="records", date_format="iso", default_handler=str)
+        )
+        return {"rows": self.rows, "columns": [c.to_dict() for c in self.columns.values()], "sample": sample}
+
+def iter_csv_chunks(fileobj, chunk_rows: int = PROFILE_CHUNK_ROWS):
+    fileobj.seek(0)
+    yield from pd.read_csv(fileobj, chunksize=chunk_rows, encoding="utf-8", low_memory=True)
+
+def iter_excel_chunks(fileobj, chunk_rows: int = PROFILE_CHUNK_ROWS):
+    fileobj.seek(0)
+    wb = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        headers = [str(h) if h is not None else f"column_{i}" for i, h in enumerate(next(rows, []))]
+        while True:
+            batch = list(itertools.islice(rows, chunk_rows))
+            if not batch:
+                break
+            yield pd.DataFrame(batch, columns=headers).infer_objects()
+    finally:
+        wb.close()
+
+def profile_chunks(chunks):
+    profiler = TableProfiler()
+    for chunk in chunks:
+        profiler.update(chunk)
+    return profiler.result()
+
+def profile_csv(fileobj, chunk_rows: int = PROFILE_CHUNK_ROWS):
+    return profile_chunks(iter_csv_chunks(fileobj, chunk_rows))
+
+def profile_excel(fileobj, chunk_rows: int = PROFILE_CHUNK_ROWS):
+    return profile_chunks(iter_excel_chunks(fileobj, chunk_rows))
+
+def format_profile(filename: str, profile: dict):
+    """Compact text for the prompt: one line per column, then the sample rows"""
+    lines = [f"Uploaded Table ({filename}): {profile['rows']} rows, {len(profile['columns'])} columns (profiled over the whole file)"]
+    for col in profile["columns"]:
+        line = f"- {col['name']} [{col['dtype']}] nulls {col['null_rate']:.1%}, ~{col['distinct']} distinct"
+        if "mean" in col:
+            line += f", min {col['min']}, max {col['max']}, mean {col['mean']}"
+        # Top values only mean something if they repeat (not for ids or floats)
+        if col["top"] and col["top"][0][1] > 1:
+            line += ", top: " + ", ".join(f"{value} ({count})" for value, count in col["top"])
+        lines.append(line)
+    lines.append(f"Random sample of {len(profile['sample'])} rows:")
+    lines.append(encode_rows(profile["sample"]))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,257 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from core.config_manager import config
+from core.lazy_imports import lazy_import
+from core.ttl_cache import TTLCache
+from backend.parsing.retrieval import DocumentIndex, select_chunks
+
+pd = lazy_import("pandas")
+pa = lazy_import("pyarrow")
+pq = lazy_import("pyarrow.parquet")
+
+# Parsed uploads, keyed by the SHA-256 of their owner and content. Follow-up questions send
+# the hash (file_id) instead of the bytes and skip both the upload and the parsing. The
+# owner (a user, or an anonymous session) is also stored in meta.json and checked on every
+# read, so a file_id only ever opens its owner's upload.
+#
+# <root>/<file_id>/meta.json      filename, kind, owner
+#                 /text.txt       extracted text (text, docx, pdf)
+#                 /index.json     BM25 chunk index over text.txt
+#                 /table.parquet  tabular data (csv, xlsx), plus profile.json
+#                 /image          preprocessed image, see backend/parsing/images.py (meta has mime)
+UPLOAD_CACHE_DIR = config.get("UPLOAD_CACHE_DIR", os.path.join(tempfile.gettempdir(), "kr_hub_uploads"))
+UPLOAD_CACHE_MAX_BYTES = int(float(config.get("UPLOAD_CACHE_MAX_MB", "1024")) * 1024 * 1024)
+
+# Loaded chunk indexes, so a follow-up question does not re-read index.json
+index_cache = TTLCache(maxsize=int(config.get("RETRIEVAL_INDEX_CACHE_SIZE", "32")), ttl=600)
+
+_FILE_ID = re.compile(r"^[0-9a-f]{64}$")
+_HASH_CHUNK = 1024 * 1024
+
+def hash_upload(fileobj, owner: str):
+    """SHA-256 of the owner and the upload, read in chunks"""
+    fileobj.seek(0)
+    digest = hashlib.sha256(owner.encode() + b"\0")
+    for block in iter(lambda: fileobj.read(_HASH_CHUNK), b""):
+        digest.update(block)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+def _dir_size(path: str):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+def _arrow_type(column: dict):
+    """Parquet column type from the whole-file profile, so every chunk shares one schema"""
+    dtype = column["dtype"]
+    if dtype == "int64" and column["null_rate"] == 0:
+        return pa.int64()
+    if dtype in ("int64", "float64"):
+        return pa.float64()
+    if dtype == "bool" and column["null_rate"] == 0:
+        return pa.bool_()
+    return pa.string()
+
+def _conform(chunk: "pd.DataFrame", schema: "pa.Schema"):
+    columns = {}
+    for field in schema:
+        series = chunk[field.name]
+        if pa.types.is_string(field.type):
+            columns[field.name] = series.astype("string").astype(object).where(series.notna(), None)
+        elif pa.types.is_floating(field.type):
+            columns[field.name] = pd.to_numeric(series, errors="coerce").astype("float64")
+        else:
+            columns[field.name] = series
+    return pa.Table.from_pandas(pd.DataFrame(columns), schema=schema, preserve_index=False)
+
+def _build_index(path: str):
+    with open(os.path.join(path, "text.txt"), encoding="utf-8") as f:
+        DocumentIndex.build(f).save(os.path.join(path, "index.json"))
+
+# Entry writers. They only touch the given directory, so parser worker processes can
+# fill a staging dir directly (see backend/parsing/formats.py).
+def write_text(path: str, text):
+    """text is a string or an iterable of string chunks (streamed to disk)"""
+    with open(os.path.join(path, "text.txt"), "w", encoding="utf-8") as f:
+        for part in ([text] if isinstance(text, str) else text):
+            f.write(part)
+    # Indexing is paid once per document, not per question
+    _build_index(path)
+
+def write_table(path: str, chunks, profile: dict):
+    """Store table chunks as Parquet using one schema derived from the profile"""
+    schema = pa.schema([(c["name"], _arrow_type(c)) for c in profile["columns"]])
+    with pq.ParquetWriter(os.path.join(path, "table.parquet"), schema, compression="zstd") as writer:
+        for chunk in chunks:
+            chunk.columns = [str(c) for c in chunk.columns]
+            writer.write_table(_conform(chunk, schema))
+    with open(os.path.join(path, "profile.json"), "w", encoding="utf-8") as f:
+        json.dump(profile, f, default=str)
+
+def write_image(path: str, data: bytes):
+    with open(os.path.join(path, "image"), "wb") as f:
+        f.write(data)
+
+class CachedUpload:
+    def __init__(self, file_id: str, path: str, meta: dict):
+        self.file_id = file_id
+        self.path = path
+        self.filename = meta["filename"]
+        self.kind = meta["kind"]
+        self.meta = meta
+
+    def read_text(self, limit: int = None):
+        with open(os.path.join(self.path, "text.txt"), encoding="utf-8") as f:
+            return f.read(limit) if limit else f.read()
+
+    def index(self):
+        cached = index_cache.get(self.file_id, None)
+        if cached is None:
+            cached = DocumentIndex.load(os.path.join(self.path, "index.json"))
+            index_cache.set(self.file_id, cached)
+        return cached
+
+    def excerpts(self, question: str, budget_chars: int):
+        """
+        Text for the prompt within budget_chars: the whole document if it fits, otherwise the
+        chunks most relevant to the question (BM25), in document order.
+        Returns (text, chunks used, total chunks).
+        """
+        text_path = os.path.join(self.path, "text.txt")
+        if os.path.getsize(text_path) <= budget_chars:
+            return self.read_text(), None, None
+
+        index = self.index()
+        chosen = select_chunks(index, question, budget_chars)
+        spans = []
+        for chunk in chosen:
+            start, length = index.chunks[chunk]
+            if spans and start <= spans[-1][1]:
+                # Neighbouring chunks overlap; read them as one span
+                spans[-1][1] = max(spans[-1][1], start + length)
+            else:
+                spans.append([start, start + length])
+
+        parts = []
+        with open(text_path, "rb") as f:
+            for start, end in spans:
+                f.seek(start)
+                parts.append(f.read(end - start).decode("utf-8", errors="ignore"))
+        return "\n[...]\n".join(parts), len(chosen), len(index.chunks)
+
+    def profile(self):
+        with open(os.path.join(self.path, "profile.json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    def iter_chunks(self, chunk_rows: int = 50000):
+        """Table data back as DataFrame chunks (one row batch at a time)"""
+        parquet = pq.ParquetFile(os.path.join(self.path, "table.parquet"))
+        for batch in parquet.iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+
+    def image_blob(self):
+        """The preprocessed image as a Gemini inline blob"""
+        with open(os.path.join(self.path, "image"), "rb") as f:
+            return {"mime_type": self.meta["mime"], "data": f.read()}
+
+class UploadCache:
+    """On-disk cache of parsed uploads with LRU eviction by total bytes"""
+
+    def __init__(self, root: str = UPLOAD_CACHE_DIR, max_bytes: int = UPLOAD_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._sizes = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+        # Pick up entries from earlier processes, least recently used first
+        entries = [e for e in os.scandir(root) if e.is_dir() and _FILE_ID.match(e.name)]
+        for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+            self._sizes[entry.name] = _dir_size(entry.path)
+
+    @property
+    def total_bytes(self):
+        return sum(self._sizes.values())
+
+    def get(self, file_id: str, owner: str):
+        if not file_id or not _FILE_ID.match(file_id):
+            return None
+        path = os.path.join(self.root, file_id)
+        try:
+            with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        if meta.get("owner") != owner:
+            # Someone else's upload: indistinguishable from a miss
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            # Evicted (by this or another process) between reading meta.json and now
+            with self._lock:
+                self._sizes.pop(file_id, None)
+            self.misses += 1
+            return None
+        with self._lock:
+            if file_id in self._sizes:
+                self._sizes.move_to_end(file_id)
+        self.hits += 1
+        return CachedUpload(file_id, path, meta)
+
+    def staging_dir(self):
+        """Empty temp dir inside the cache root; fill it with the write_* functions, then commit()"""
+        return tempfile.mkdtemp(dir=self.root, prefix=".staging-")
+
+    def commit(self, file_id: str, owner: str, filename: str, kind: str, staging: str, meta: dict = None):
+        """Move a filled staging dir into place atomically"""
+        try:
+            with open(os.path.join(staging, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({"filename": filename, "kind": kind, "owner": owner, **(meta or {})}, f)
+            size = _dir_size(staging)
+            final = os.path.join(self.root, file_id)
+            try:
+                os.rename(staging, final)
+            except OSError:
+                # Another request stored the same content first
+                shutil.rmtree(staging, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        with self._lock:
+            self._sizes[file_id] = size
+            self._sizes.move_to_end(file_id)
+            self._evict()
+        return self.get(file_id, owner)
+
+    def _store(self, file_id: str, owner: str, filename: str, kind: str, write, meta: dict = None):
+        staging = self.staging_dir()
+        try:
+            write(staging)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return self.commit(file_id, owner, filename, kind, staging, meta)
+
+    def _evict(self):
+        while len(self._sizes) > 1 and self.total_bytes > self.max_bytes:
+            file_id, _ = self._sizes.popitem(last=False)
+            shutil.rmtree(os.path.join(self.root, file_id), ignore_errors=True)
+
+    def put_image(self, file_id: str, owner: str, filename: str, data: bytes, mime: str, info: dict):
+        return self._store(file_id, owner, filename, "image", lambda path: write_image(path, data), {"mime": mime, **info})
+
+    def stats(self):
+        return {"entries": len(self._sizes), "bytes": self.total_bytes, "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses}
+
+upload_cache = UploadCache()
@@ -0,0 +1,92 @@
+import hmac
+import time
+from fastapi import HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from core.config_manager import config
+from core.lazy_imports import import_stats
+from core.telemetry import CallbackMetric, render_metrics, request_seconds, start_trace, end_trace
+from core.ai_gateway import key_cache
+from core.response_cache import response_cache, plan_cache
+from backend.auth_manager import token_cache
+from backend.admission import admission
+from backend.parsing.upload_cache import upload_cache
+from backend.parsing.pool import pool_stats
+
+# Bearer token Prometheus must send to scrape /metrics; unset = open (keep it private then)
+METRICS_TOKEN = config.get("METRICS_TOKEN")
+
+class TracingMiddleware:
+    """
+    Starts a trace per request (see core/telemetry.py) and records its latency until the
+    last body byte. Stages finished before the headers go out are sent as Server-Timing;
+    every response carries X-Trace-Id, which slow-request log lines include.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            return await self.app(scope, receive, send)
+
+        trace, token = start_trace(f"{scope['method']} {scope['path']}")
+        status = 500
+
+        async def traced_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers") or [])
+                headers.append((b"x-trace-id", trace.id.encode()))
+                if trace.spans:
+                    headers.append((b"server-timing", trace.server_timing().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, traced_send)
+        finally:
+            # Route templates, not raw paths, so label values stay bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            request_seconds.observe(time.perf_counter() - trace.start, route=route, method=scope["method"], status=status)
+            end_trace(trace, token)
+
+def _cache_stats():
+    return {
+        "responses": response_cache.stats(),
+        "plans": plan_cache.stats(),
+        "keys": key_cache.stats(),
+        "tokens": token_cache.stats(),
+        "uploads": upload_cache.stats(),
+    }
+
+def _hit_ratios():
+    ratios = {}
+    for name, stats in _cache_stats().items():
+        total = stats["hits"] + stats["misses"]
+        ratios[(name,)] = round(stats["hits"] / total, 4) if total else 0.0
+    return ratios
+
+def _lookups():
+    lookups = {}
+    for name, stats in _cache_stats().items():
+        lookups[(name, "hit")] = stats["hits"]
+        lookups[(name, "miss")] = stats["misses"]
+    return lookups
+
+CallbackMetric("kr_cache_hit_ratio", "Hit ratio since start per cache (responses, plans, keys, tokens, uploads)", "gauge", ("cache",), _hit_ratios)
+CallbackMetric("kr_cache_lookups_total", "Cache lookups per cache and result", "counter", ("cache", "result"), _lookups)
+CallbackMetric("kr_ai_in_flight", "AI requests holding an admission slot", "gauge", (), lambda: {(): admission.in_flight})
+CallbackMetric("kr_ai_queued", "AI requests waiting for an admission slot", "gauge", (), lambda: {(): admission.stats()["queued"]})
+CallbackMetric("kr_parser_workers", "Parser pool size per executor kind (process or thread)", "gauge", ("executor",), lambda: {(pool_stats()["executor"],): pool_stats()["workers"]})
+CallbackMetric("kr_parser_jobs_total", "Parser pool jobs per outcome (completed, failed, timed_out, cancelled)", "counter", ("result",), lambda: {(result,): n for result, n in pool_stats()["jobs"].items()})
+CallbackMetric("kr_lazy_module_loaded", "Whether this process has imported a lazily loaded module (parsers, provider SDKs)", "gauge", ("module",), lambda: {(name,): int(s["loaded"]) for name, s in import_stats().items()})
+CallbackMetric("kr_lazy_module_import_seconds", "How long the first import of a lazily loaded module took", "gauge", ("module",), lambda: {(name,): s["import_ms"] / 1000 for name, s in import_stats().items() if s["import_ms"] is not None})
+
+def metrics_response(request: Request):
+    """Prometheus text exposition of the metrics above and in core/telemetry.py"""
+    if METRICS_TOKEN:
+        authorization = request.headers.get("authorization", "")
+        if not hmac.compare_digest(authorization.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+            raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
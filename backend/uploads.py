@@ -0,0 +1,84 @@
+import asyncio
+from fastapi import HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse
+from core.config_manager import config
+
+# Uploads are spooled by Starlette (memory up to 1 MB, then a temp file on disk).
+# Parsers read from that file object; the upload is never loaded into memory as a whole.
+MAX_UPLOAD_BYTES = int(float(config.get("MAX_UPLOAD_MB", "100")) * 1024 * 1024)
+
+def _too_large_detail(max_bytes: int):
+    return f"Upload exceeds the {max_bytes // (1024 * 1024)} MB limit"
+
+class UploadSizeLimitMiddleware:
+    """
+    Rejects oversized multipart bodies with 413 before they are spooled.
+    Declared sizes are refused immediately; chunked bodies are cut off as soon as
+    the running total passes the limit.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_UPLOAD_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/"):
+            return await self.app(scope, receive, send)
+
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            response = JSONResponse({"detail": _too_large_detail(self.max_bytes)}, status_code=413)
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # FastAPI re-raises HTTPExceptions from body parsing, so this becomes a 413
+                    raise HTTPException(status_code=413, detail=_too_large_detail(self.max_bytes))
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+def open_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES):
+    """
+    Rewound binary file object for an upload, plus its size.
+    Raises HTTPException(413) if the spooled file is over the limit (e.g. no middleware in front).
+    """
+    fileobj = file.file
+    fileobj.seek(0, 2)
+    size = fileobj.tell()
+    fileobj.seek(0)
+    if size > max_bytes:
+        raise HTTPException(status_code=413, detail=_too_large_detail(max_bytes))
+    return fileobj, size
+
+# How often a long parse checks whether its client is still connected
+DISCONNECT_POLL_SECONDS = 0.5
+
+async def cancel_on_disconnect(request: Request, coro):
+    """
+    Await coro, cancelling it if the client disconnects first (e.g. closes the tab during
+    a long upload parse). Raises HTTPException(499) in that case.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        # Cancelled from outside (server shutdown): take the parse down too
+        task.cancel()
@@ -0,0 +1,79 @@
+"""
+Batch endpoint benchmark.
+
+Posts one large job to /ai/run/batch (in process, through the real app and
+middleware) at several concurrency settings, with the local fake provider
+behind the gateway. Items per second should grow with the concurrency
+setting until the provider or AI_MAX_IN_FLIGHT becomes the limit.
+
+Usage: python benchmarks/bench_batch.py [--items 500] [--levels 1,4,16,32]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "bench")
+
+import httpx
+from core import ai_gateway
+from backend import batch
+from backend.main import app
+from backend.auth_manager import get_current_user
+from benchmarks.fake_provider import FakeProvider
+
+
+async def _run_level(client, items: int, concurrency: int):
+    body = {
+        "requests": [{"messages": [{"role": "user", "content": f"prompt {i}"}], "provider": "openai", "model": "fake"} for i in range(items)],
+        "concurrency": concurrency,
+    }
+    # A fresh user per level, so earlier levels don't use up the batch quota
+    app.dependency_overrides[get_current_user] = lambda: {"id": f"bench-user-{concurrency}"}
+    start = time.perf_counter()
+    ok = errors = 0
+    # Bypass the response cache so every level really calls the provider
+    async with client.stream("POST", "/ai/run/batch", json=body, headers={"X-Cache-Bypass": "1"}) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line:
+                result = json.loads(line)
+                ok += "response" in result
+                errors += "error" in result
+    elapsed = time.perf_counter() - start
+    return {"concurrency": concurrency, "seconds": round(elapsed, 3), "ok": ok, "errors": errors, "items_per_sec": round(items / elapsed, 2)}
+
+
+async def _no_user_key(user_id, provider):
+    return None
+
+
+async def main(items, levels, tokens, token_delay):
+    async with FakeProvider(tokens=tokens, token_delay=token_delay) as provider:
+        os.environ["OPENAI_BASE_URL"] = provider.base_url
+        os.environ["GLOBAL_OPENAI_KEY"] = "sk-bench"
+        # No database in the benchmark: every user falls back to the global key
+        ai_gateway.aget_user_key = batch.aget_user_key = _no_user_key
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            report = [await _run_level(client, items, level) for level in levels]
+
+    baseline = report[0]["items_per_sec"]
+    for row in report:
+        row["scaling"] = round(row["items_per_sec"] / baseline, 2)
+    return {"benchmark": "batch", "items": items, "provider_latency_s": round(tokens * token_delay, 3), "results": report}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--levels", default="1,4,16,32")
+    parser.add_argument("--tokens", type=int, default=10)
+    parser.add_argument("--token-delay", type=float, default=0.002)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main(args.items, [int(x) for x in args.levels.split(",")], args.tokens, args.token_delay)), indent=2))
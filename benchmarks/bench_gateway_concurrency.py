@@ -0,0 +1,75 @@
+"""
+Gateway concurrency benchmark.
+
+Drives core.ai_gateway.arun_ai against the local fake provider with an
+increasing number of in-flight streams. With a non-blocking gateway the
+wall time stays roughly constant, so throughput scales with concurrency.
+
+Usage: python benchmarks/bench_gateway_concurrency.py [--levels 1,4,16,64]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "bench")
+
+from core import ai_gateway
+from benchmarks.fake_provider import FakeProvider
+
+
+async def _consume(user_id: str):
+    stream = await ai_gateway.arun_ai(user_id, [{"role": "user", "content": "ping"}], provider="openai", model="fake", stream=True)
+    if isinstance(stream, str):
+        raise RuntimeError(stream)
+    tokens = 0
+    async for _ in stream:
+        tokens += 1
+    return tokens
+
+
+async def _run_level(concurrency: int):
+    start = time.perf_counter()
+    results = await asyncio.gather(*[_consume(f"bench-{i}") for i in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 4),
+        "tokens": sum(results),
+        "streams_per_sec": round(concurrency / elapsed, 2),
+        "tokens_per_sec": round(sum(results) / elapsed, 2),
+    }
+
+
+async def _no_user_key(user_id, provider):
+    return None
+
+
+async def main(levels, tokens, token_delay):
+    async with FakeProvider(tokens=tokens, token_delay=token_delay) as provider:
+        # Environment is read at call time, after config_manager loaded .env files
+        os.environ["OPENAI_BASE_URL"] = provider.base_url
+        os.environ["GLOBAL_OPENAI_KEY"] = "sk-bench"
+        # No database in the benchmark: every user falls back to the global key
+        ai_gateway.aget_user_key = _no_user_key
+
+        await _consume("warmup")
+        report = [await _run_level(level) for level in levels]
+
+    baseline = report[0]["streams_per_sec"]
+    for row in report:
+        row["scaling"] = round(row["streams_per_sec"] / baseline, 2)
+    print(json.dumps({"benchmark": "gateway_concurrency", "tokens": tokens, "token_delay": token_delay, "results": report}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--levels", default="1,4,16,64")
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    args = parser.parse_args()
+    asyncio.run(main([int(x) for x in args.levels.split(",")], args.tokens, args.token_delay))
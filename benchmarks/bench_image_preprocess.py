@@ -0,0 +1,122 @@
+"""
+Image preprocessing benchmark.
+
+Generates a phone-style photo (12 MP JPEG, rotated via EXIF, with GPS
+metadata) and compares what one image question costs before and after
+backend.parsing.images:
+
+- raw: the old path. Every question decodes the full-resolution upload into
+  a PIL image, and the Gemini SDK re-encodes it (lossless WebP) for the request.
+- preprocessed: the image is oriented, downscaled and re-encoded once at
+  upload; every question reads the cached bytes and sends them as is.
+
+Reports the request payload size, the CPU time spent per question, and the
+estimated time to first token at a given uplink speed (CPU time plus payload
+upload time; model time is the same for both and left out).
+
+Usage: python benchmarks/bench_image_preprocess.py [--questions 3] [--uplink-mbps 20]
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "bench")
+os.environ.setdefault("UPLOAD_CACHE_DIR", tempfile.mkdtemp(prefix="bench_images_"))
+
+from PIL import Image
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore")
+    from google.generativeai.types import content_types
+from backend.parsing.images import preprocess_image
+from backend.parsing.upload_cache import upload_cache, hash_upload
+
+
+def make_photo(width: int, height: int):
+    """Noisy gradient (compresses like a real photo), stored sideways with EXIF orientation 6 and GPS"""
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 40)
+    img = Image.merge("RGB", (gradient, noise, Image.blend(gradient, noise, 0.5)))
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise to display
+    exif[0x8825] = {1: "N", 2: (52.0, 31.0, 12.0)}  # GPSInfo
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=92, exif=exif)
+    out.seek(0)
+    return out
+
+
+def _raw_question(upload):
+    """Old per-question work: full decode, then the SDK's conversion to a request blob"""
+    upload.seek(0)
+    img = Image.open(upload)
+    img.load()
+    return content_types.to_blob(img)
+
+
+def _preprocessed_question(cached):
+    return content_types.to_blob(cached.image_blob())
+
+
+def _time_questions(fn, arg, questions: int):
+    times = []
+    for _ in range(questions):
+        start = time.perf_counter()
+        blob = fn(arg)
+        times.append(time.perf_counter() - start)
+    return blob, sum(times) / len(times)
+
+
+def main(width, height, questions, uplink_mbps):
+    upload = make_photo(width, height)
+    upload_bytes = len(upload.getvalue())
+
+    raw_blob, raw_cpu = _time_questions(_raw_question, upload, questions)
+
+    start = time.perf_counter()
+    data, mime, info = preprocess_image(upload)
+    preprocess_seconds = time.perf_counter() - start
+    cached = upload_cache.put_image(hash_upload(upload, "bench"), "bench", "photo.jpg", data, mime, info)
+    pre_blob, pre_cpu = _time_questions(_preprocessed_question, cached, questions)
+
+    def row(name, blob, cpu):
+        upload_seconds = len(blob.data) * 8 / (uplink_mbps * 1_000_000)
+        return {
+            "path": name,
+            "payload_bytes": len(blob.data),
+            "payload_mime": blob.mime_type,
+            "cpu_ms_per_question": round(cpu * 1000, 1),
+            "est_ttft_overhead_ms": round((cpu + upload_seconds) * 1000, 1),
+        }
+
+    raw, pre = row("raw", raw_blob, raw_cpu), row("preprocessed", pre_blob, pre_cpu)
+    processed = Image.open(io.BytesIO(data))
+    return {
+        "benchmark": "image_preprocess",
+        "upload": {"size": [width, height], "bytes": upload_bytes},
+        "uplink_mbps": uplink_mbps,
+        "preprocess_once_ms": round(preprocess_seconds * 1000, 1),
+        "results": [raw, pre],
+        "payload_reduction": round(raw["payload_bytes"] / pre["payload_bytes"], 1),
+        "ttft_overhead_reduction": round(raw["est_ttft_overhead_ms"] / pre["est_ttft_overhead_ms"], 1),
+        "checks": {
+            "orientation applied (portrait)": info["size"][1] > info["size"][0],
+            "metadata stripped": len(processed.getexif()) == 0,
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    parser.add_argument("--questions", type=int, default=3)
+    parser.add_argument("--uplink-mbps", type=float, default=20)
+    args = parser.parse_args()
+    print(json.dumps(main(args.width, args.height, args.questions, args.uplink_mbps), indent=2))
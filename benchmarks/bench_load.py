@@ -0,0 +1,327 @@
+"""
+Load test for /ai/run and /modules/chat-with-data/analyze.
+
+Runs the real app (in process, through all middleware, with responses
+streamed chunk by chunk) against local
+stand-ins: benchmarks/fake_supabase.py for PostgREST/Auth and
+benchmarks/fake_provider.py for the models. Each scenario is driven by
+--concurrency closed-loop clients and reports p50/p95/p99 latency,
+time to first token (first SSE chunk) and throughput as JSON, tagged with
+the git commit so reports can be compared across commits:
+
+    python benchmarks/bench_load.py --output before.json
+    ... change ...
+    python benchmarks/bench_load.py --compare before.json
+
+With --compare the run exits with code 1 if any scenario's p95 latency or
+TTFT got more than --max-regression (default 20%) worse.
+
+Gemini cannot be pointed at a local server, so no Gemini key is configured
+and analyze requests take the gateway's OpenRouter fallback to the fake
+provider. Requests are unique and sent with X-Cache-Bypass unless --cache
+is given, in which case identical requests measure the cached path.
+
+Scenarios: ai_run, analyze_general, analyze_general_upload,
+analyze_database, analyze_database_upload.
+
+Usage: python benchmarks/bench_load.py [--scenarios all] [--requests 200] [--concurrency 16]
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Loads .env/.env.local first, so the overrides below (fake URLs, no live keys) win
+import core.config_manager  # noqa: F401
+
+import httpx
+import jwt
+from benchmarks.fake_provider import FakeProvider
+from benchmarks.fake_supabase import FakeSupabase
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JWT_SECRET = "bench-jwt-secret-bench-jwt-secret"
+SCENARIOS = ("ai_run", "analyze_general", "analyze_general_upload", "analyze_database", "analyze_database_upload")
+ERROR_PREFIXES = ("AI Error", "AI Critical Error", "Error")
+
+
+class StreamingASGITransport(httpx.AsyncBaseTransport):
+    """
+    httpx.ASGITransport collects the whole response before returning it, which
+    hides time to first token. This one hands body chunks over as the app sends them.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def handle_async_request(self, request):
+        body = b"".join([part async for part in request.stream])
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": request.method, "scheme": request.url.scheme,
+            "path": request.url.path, "raw_path": request.url.raw_path.split(b"?")[0],
+            "query_string": request.url.query, "root_path": "",
+            "headers": [(k.lower(), v) for k, v in request.headers.raw],
+            "server": (request.url.host, request.url.port or 80), "client": ("127.0.0.1", 50000),
+        }
+        body_sent = False
+        closed = asyncio.Event()
+        started = asyncio.get_running_loop().create_future()
+        chunks = asyncio.Queue()
+
+        async def receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await closed.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                started.set_result(message)
+            elif message["type"] == "http.response.body":
+                if message.get("body"):
+                    chunks.put_nowait(message["body"])
+                if not message.get("more_body"):
+                    chunks.put_nowait(None)
+
+        async def run():
+            try:
+                await self.app(scope, receive, send)
+            except Exception as e:
+                if not started.done():
+                    started.set_exception(e)
+            finally:
+                chunks.put_nowait(None)
+
+        task = asyncio.create_task(run())
+        start = await started
+
+        class Body(httpx.AsyncByteStream):
+            async def __aiter__(self):
+                while (chunk := await chunks.get()) is not None:
+                    yield chunk
+
+            async def aclose(self):
+                closed.set()
+                await task
+
+        return httpx.Response(start["status"], headers=start.get("headers") or [], stream=Body())
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def _plan_reply(payload):
+    """Planner prompts get a grouped count (pushed down to the database / run over the upload)"""
+    prompt = payload["messages"][-1]["content"]
+    if "JSON query plan" not in prompt:
+        return "tok0 tok1 tok2 tok3 tok4"
+    columns = prompt.split("Columns:", 1)[1].split("\n", 1)[0]
+    group_by = ["status"] if "status (" in columns else []
+    return json.dumps({"filters": [], "aggregate": {"func": "count", "column": None}, "group_by": group_by, "order_by": None, "limit": 20})
+
+
+def _csv_upload(index: int, rows: int):
+    lines = ["id,status,amount,region"]
+    lines += [f"{i},{('active', 'cancelled', 'paused')[i % 3]},{(i * 37 + index) % 500},{('north', 'south', 'east', 'west')[i % 4]}" for i in range(rows)]
+    return f"orders_{index}.csv", "\n".join(lines).encode()
+
+
+def _request(scenario: str, index: int, args):
+    """(method, path, httpx kwargs) for request number index of a scenario"""
+    suffix = "" if args.cache else f" (#{index})"
+    if scenario == "ai_run":
+        return "/ai/run", {"json": {"messages": [{"role": "user", "content": f"Summarize our refund policy{suffix}"}], "provider": "openai"}}
+    mode = "database" if scenario.startswith("analyze_database") else "general"
+    question = "how many orders are there per status" if mode == "database" else "what is in this data"
+    data = {"question": question + suffix, "mode": mode, "table_name": "orders"}
+    kwargs = {"data": data}
+    if scenario.endswith("_upload"):
+        filename, content = _csv_upload(0 if args.cache else index, args.upload_rows)
+        kwargs["files"] = {"file": (filename, content, "text/csv")}
+    return "/modules/chat-with-data/analyze", kwargs
+
+
+async def _send(client, scenario: str, index: int, token: str, args):
+    path, kwargs = _request(scenario, index, args)
+    headers = {"Authorization": f"Bearer {token}"}
+    if not args.cache:
+        headers["X-Cache-Bypass"] = "1"
+    start = time.perf_counter()
+    ttft = None
+    error = None
+    async with client.stream("POST", path, headers=headers, **kwargs) as response:
+        if response.status_code != 200:
+            error = f"HTTP {response.status_code}: {(await response.aread())[:200].decode(errors='replace')}"
+        elif path == "/ai/run":
+            reply = json.loads(await response.aread())["response"]
+            if reply.startswith(ERROR_PREFIXES):
+                error = reply[:200]
+        else:
+            async for line in response.aiter_lines():
+                if not line.startswith("data: ") or line == "data: [DONE]":
+                    continue
+                event = json.loads(line[6:])
+                if "chunk" in event:
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                        if event["chunk"].startswith(ERROR_PREFIXES):
+                            error = event["chunk"][:200]
+    return time.perf_counter() - start, ttft, error
+
+
+def _percentiles(values: list):
+    if not values:
+        return None
+    ordered = sorted(values)
+    # Nearest rank
+    pick = lambda q: round(ordered[max(0, math.ceil(q * len(ordered)) - 1)] * 1000, 1)
+    return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": pick(1.0)}
+
+
+async def _run_scenario(client, scenario: str, tokens: list, args):
+    for i in range(args.warmup):
+        await _send(client, scenario, -1 - i, tokens[0], args)
+
+    latencies, ttfts, errors = [], [], []
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < args.requests:
+            index = next_index
+            next_index += 1
+            try:
+                latency, ttft, error = await _send(client, scenario, index, tokens[index % len(tokens)], args)
+            except Exception as e:
+                latency, ttft, error = None, None, f"{type(e).__name__}: {e}"
+            if error:
+                errors.append(error)
+                continue
+            latencies.append(latency)
+            if ttft is not None:
+                ttfts.append(ttft)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+    elapsed = time.perf_counter() - start
+    return {
+        "scenario": scenario,
+        "requests": args.requests,
+        "ok": len(latencies),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "latency_ms": _percentiles(latencies),
+        "ttft_ms": _percentiles(ttfts),
+    }
+
+
+def _compare(report: dict, baseline: dict, max_regression: float):
+    """Relative change per scenario (positive = slower / less throughput) and the regression checks"""
+    previous = {r["scenario"]: r for r in baseline["results"]}
+    comparison, checks = {}, {}
+    for row in report["results"]:
+        before = previous.get(row["scenario"])
+        if not before:
+            continue
+        change = lambda new, old: round((new - old) / old, 3) if new is not None and old else None
+        delta = {}
+        for metric in ("latency_ms", "ttft_ms"):
+            if row[metric] and before.get(metric):
+                delta[metric] = {q: change(row[metric][q], before[metric][q]) for q in ("p50", "p95", "p99")}
+                checks[f"{row['scenario']} {metric} p95 within {max_regression:.0%}"] = (delta[metric]["p95"] or 0) <= max_regression
+        delta["throughput_rps"] = round((before["throughput_rps"] - row["throughput_rps"]) / before["throughput_rps"], 3) if before["throughput_rps"] else None
+        comparison[row["scenario"]] = delta
+    # Numbers from different settings are not comparable
+    return {"baseline_commit": baseline.get("commit"), "same_config": baseline.get("config") == report["config"], "changes": comparison}, checks
+
+
+async def main(args):
+    scenarios = SCENARIOS if args.scenarios == "all" else tuple(args.scenarios.split(","))
+    async with FakeSupabase(rows=args.table_rows, latency=args.db_latency) as supabase, \
+               FakeProvider(tokens=args.tokens, token_delay=1 / args.token_rate, first_token_delay=args.model_latency, reply=_plan_reply) as provider:
+        os.environ.update({
+            "SUPABASE_URL": supabase.url,
+            "SUPABASE_SERVICE_ROLE_KEY": "bench",
+            "SUPABASE_JWT_SECRET": JWT_SECRET,
+            # sk-or keys go to OPENROUTER_BASE_URL, which is also the Gemini fallback
+            "GLOBAL_OPENAI_KEY": "sk-or-bench",
+            "OPENROUTER_BASE_URL": provider.base_url,
+            "OPENAI_BASE_URL": provider.base_url,
+            "USER_RATE_PER_MINUTE": "1000000",
+            "USER_BURST": "1000000",
+            "UPLOAD_CACHE_DIR": tempfile.mkdtemp(prefix="kr_hub_bench_"),
+            "TRACE_LOG_SLOW_MS": "0",
+        })
+        os.environ.pop("GLOBAL_GEMINI_KEY", None)
+        from backend.main import app
+
+        # Supabase user ids are uuids; the key lookups then really reach the fake user_api_keys
+        tokens = [jwt.encode({"sub": str(uuid.UUID(int=i + 1)), "aud": "authenticated", "exp": int(time.time()) + 3600}, JWT_SECRET, algorithm="HS256") for i in range(args.users)]
+        transport = StreamingASGITransport(app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            results = [await _run_scenario(client, scenario, tokens, args) for scenario in scenarios]
+        upstream = {"supabase_requests": supabase.requests, "provider_requests": provider.requests}
+
+    report = {
+        "benchmark": "load",
+        "commit": _commit(),
+        "config": {
+            "requests": args.requests, "concurrency": args.concurrency, "users": args.users, "cache": args.cache,
+            "model_latency_s": args.model_latency, "token_rate": args.token_rate, "tokens": args.tokens,
+            "db_latency_s": args.db_latency, "table_rows": args.table_rows, "upload_rows": args.upload_rows,
+        },
+        "results": results,
+        "upstream": upstream,
+    }
+    checks = {f"{r['scenario']} had no errors": r["errors"] == 0 for r in results}
+    if args.compare:
+        with open(args.compare) as f:
+            report["comparison"], regression_checks = _compare(report, json.load(f), args.max_regression)
+        checks.update(regression_checks)
+    report["checks"] = checks
+    return report, all(checks.values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="all", help=f"comma separated: {','.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--cache", action="store_true", help="repeat identical requests and let the caches answer")
+    parser.add_argument("--model-latency", type=float, default=0.3, help="seconds before the fake model's first token")
+    parser.add_argument("--token-rate", type=float, default=200, help="fake model tokens per second")
+    parser.add_argument("--tokens", type=int, default=40, help="tokens per fake answer")
+    parser.add_argument("--db-latency", type=float, default=0.01, help="seconds per fake PostgREST/Auth request")
+    parser.add_argument("--table-rows", type=int, default=2000)
+    parser.add_argument("--upload-rows", type=int, default=5000)
+    parser.add_argument("--output", help="also write the report to this file")
+    parser.add_argument("--compare", help="earlier report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+    # The app logs with print(); keep stdout for the report
+    with contextlib.redirect_stdout(sys.stderr):
+        report, passed = asyncio.run(main(args))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,87 @@
+"""
+PDF extraction benchmark.
+
+Generates a text-heavy PDF (300 pages by default) and extracts every page
+with backend.parsing.pdf using 1..N worker processes. On a multi-core
+machine the time should drop almost linearly with the worker count.
+
+Usage: python benchmarks/bench_pdf_extraction.py [--pages 300] [--workers 1,2,4,8]
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "bench")
+
+from backend.parsing import pool as parser_pool
+from backend.parsing.pdf import extract_pdf_file
+
+
+def make_pdf(pages: int, lines_per_page: int = 45):
+    """Minimal multi-page PDF with real text content streams (no extra dependencies)"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for p in range(pages):
+        lines = "".join(f"(Page {p + 1} line {i}: revenue region subscriber status active order total) Tj T* " for i in range(lines_per_page))
+        stream = f"BT /F1 9 Tf 11 TL 40 800 Td {lines}ET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>".encode())
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>".encode()
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    out.seek(0)
+    return out
+
+
+async def main(pages, worker_levels):
+    # The app parses a file on disk (see backend/parsing/formats.py), so the benchmark does too
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+        f.write(make_pdf(pages).getvalue())
+    path = f.name
+    results = []
+    for workers in worker_levels:
+        # Resizes the pool and its job slots
+        parser_pool.configure(workers, "process")
+        executor = parser_pool.get_process_pool()
+        # Warm the pool so process start-up is not counted
+        await asyncio.gather(*[asyncio.get_running_loop().run_in_executor(executor, time.sleep, 0) for _ in range(workers)])
+
+        start = time.perf_counter()
+        text = await extract_pdf_file(path, time_budget=600)
+        elapsed = time.perf_counter() - start
+        executor.shutdown()
+
+        results.append({"workers": workers, "seconds": round(elapsed, 3), "chars": len(text)})
+
+    os.remove(path)
+
+    for row in results:
+        row["speedup"] = round(results[0]["seconds"] / row["seconds"], 2)
+    print(json.dumps({"benchmark": "pdf_extraction", "pages": pages, "cpu_count": os.cpu_count(), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--workers", default=",".join(str(n) for n in sorted({1, 2, 4, os.cpu_count() or 1})))
+    args = parser.parse_args()
+    asyncio.run(main(args.pages, [int(x) for x in args.workers.split(",")]))
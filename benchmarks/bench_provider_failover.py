@@ -0,0 +1,139 @@
+"""
+Provider failover benchmark.
+
+Runs core.ai_gateway.arun_ai against two local fake providers, a primary and
+the OpenRouter fallback, in failure scenarios: a primary that returns 500s,
+one that hangs, one that is slow but healthy, and recovery after an outage.
+Reports time to first token per request, how many requests the primary
+actually received, and the circuit state, then checks the expected behaviour
+(exit code 1 if a check fails).
+
+Usage: python benchmarks/bench_provider_failover.py [--requests 12]
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "bench")
+
+from core import ai_gateway, provider_health as health_module
+from core.provider_health import provider_health
+from benchmarks.fake_provider import FakeProvider
+
+BENCH_USER = "bench-user"
+
+
+async def _first_token(user_id: str):
+    """Seconds until the first chunk, and whether the request got an answer at all"""
+    start = time.perf_counter()
+    stream = await ai_gateway.arun_ai(user_id, [{"role": "user", "content": "ping"}], provider="openai", model="fake", stream=True)
+    if isinstance(stream, str):
+        return time.perf_counter() - start, False
+    first = None
+    async for text in stream:
+        if first is None:
+            first = time.perf_counter() - start
+    return first, True
+
+
+def _summary(latencies):
+    ordered = sorted(latencies)
+    return {
+        "first_request_ms": round(latencies[0] * 1000, 1),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 1),
+        "max_ms": round(ordered[-1] * 1000, 1),
+    }
+
+
+async def _scenario(name, requests, primary_kwargs, fallback_kwargs=None, hedge_ms=0, timeout=1.0, between=None):
+    provider_health.reset()
+    ai_gateway.HEDGE_AFTER_MS = hedge_ms
+    ai_gateway.PROVIDER_TIMEOUT = timeout
+
+    async with FakeProvider(tokens=5, token_delay=0.001, **primary_kwargs) as primary, \
+            FakeProvider(tokens=5, token_delay=0.001, **(fallback_kwargs or {})) as fallback:
+        # Primary: one user's (BYOK) OpenAI-compatible key, which has its own circuit;
+        # fallback: OpenRouter free via the global key
+        os.environ["OPENAI_BASE_URL"] = primary.base_url
+        ai_gateway.OPENROUTER_BASE_URL = fallback.base_url
+        async def user_key(user_id, provider, key=f"sk-primary-{name}"):
+            return key
+        ai_gateway.aget_user_key = user_key
+
+        latencies, answered = [], 0
+        for i in range(requests):
+            if between:
+                await between(i, primary)
+            latency, ok = await _first_token(BENCH_USER)
+            latencies.append(latency)
+            answered += ok
+
+        return {
+            "scenario": name,
+            "requests": requests,
+            "answered": answered,
+            "primary_requests": primary.requests,
+            "fallback_requests": fallback.requests,
+            "time_to_first_token": _summary(latencies),
+            "health": {**provider_health.stats(), "openai (user key)": provider_health.get("openai", BENCH_USER).stats()},
+        }
+
+
+async def main(requests):
+    os.environ["GLOBAL_OPENAI_KEY"] = "sk-or-bench"
+    consecutive = health_module.CIRCUIT_CONSECUTIVE_FAILURES
+    results, checks = [], {}
+
+    r = await _scenario("primary_fails", requests, {"mode": "fail"})
+    results.append(r)
+    checks["failing primary: every request answered by the fallback"] = r["answered"] == requests
+    checks["failing primary: circuit opens, primary no longer called"] = r["primary_requests"] == consecutive
+
+    r = await _scenario("primary_hangs", requests, {"mode": "hang"}, timeout=1.0)
+    results.append(r)
+    checks["hanging primary: only the first requests pay the timeout"] = r["primary_requests"] == consecutive and r["time_to_first_token"]["p50_ms"] < 500
+
+    r = await _scenario("primary_hangs_hedged", requests, {"mode": "hang"}, hedge_ms=100, timeout=1.0)
+    results.append(r)
+    checks["hanging primary, hedged: no request waits for the timeout"] = r["time_to_first_token"]["max_ms"] < 1000
+
+    r = await _scenario("primary_slow_hedged", requests, {"first_token_delay": 1.0}, hedge_ms=100, timeout=5.0)
+    results.append(r)
+    checks["slow primary, hedged: fallback answers first"] = r["time_to_first_token"]["max_ms"] < 1000 and r["answered"] == requests
+
+    r = await _scenario("both_fail", requests, {"mode": "fail"}, {"mode": "fail"})
+    results.append(r)
+    checks["both failing: error reply without waiting"] = r["answered"] == 0 and r["time_to_first_token"]["max_ms"] < 1000
+
+    # Outage, then recovery: the circuit re-closes after the cool-down probe succeeds
+    open_seconds = health_module.CIRCUIT_OPEN_SECONDS
+    health_module.CIRCUIT_OPEN_SECONDS = 0.3
+
+    async def recover(i, primary):
+        if i == requests // 2:
+            primary.mode = "ok"
+            await asyncio.sleep(0.4)
+
+    r = await _scenario("recovery", requests, {"mode": "fail"}, between=recover)
+    health_module.CIRCUIT_OPEN_SECONDS = open_seconds
+    results.append(r)
+    checks["recovery: circuit closes again after the outage"] = r["health"]["openai (user key)"]["state"] == "closed"
+
+    return {"benchmark": "provider_failover", "results": results, "checks": checks}, all(checks.values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=12)
+    args = parser.parse_args()
+    # Gateway failover logs go to stderr so stdout is only the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        report, passed = asyncio.run(main(args.requests))
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,107 @@
+"""
+Startup (cold start) benchmark.
+
+Starts fresh Python processes that import backend.main:app and serve one
+request, the way a Vercel cold start does, and reports:
+
+- import_ms: time to import backend.main
+- first_request_ms: the first request (GET /) after the import
+- cold_start_ms: process launch to first response, measured from outside
+- heavy modules (parsers, provider SDKs) that were imported at startup
+
+The "eager" variant imports the lazily loaded libraries up front, which is
+what every cold start paid before core/lazy_imports.py. Exits with code 1
+if a heavy module is imported at startup again or the median import time
+exceeds --max-import-ms, so it can run as a regression check.
+
+Usage: python benchmarks/bench_startup.py [--runs 5] [--max-import-ms 2000]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Must not be imported by `import backend.main`; they load on first use
+HEAVY_MODULES = ("pandas", "numpy", "pyarrow", "openpyxl", "PyPDF2", "docx", "PIL", "rapidfuzz", "openai", "google.generativeai", "supabase")
+
+PROBE = """
+import asyncio, json, os, sys, time, warnings
+warnings.simplefilter("ignore")
+start = time.perf_counter()
+if os.environ.get("BENCH_EAGER"):
+    import importlib
+    for name in sys.argv[1].split(","):
+        importlib.import_module(name)
+import backend.main
+imported = time.perf_counter()
+
+import httpx
+async def first_request():
+    transport = httpx.ASGITransport(app=backend.main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        (await client.get("/")).raise_for_status()
+asyncio.run(first_request())
+served = time.perf_counter()
+
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "first_request_ms": (served - imported) * 1000,
+    "heavy_loaded": [m for m in sys.argv[1].split(",") if m in sys.modules],
+}))
+"""
+
+
+def _run(eager: bool):
+    env = dict(os.environ, PYTHONPATH=ROOT, SUPABASE_URL=os.environ.get("SUPABASE_URL", "http://127.0.0.1:9"),
+               SUPABASE_SERVICE_ROLE_KEY=os.environ.get("SUPABASE_SERVICE_ROLE_KEY", "bench"))
+    if eager:
+        env["BENCH_EAGER"] = "1"
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", PROBE, ",".join(HEAVY_MODULES)], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["cold_start_ms"] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def _summary(name, runs):
+    median = lambda key: round(statistics.median(r[key] for r in runs), 1)
+    return {
+        "variant": name,
+        "runs": len(runs),
+        "import_ms": median("import_ms"),
+        "first_request_ms": median("first_request_ms"),
+        "cold_start_ms": median("cold_start_ms"),
+        "heavy_loaded_at_startup": runs[0]["heavy_loaded"],
+    }
+
+
+def main(runs, max_import_ms):
+    lazy = _summary("lazy", [_run(eager=False) for _ in range(runs)])
+    eager = _summary("eager", [_run(eager=True) for _ in range(runs)])
+    checks = {
+        "no heavy module imported at startup": not lazy["heavy_loaded_at_startup"],
+        f"median import under {max_import_ms:.0f} ms": lazy["import_ms"] <= max_import_ms,
+    }
+    report = {
+        "benchmark": "startup",
+        "results": [lazy, eager],
+        "cold_start_speedup": round(eager["cold_start_ms"] / lazy["cold_start_ms"], 2),
+        "checks": checks,
+    }
+    return report, all(checks.values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-import-ms", type=float, default=2000)
+    args = parser.parse_args()
+    report, passed = main(args.runs, args.max_import_ms)
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if passed else 1)
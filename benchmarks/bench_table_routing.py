@@ -0,0 +1,98 @@
+"""
+Table routing micro-benchmark.
+
+Compares the per-request rapidfuzz scan that analyze used to run with the
+precomputed RoutingIndex, on synthetic catalogs of growing size. Index
+routing time should stay roughly flat; the scan grows with the table count.
+
+Usage: python benchmarks/bench_table_routing.py [--sizes 6,50,200,500]
+"""
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rapidfuzz import process, fuzz
+from core.table_router import RoutingIndex
+
+BASE_TABLES = ["subscribers", "orders", "products", "woocommerce", "users", "profiles"]
+COMMON_COLUMNS = ["status", "email", "name", "amount", "total", "region", "country", "updated_at", "user_id", "price", "quantity", "plan", "currency", "notes"]
+QUESTIONS = [
+    "how many active subscribers",
+    "how many sers signed up this week",
+    "show subs with status paused",
+    "total revenue by region for orderz",
+    "list the newest customers",
+]
+
+
+def legacy_route(q_lower: str, possible_tables: list, used_table: str = "profiles"):
+    """The scan analyze ran before the routing index (exact pass + fuzzy passes)"""
+    for t in possible_tables:
+        if t in q_lower:
+            return t
+    best_match = process.extractOne(q_lower, possible_tables, scorer=fuzz.partial_ratio)
+    if best_match and best_match[1] > 70:
+        words = q_lower.split()
+        highest_score = 0
+        best_table = used_table
+        for t in possible_tables:
+            match = process.extractOne(t, words, scorer=fuzz.ratio)
+            if match and match[1] > highest_score:
+                highest_score = match[1]
+                best_table = t
+        if highest_score > 60:
+            return best_table
+    return used_table
+
+
+def synthetic_catalog(size: int, rng: random.Random):
+    names = list(BASE_TABLES)
+    while len(names) < size:
+        names.append("_".join("".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9))) for _ in range(rng.randint(1, 2))))
+    # Realistic schemas: mostly shared column names plus a few table specific ones
+    return {
+        name: [{"name": col, "type": "text"} for col in ["id", "created_at"] + rng.sample(COMMON_COLUMNS, 5) + [f"{name.split('_')[0]}_{suffix}" for suffix in ("id", "ref")]]
+        for name in names
+    }
+
+
+def _time_per_call(fn, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for q in QUESTIONS:
+            fn(q)
+    return (time.perf_counter() - start) / (repeat * len(QUESTIONS)) * 1e6
+
+
+def main(sizes, repeat):
+    rng = random.Random(42)
+    results = []
+    for size in sizes:
+        catalog = synthetic_catalog(size, rng)
+        tables = list(catalog)
+
+        build_start = time.perf_counter()
+        index = RoutingIndex(catalog)
+        build_ms = (time.perf_counter() - build_start) * 1e3
+
+        results.append({
+            "tables": size,
+            "index_build_ms": round(build_ms, 3),
+            "index_route_us": round(_time_per_call(lambda q: index.route(q), repeat), 2),
+            "legacy_route_us": round(_time_per_call(lambda q: legacy_route(q, tables), repeat), 2),
+        })
+    print(json.dumps({"benchmark": "table_routing", "questions": len(QUESTIONS), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="6,50,200,500")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    main([int(x) for x in args.sizes.split(",")], args.repeat)
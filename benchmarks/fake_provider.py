@@ -0,0 +1,151 @@
+"""
+Local stand-in for an OpenAI-compatible chat completions API.
+
+Streams a fixed number of tokens per request with a configurable delay so
+gateway concurrency can be measured without touching a real provider.
+Only the standard library is used so it runs anywhere the backend runs.
+
+mode="fail" answers every request with HTTP 500 and mode="hang" accepts the
+request but never answers, for failover and circuit breaker runs.
+first_token_delay holds back the first token (a slow but healthy provider).
+reply(payload), if given, supplies the text of non-streamed replies (e.g. a
+JSON query plan for planner prompts).
+"""
+import asyncio
+import json
+import time
+
+
+class FakeProvider:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, tokens: int = 20, token_delay: float = 0.01, mode: str = "ok", first_token_delay: float = 0.0, reply=None):
+        self.host = host
+        self.port = port
+        self.tokens = tokens
+        self.token_delay = token_delay
+        self.mode = mode
+        self.first_token_delay = first_token_delay
+        self.reply = reply
+        self.requests = 0
+        self._server = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode().partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            payload = json.loads(body or b"{}")
+            self.requests += 1
+
+            if self.mode == "hang":
+                # Hold the connection open until the client gives up
+                await reader.read()
+                return
+            if self.mode == "fail":
+                await self._fail(writer)
+                return
+            await asyncio.sleep(self.first_token_delay)
+            if payload.get("stream"):
+                await self._stream(writer, payload)
+            else:
+                await self._complete(writer, payload)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # Server shut down while a slow or hanging response was pending
+            pass
+        finally:
+            writer.close()
+
+    async def _fail(self, writer):
+        body = json.dumps({"error": {"message": "fake provider failure", "type": "server_error", "code": 500}}).encode()
+        writer.write(
+            b"HTTP/1.1 500 Internal Server Error\r\n"
+            b"Content-Type: application/json\r\n"
+            + f"Content-Length: {len(body)}\r\n".encode()
+            + b"Connection: close\r\n\r\n"
+            + body
+        )
+        await writer.drain()
+
+    def _chunk(self, payload, content):
+        return {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": payload.get("model", "fake"),
+            "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}],
+        }
+
+    async def _stream(self, writer, payload):
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Connection: close\r\n\r\n"
+        )
+        for i in range(self.tokens):
+            await asyncio.sleep(self.token_delay)
+            writer.write(f"data: {json.dumps(self._chunk(payload, f'tok{i} '))}\n\n".encode())
+            await writer.drain()
+        writer.write(b"data: [DONE]\n\n")
+        await writer.drain()
+
+    async def _complete(self, writer, payload):
+        await asyncio.sleep(self.token_delay * self.tokens)
+        body = json.dumps({
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": self.reply(payload) if self.reply else " ".join(f"tok{i}" for i in range(self.tokens))},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 1, "completion_tokens": self.tokens, "total_tokens": self.tokens + 1},
+        }).encode()
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: application/json\r\n"
+            + f"Content-Length: {len(body)}\r\n".encode()
+            + b"Connection: close\r\n\r\n"
+            + body
+        )
+        await writer.drain()
+
+
+if __name__ == "__main__":
+    async def _serve():
+        async with FakeProvider(port=8765) as provider:
+            print(f"Fake provider listening on {provider.base_url}")
+            await asyncio.Event().wait()
+
+    asyncio.run(_serve())
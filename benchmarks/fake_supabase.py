@@ -0,0 +1,241 @@
+"""
+Local stand-in for a Supabase project: PostgREST (tables, counts, the
+query_aggregate RPC, the OpenAPI schema) and the Auth user endpoint.
+
+Serves generated rows for a few tables with a configurable per-request
+latency so the data-access path can be load tested without the live project.
+Auth accepts any well-formed JWT and returns its 'sub' as the user id (the
+backend verifies HS256 tokens locally when SUPABASE_JWT_SECRET is set, so
+this is only hit by the remote fallback). Connections are kept alive like
+the real API. Only the standard library is used.
+"""
+import asyncio
+import base64
+import json
+import re
+import uuid
+from urllib.parse import parse_qsl, urlsplit
+
+STATUSES = ("active", "cancelled", "paused", "trial")
+
+
+def generate_tables(rows: int = 2000):
+    return {
+        "orders": [
+            {"id": i, "status": STATUSES[i % 4], "amount": round(5 + (i * 37 % 500) / 3, 2), "customer": f"customer{i % 97}", "created_at": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}"}
+            for i in range(rows)
+        ],
+        "subscribers": [
+            {"id": i, "email": f"user{i}@example.com", "status": STATUSES[i % 3], "plan": ("basic", "pro", "team")[i % 3], "created_at": f"2024-{i % 12 + 1:02d}-01"}
+            for i in range(rows)
+        ],
+        "products": [
+            {"id": i, "name": f"Product {i}", "price": round(1 + i % 90 * 1.5, 2), "stock": i * 7 % 120}
+            for i in range(max(1, rows // 10))
+        ],
+        # Nobody has a BYOK key, so the backend uses the global provider keys
+        "user_api_keys": [],
+    }
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _matches(row: dict, column: str, op: str, value: str):
+    cell = row.get(column)
+    if op == "is":
+        return {"null": cell is None, "true": cell is True, "false": cell is False}.get(value, False)
+    if op == "ilike":
+        pattern = "^" + ".*".join(re.escape(part) for part in re.split(r"[*%]", value)) + "$"
+        return cell is not None and re.match(pattern, str(cell), re.IGNORECASE) is not None
+    left, right = _number(cell), _number(value)
+    if left is None or right is None:
+        left, right = str(cell), value
+    return {
+        "eq": left == right, "neq": left != right,
+        "gt": left > right, "gte": left >= right,
+        "lt": left < right, "lte": left <= right,
+    }.get(op, False)
+
+
+def _filter(rows: list, filters: list):
+    """filters: (column, op, value) triples"""
+    return [r for r in rows if all(_matches(r, c, op, v) for c, op, v in filters)]
+
+
+def _aggregate(rows: list, func: str, column: str):
+    if func == "count":
+        return len(rows)
+    values = [v for v in (_number(r.get(column)) for r in rows) if v is not None]
+    if not values:
+        return None
+    return {"sum": sum(values), "avg": sum(values) / len(values), "min": min(values), "max": max(values)}[func]
+
+
+def _is_uuid(value: str):
+    try:
+        uuid.UUID(value)
+        return True
+    except ValueError:
+        return False
+
+
+def _claims(token: str):
+    try:
+        payload = token.split(".")[1]
+        return json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+    except Exception:
+        return None
+
+
+class FakeSupabase:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, rows: int = 2000, latency: float = 0.005):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.tables = generate_tables(rows)
+        self.requests = 0
+        self._server = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            # Keep-alive: serve requests on this connection until the client closes it
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                method, target, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                self.requests += 1
+                await asyncio.sleep(self.latency)
+                status, payload, extra = self._route(method, target, headers, body)
+                data = b"" if payload is None else json.dumps(payload).encode()
+                head = f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                head += "".join(f"{k}: {v}\r\n" for k, v in extra.items())
+                writer.write(head.encode() + b"\r\n" + (b"" if method == "HEAD" else data))
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            pass
+        finally:
+            writer.close()
+
+    def _route(self, method: str, target: str, headers: dict, body: bytes):
+        url = urlsplit(target)
+        path = url.path.rstrip("/")
+        params = parse_qsl(url.query, keep_blank_values=True)
+
+        if path == "/auth/v1/user":
+            claims = _claims(headers.get("authorization", "").replace("Bearer ", ""))
+            if not claims or not claims.get("sub"):
+                return 401, {"msg": "invalid JWT"}, {}
+            return 200, {"id": claims["sub"], "email": f"{claims['sub']}@example.com", "role": "authenticated"}, {}
+        if path == "/auth/v1/.well-known/jwks.json":
+            return 200, {"keys": []}, {}
+        if path == "/rest/v1":
+            return 200, self._openapi(), {}
+        if path == "/rest/v1/rpc/query_aggregate" and method == "POST":
+            return self._rpc_aggregate(json.loads(body or b"{}"))
+
+        match = re.fullmatch(r"/rest/v1/(\w+)", path)
+        if not match:
+            return 404, {"message": "not found"}, {}
+        table = match.group(1)
+        if table not in self.tables:
+            return 404, {"code": "PGRST205", "message": f"Could not find the table 'public.{table}' in the schema cache"}, {}
+
+        filters, order, limit = [], None, None
+        for key, value in params:
+            if key == "order":
+                column, _, direction = value.partition(".")
+                order = (column, direction == "desc")
+            elif key == "limit":
+                limit = int(value)
+            elif key != "select":
+                op, _, operand = value.partition(".")
+                filters.append((key, op, operand))
+        # user_api_keys.user_id is a uuid column, like in database/schema.sql
+        for column, op, operand in filters:
+            if table == "user_api_keys" and column == "user_id" and not _is_uuid(operand):
+                return 400, {"code": "22P02", "message": f'invalid input syntax for type uuid: "{operand}"'}, {}
+        rows = _filter(self.tables[table], filters)
+        if method == "HEAD":
+            return 200, None, {"Content-Range": f"0-{max(0, len(rows) - 1)}/{len(rows)}" if rows else "*/0"}
+        if order:
+            rows = sorted(rows, key=lambda r: (r.get(order[0]) is None, r.get(order[0])), reverse=order[1])
+        return 200, rows[:limit] if limit else rows, {}
+
+    def _rpc_aggregate(self, args: dict):
+        table = args.get("p_table")
+        if table not in self.tables:
+            return 400, {"message": f'relation "{table}" does not exist'}, {}
+        filters = [(f["column"], f["op"], str(f["value"]).lower() if f["op"] == "is" else str(f["value"])) for f in args.get("p_filters") or []]
+        rows = _filter(self.tables[table], filters)
+        func, column = args["p_func"], args.get("p_column")
+        group_by = args.get("p_group_by") or []
+        if not group_by:
+            return 200, [{"value": _aggregate(rows, func, column)}], {}
+        groups = {}
+        for row in rows:
+            groups.setdefault(tuple(row.get(g) for g in group_by), []).append(row)
+        result = [dict(zip(group_by, key), value=_aggregate(members, func, column)) for key, members in groups.items()]
+        result.sort(key=lambda r: (r["value"] is None, r["value"] or 0), reverse=args.get("p_order_desc", True))
+        return 200, result[:args.get("p_limit") or 50], {}
+
+    def _openapi(self):
+        def column_type(value):
+            if isinstance(value, bool):
+                return {"type": "boolean"}
+            if isinstance(value, int):
+                return {"type": "integer", "format": "bigint"}
+            if isinstance(value, float):
+                return {"type": "number", "format": "numeric"}
+            return {"type": "string", "format": "text"}
+
+        return {"definitions": {
+            table: {"properties": {column: column_type(value) for column, value in rows[0].items()}}
+            for table, rows in self.tables.items() if rows
+        }}
+
+
+if __name__ == "__main__":
+    async def _serve():
+        async with FakeSupabase(port=8766) as supabase:
+            print(f"Fake Supabase listening on {supabase.url}")
+            await asyncio.Event().wait()
+
+    asyncio.run(_serve())
@@ -1,26 +1,80 @@
-import google.generativeai as genai
-from openai import OpenAI
+import asyncio
+import time
+import uuid
+from core.client_pool import get_gemini_model, get_openai_client
 from core.config_manager import config
-from core.supabase_client import supabase
+from core.db import db
+from core.lazy_imports import lazy_import
+from core.provider_health import provider_health
+from core.telemetry import span
+from core.ttl_cache import TTLCache, MISSING
 from datetime import datetime
 
+# Sync client, only for the sync run_ai path
+supabase_client = lazy_import("core.supabase_client")
+
+OPENROUTER_BASE_URL = config.get("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+
+# Async gateway: seconds to wait for a provider's first token (or full non-streamed reply)
+PROVIDER_TIMEOUT = float(config.get("PROVIDER_TIMEOUT", "30"))
+# Start the fallback if the primary has not produced a token after this many ms (0 = no hedging)
+HEDGE_AFTER_MS = float(config.get("HEDGE_AFTER_MS", "0"))
+# Health/circuit name of the OpenRouter free fallback
+FALLBACK_PROVIDER = "openrouter-fallback"
+
+# BYOK key row (user_api_keys.provider) used by each gateway provider
+KEY_PROVIDERS = {"gemini": "gemini", "openai": "openrouter", "openrouter": "openrouter"}
+
+# Failures come back from run_ai/arun_ai as text starting with one of these
+ERROR_PREFIXES = ("AI Error", "AI Critical Error")
+
+def is_error_reply(reply):
+    return isinstance(reply, str) and reply.startswith(ERROR_PREFIXES)
+
+# BYOK key cache: (user_id, provider) -> key, or None when the user has no key (negative entry).
+# Keys are written to user_api_keys directly in Supabase, not through this backend, so a saved
+# or rotated key is picked up when its entry expires (or at once via POST /ai/keys/invalidate).
+key_cache = TTLCache(
+    maxsize=int(config.get("KEY_CACHE_SIZE", "10000")),
+    ttl=float(config.get("KEY_CACHE_TTL", "60")),
+)
+
+def _is_user_id(user_id):
+    """user_api_keys.user_id is a uuid; anything else ("anonymous") can't have a key"""
+    try:
+        uuid.UUID(str(user_id))
+        return True
+    except ValueError:
+        return False
+
 def get_user_key(user_id: str, provider: str):
+    if not _is_user_id(user_id):
+        return None
+    cached = key_cache.get((user_id, provider))
+    if cached is not MISSING:
+        return cached
+
     # Supabase client is guaranteed to be valid by core.supabase_client
     try:
-        response = supabase.table("user_api_keys").select("encrypted_key").eq("user_id", user_id).eq("provider", provider).execute()
-        if response.data:
-            return response.data[0]["encrypted_key"] 
+        response = supabase_client.supabase.table("user_api_keys").select("encrypted_key").eq("user_id", user_id).eq("provider", provider).execute()
+        key = response.data[0]["encrypted_key"] if response.data else None
+        key_cache.set((user_id, provider), key)
+        return key
     except Exception as e:
+        # Lookup errors are not cached, the next call retries
         print(f"Error fetching user key: {e}")
-        pass
     return None
 
+def invalidate_user_key(user_id: str, provider: str = None):
+    """Call after a user saves, rotates or deletes a key. provider=None drops all of the user's keys."""
+    if provider:
+        key_cache.invalidate((user_id, provider))
+    else:
+        key_cache.invalidate_where(lambda k: k[0] == user_id)
+
 def _run_openrouter(api_key: str, messages: list, model: str = "openrouter/free", temperature: float = 0.7, stream: bool = False):
     """Internal helper to run OpenRouter"""
-    client = OpenAI(
-        api_key=api_key, 
-        base_url="https://openrouter.ai/api/v1"
-    )
+    client = get_openai_client(api_key, OPENROUTER_BASE_URL, is_async=False)
     
     # Check if model supports reasoning (some free models might)
     extra_body = {}
@@ -58,18 +112,14 @@ def run_ai(user_id: str, messages: list, provider: str = "gemini", model: str =
             api_key = get_user_key(user_id, "gemini") or config.get("GLOBAL_GEMINI_KEY")
             if not api_key: raise Exception("Missing Gemini Key")
 
-            genai.configure(api_key=api_key)
             # Use 'gemini-1.5-flash' for speed
             model_name = model or "gemini-1.5-flash"
             
-            # Enable Google Search Tool (Grounding) if available in this library version
-            # Note: Explicit 'tools' config is safer.
-            tools = [{"google_search": {}}]
-            
-            gemini_model = genai.GenerativeModel(model_name, tools=tools)
+            # Pooled per (key, model); Google Search grounding is enabled in the pool factory
+            gemini_model = get_gemini_model(api_key, model_name, is_async=False)
             
             # Simple conversion for Gemini
-            # If image_data is provided (PIL Image), we construct a multi-modal prompt
+            # If image_data is provided (PIL Image or {"mime_type", "data"} blob), we construct a multi-modal prompt
             
             full_prompt = []
             
@@ -105,7 +155,7 @@ def run_ai(user_id: str, messages: list, provider: str = "gemini", model: str =
                 return _run_openrouter(api_key, messages, model or "openrouter/free", temperature, stream)
             else:
                 # Standard OpenAI
-                client = OpenAI(api_key=api_key)
+                client = get_openai_client(api_key, is_async=False)
                 response = client.chat.completions.create(
                     model=model or "gpt-3.5-turbo",
                     messages=messages,
@@ -130,3 +180,266 @@ def run_ai(user_id: str, messages: list, provider: str = "gemini", model: str =
                 return f"AI Error: Primary failed ({e}) and no OpenRouter fallback key available."
         except Exception as fallback_error:
             return f"AI Critical Error: Primary ({e}) and Fallback ({fallback_error}) both failed."
+
+
+# --- Async Gateway ---
+# Same routing and fallback as run_ai, but every provider call is awaited so a slow
+# stream never blocks the event loop. When stream=True the result is an async
+# generator of plain text chunks (provider specific chunk objects are unwrapped here).
+
+def _openrouter_system_message():
+    return {"role": "system", "content": f"You are a professional AI assistant. Today is {datetime.now().strftime('%Y-%m-%d %H:%M')}. Answer concisely and use Markdown for formatting. Do NOT ask for clarification on typos or vague queries; infer the user's intent and provide the best possible answer immediately."}
+
+def _build_gemini_prompt(messages: list, image_data=None):
+    current_time = datetime.now().strftime("%Y-%m-%d %H:%M")
+    full_prompt = [f"System: You are the Central AI Hub Assistant. Today is {current_time}. Your goal is to be helpful, professional, and concise. When analyzing data, provide clear summaries and use Markdown tables. Always format lists properly. Do NOT ask for clarification on typos or vague queries; infer the user's intent and provide the best possible answer immediately."]
+    for m in messages:
+        full_prompt.append(f"{m['role']}: {m['content']}")
+    if image_data:
+        full_prompt.append(image_data)
+    return full_prompt
+
+async def _iter_gemini_stream(response):
+    async for chunk in response:
+        try:
+            text = chunk.text
+        except ValueError:
+            # Chunks without text parts (e.g. safety or grounding metadata only)
+            continue
+        if text:
+            yield text
+
+async def _iter_openai_stream(response):
+    async for chunk in response:
+        if chunk.choices:
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+async def aget_user_key(user_id: str, provider: str):
+    """get_user_key over the async data-access layer (core/db.py); shares key_cache with it"""
+    if not _is_user_id(user_id):
+        # PostgREST would answer 400 (22P02), which is not cached: skip the round trip
+        return None
+    cached = key_cache.get((user_id, provider))
+    if cached is not MISSING:
+        return cached
+
+    try:
+        with span("key_lookup"):
+            rows = await db.select("user_api_keys", [
+                {"column": "user_id", "op": "eq", "value": user_id},
+                {"column": "provider", "op": "eq", "value": provider},
+            ], columns="encrypted_key", limit=1)
+        key = rows[0]["encrypted_key"] if rows else None
+        key_cache.set((user_id, provider), key)
+        return key
+    except Exception as e:
+        # Lookup errors are not cached, the next call retries
+        print(f"Error fetching user key: {e}")
+    return None
+
+async def _arun_openrouter(api_key: str, messages: list, model: str = "openrouter/free", temperature: float = 0.7, stream: bool = False):
+    """Internal helper to run OpenRouter without blocking the event loop"""
+    client = get_openai_client(api_key, OPENROUTER_BASE_URL)
+
+    extra_body = {}
+    if "free" in model or "reasoning" in model:
+        extra_body = {"reasoning": {"enabled": True}}
+
+    if not any(m['role'] == 'system' for m in messages):
+        messages = [_openrouter_system_message()] + messages
+
+    response = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        extra_body=extra_body,
+        stream=stream
+    )
+
+    if stream:
+        return _iter_openai_stream(response)
+
+    return response.choices[0].message.content
+
+class CircuitOpenError(Exception):
+    """Provider skipped because its circuit breaker is open"""
+
+class HedgeFailed(Exception):
+    """Both sides of a hedged request failed"""
+
+    def __init__(self, primary_error, fallback_error):
+        super().__init__(str(primary_error))
+        self.primary_error = primary_error
+        self.fallback_error = fallback_error
+
+class MissingKeyError(Exception):
+    """No key configured for the provider; a setup problem, not a provider outage"""
+
+def _is_provider_fault(error: Exception):
+    """Whether an error says something about the provider's health (timeouts, 5xx, 429, connection)"""
+    if isinstance(error, MissingKeyError):
+        return False
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if isinstance(status, int) and 400 <= status < 500 and status not in (408, 429):
+        # Bad request, invalid key, unknown model: this caller's problem, not the provider's
+        return False
+    return True
+
+async def _prepend(first, stream, health):
+    if first is not None:
+        yield first
+    try:
+        async for text in stream:
+            yield text
+    except Exception as e:
+        health.record_failure(e)
+        raise
+
+async def _until_first_token(call, stream: bool, health):
+    """Await the call, and for streams its first chunk, so success means 'the provider is answering'"""
+    result = await call()
+    if not stream:
+        return result
+    try:
+        first = await result.__anext__()
+    except StopAsyncIteration:
+        first = None
+    return _prepend(first, result, health)
+
+async def _attempt(name: str, call, health, stream: bool):
+    """
+    One provider call with health tracking and the first-token timeout.
+    Latency recorded is the time to the first token (streams) or to the full reply.
+    """
+    start = time.monotonic()
+    try:
+        result = await asyncio.wait_for(_until_first_token(call, stream, health), PROVIDER_TIMEOUT)
+    except asyncio.CancelledError:
+        # Lost a hedge race: no outcome to record
+        health.release()
+        raise
+    except asyncio.TimeoutError:
+        health.record_failure(f"no response within {PROVIDER_TIMEOUT:g}s")
+        raise TimeoutError(f"{name} did not respond within {PROVIDER_TIMEOUT:g}s")
+    except Exception as e:
+        if _is_provider_fault(e):
+            health.record_failure(e)
+        else:
+            health.release()
+        raise
+    health.record_success(time.monotonic() - start)
+    return result
+
+async def _discard(task: asyncio.Task):
+    """Cancel a hedge loser, closing its stream if it already produced one"""
+    task.cancel()
+    try:
+        result = await task
+    except BaseException:
+        return
+    if hasattr(result, "aclose"):
+        await result.aclose()
+
+async def _hedged(primary: tuple, fallback: tuple, stream: bool, hedge_after: float):
+    """
+    Start the primary; if it has not produced its first token after hedge_after seconds,
+    start the fallback too and use whichever answers first. A primary that fails before
+    the hedge delay raises as usual; HedgeFailed means both sides of the race failed.
+    """
+    primary_task = asyncio.create_task(_attempt(*primary, stream))
+    done, _ = await asyncio.wait({primary_task}, timeout=hedge_after)
+    if done:
+        return primary_task.result()
+
+    print(f"Hedging: {primary[0]} has not answered after {hedge_after * 1000:.0f} ms, starting {fallback[0]}")
+    fallback_task = asyncio.create_task(_attempt(*fallback, stream))
+    pending = {primary_task, fallback_task}
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is None:
+                for other in pending:
+                    await _discard(other)
+                return task.result()
+    raise HedgeFailed(primary_task.exception(), fallback_task.exception())
+
+async def arun_ai(user_id: str, messages: list, provider: str = "gemini", model: str = None, temperature: float = 0.7, stream: bool = False, image_data=None):
+    """
+    Async version of run_ai.
+    Primary: Gemini -> Fallback: OpenRouter (Free)
+    Returns text, an async generator of text chunks (stream=True), or an error string.
+
+    Providers whose circuit is open are skipped, and with HEDGE_AFTER_MS set a slow
+    primary is raced against the fallback (see core/provider_health.py).
+    """
+    # A user's own key gets its own circuit: one user's rate-limited or revoked key must
+    # not open the shared circuit that everyone on the global key depends on
+    user_key = await aget_user_key(user_id, KEY_PROVIDERS[provider]) if provider in KEY_PROVIDERS else None
+    health = provider_health.get(provider, user_id if user_key else None)
+
+    async def call_primary():
+        if provider == "gemini":
+            api_key = user_key or config.get("GLOBAL_GEMINI_KEY")
+            if not api_key: raise MissingKeyError("Missing Gemini Key")
+
+            gemini_model = get_gemini_model(api_key, model or "gemini-1.5-flash")
+            full_prompt = _build_gemini_prompt(messages, image_data)
+
+            if stream:
+                response = await gemini_model.generate_content_async(full_prompt, stream=True)
+                return _iter_gemini_stream(response)
+
+            response = await gemini_model.generate_content_async(full_prompt)
+            return response.text
+
+        elif provider == "openai" or provider == "openrouter":
+            api_key = user_key or config.get("GLOBAL_OPENAI_KEY")
+            if not api_key: raise MissingKeyError("Missing OpenRouter Key")
+
+            if api_key.startswith("sk-or"):
+                return await _arun_openrouter(api_key, messages, model or "openrouter/free", temperature, stream)
+
+            # Standard OpenAI
+            client = get_openai_client(api_key)
+            response = await client.chat.completions.create(
+                model=model or "gpt-3.5-turbo",
+                messages=messages,
+                temperature=temperature,
+                stream=stream
+            )
+
+            if stream:
+                return _iter_openai_stream(response)
+
+            return response.choices[0].message.content
+
+    fallback_key = config.get("GLOBAL_OPENAI_KEY")
+    fallback = None
+    if fallback_key and fallback_key.startswith("sk-or"):
+        fallback = (FALLBACK_PROVIDER, lambda: _arun_openrouter(fallback_key, messages, "openrouter/free", temperature, stream), provider_health.get(FALLBACK_PROVIDER))
+    primary = (provider, call_primary, health)
+
+    try:
+        if not health.allow():
+            raise CircuitOpenError(f"{provider} circuit is open ({health.last_error})")
+        hedge_after = HEDGE_AFTER_MS / 1000
+        if fallback and hedge_after > 0 and provider_health.get(FALLBACK_PROVIDER).available():
+            return await _hedged(primary, fallback, stream, hedge_after)
+        return await _attempt(*primary, stream)
+
+    except HedgeFailed as e:
+        return f"AI Critical Error: Primary ({e.primary_error}) and Fallback ({e.fallback_error}) both failed."
+
+    except Exception as e:
+        print(f"Primary Provider ({provider}) Failed: {e}. Attempting Fallback to OpenRouter Free...")
+
+        try:
+            if not fallback:
+                return f"AI Error: Primary failed ({e}) and no OpenRouter fallback key available."
+            if not provider_health.get(FALLBACK_PROVIDER).allow():
+                raise CircuitOpenError(f"{FALLBACK_PROVIDER} circuit is open ({provider_health.get(FALLBACK_PROVIDER).last_error})")
+            return await _attempt(*fallback, stream)
+        except Exception as fallback_error:
+            return f"AI Critical Error: Primary ({e}) and Fallback ({fallback_error}) both failed."
@@ -0,0 +1,162 @@
+import asyncio
+import inspect
+import threading
+import time
+from collections import OrderedDict
+import httpx
+from core.config_manager import config
+from core.lazy_imports import lazy_import
+
+# Provider SDKs load on the first call to that provider (each takes ~0.5-1 s to import)
+genai = lazy_import("google.generativeai")
+genai_client = lazy_import("google.generativeai.client")
+openai = lazy_import("openai")
+
+# get_gemini_model uses google.generativeai internals (_ClientManager and the model's
+# _client/_async_client) that exist in this release line only; backend/requirements.txt pins it
+GENAI_VERSIONS = "0.8."
+
+def _check_genai():
+    if not genai.__version__.startswith(GENAI_VERSIONS) or not hasattr(genai_client, "_ClientManager"):
+        raise RuntimeError(f"google-generativeai {genai.__version__} is not supported (per-key clients need {GENAI_VERSIONS}x)")
+
+# Keeps scheduled async closes alive until they finish
+_closing = set()
+
+def _close(client):
+    """Release an evicted client's connections: OpenAI clients close their httpx pool, Gemini models their transport"""
+    if hasattr(client, "close"):
+        pending = [client.close()]
+    else:
+        pending = [c.transport.close() for c in (getattr(client, "_client", None), getattr(client, "_async_client", None)) if c is not None]
+    for result in pending:
+        if not inspect.isawaitable(result):
+            continue
+        try:
+            task = asyncio.get_running_loop().create_task(result)
+        except RuntimeError:
+            # No loop in this thread: the async client's connections go with its loop
+            if inspect.iscoroutine(result):
+                result.close()
+            continue
+        _closing.add(task)
+        task.add_done_callback(_closing.discard)
+
+class ClientPool:
+    """
+    Bounded LRU pool of provider clients with idle eviction.
+    Evicted clients are closed so their connection pools are released right away. Eviction
+    takes the least recently used client, so with more slots than keys in concurrent use
+    a client is not closed under a running request.
+    """
+
+    def __init__(self, maxsize: int = 64, idle_ttl: float = 600.0):
+        self.maxsize = maxsize
+        self.idle_ttl = idle_ttl
+        self.hits = 0
+        self.created = 0
+        self.evicted = 0
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, factory):
+        now = time.monotonic()
+        evicted = []
+        try:
+            with self._lock:
+                evicted += self._evict_idle(now)
+                entry = self._clients.get(key)
+                if entry is not None:
+                    entry[0] = now
+                    self._clients.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+
+                client = factory()
+                self._clients[key] = [now, client]
+                self.created += 1
+                while len(self._clients) > self.maxsize:
+                    evicted.append(self._clients.popitem(last=False)[1][1])
+                    self.evicted += 1
+                return client
+        finally:
+            # Outside the lock: a sync close can wait on its connections
+            self._close_all(evicted)
+
+    def _evict_idle(self, now: float):
+        # Entries are in LRU order, so the idle ones are at the front
+        evicted = []
+        while self._clients:
+            key, (last_used, client) = next(iter(self._clients.items()))
+            if now - last_used < self.idle_ttl:
+                break
+            del self._clients[key]
+            evicted.append(client)
+            self.evicted += 1
+        return evicted
+
+    def _close_all(self, clients):
+        for client in clients:
+            try:
+                _close(client)
+            except Exception as e:
+                print(f"Closing evicted provider client failed: {e}")
+
+    def clear(self):
+        with self._lock:
+            clients = [client for _, client in self._clients.values()]
+            self._clients.clear()
+        self._close_all(clients)
+
+    def stats(self):
+        return {
+            "size": len(self._clients),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "created": self.created,
+            "evicted": self.evicted,
+        }
+
+provider_pool = ClientPool(
+    maxsize=int(config.get("PROVIDER_POOL_SIZE", "64")),
+    idle_ttl=float(config.get("PROVIDER_POOL_IDLE_TTL", "600")),
+)
+
+def _http_limits():
+    return httpx.Limits(
+        max_connections=int(config.get("PROVIDER_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(config.get("PROVIDER_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(config.get("PROVIDER_KEEPALIVE_EXPIRY", "60")),
+    )
+
+def get_openai_client(api_key: str, base_url: str = None, is_async: bool = True):
+    """Shared OpenAI-compatible client (OpenAI or OpenRouter) with keep-alive connections"""
+    # The gateway fails over to the fallback provider itself; SDK retries with backoff
+    # would only delay that, so they are off unless configured
+    max_retries = int(config.get("PROVIDER_MAX_RETRIES", "0"))
+
+    def factory():
+        if is_async:
+            return openai.AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=max_retries, http_client=openai.DefaultAsyncHttpxClient(limits=_http_limits()))
+        return openai.OpenAI(api_key=api_key, base_url=base_url, max_retries=max_retries, http_client=openai.DefaultHttpxClient(limits=_http_limits()))
+
+    return provider_pool.get(("openai", api_key, base_url, is_async), factory)
+
+def get_gemini_model(api_key: str, model_name: str, is_async: bool = True):
+    """
+    Shared GenerativeModel bound to its own API key.
+    Uses a private client manager instead of genai.configure(), which mutates global
+    state and would leak one user's BYOK key into another user's concurrent request.
+    """
+    def factory():
+        _check_genai()
+        manager = genai_client._ClientManager()
+        manager.configure(api_key=api_key)
+        gemini_model = genai.GenerativeModel(model_name, tools=[{"google_search": {}}])
+        if is_async:
+            gemini_model._async_client = manager.get_default_client("generative_async")
+        else:
+            gemini_model._client = manager.get_default_client("generative")
+        return gemini_model
+
+    return provider_pool.get(("gemini", api_key, model_name, is_async), factory)
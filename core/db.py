@@ -0,0 +1,135 @@
+import asyncio
+import re
+import time
+from collections import deque
+import httpx
+from core.config_manager import config
+from core.telemetry import db_request_seconds
+
+# Async data access for the request path: PostgREST (tables, RPC, schema) and Supabase
+# Auth over one pooled httpx client with keep-alive connections, so lookups never block
+# the event loop or a worker thread, and concurrent lookups share warm connections.
+# core/supabase_client.py (sync) remains for scripts and the sync run_ai path.
+SUPABASE_URL = config.get_required("SUPABASE_URL").rstrip("/")
+SUPABASE_KEY = config.get_required("SUPABASE_SERVICE_ROLE_KEY")
+
+DB_MAX_CONNECTIONS = int(config.get("DB_MAX_CONNECTIONS", "20"))
+DB_MAX_KEEPALIVE = int(config.get("DB_MAX_KEEPALIVE", "10"))
+DB_KEEPALIVE_EXPIRY = float(config.get("DB_KEEPALIVE_EXPIRY", "30"))
+DB_TIMEOUT = float(config.get("DB_TIMEOUT", "10"))
+DB_CONNECT_TIMEOUT = float(config.get("DB_CONNECT_TIMEOUT", "5"))
+
+# Table and function names go into the URL path; anything else (e.g. "../") is refused
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# Latencies kept per operation for the percentiles in stats()
+LATENCY_WINDOW = 512
+
+class DatabaseError(Exception):
+    """Non-2xx response from PostgREST or Auth. str() includes the PostgREST error code (e.g. PGRST205)."""
+
+    def __init__(self, status_code: int, body: str):
+        super().__init__(f"{status_code}: {body}")
+        self.status_code = status_code
+        self.body = body
+
+def _identifier(name: str):
+    if not isinstance(name, str) or not _IDENTIFIER.match(name):
+        raise ValueError(f"Invalid table or function name: {name!r}")
+    return name
+
+class _Metric:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def stats(self):
+        ordered = sorted(self.latencies)
+        pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 1) if ordered else None
+        return {"calls": self.calls, "errors": self.errors, "p50_ms": pick(0.5), "p95_ms": pick(0.95), "max_ms": pick(1.0)}
+
+def _filter_params(filters: list):
+    """PostgREST filter query params, e.g. status=ilike.active, deleted_at=is.null"""
+    params = []
+    for f in filters:
+        value = str(f["value"])
+        if f["op"] == "is":
+            # 'is' only accepts null / true / false
+            value = "null" if value.lower() in ("null", "none") else value.lower()
+        params.append((f["column"], f"{f['op']}.{value}"))
+    return params
+
+class Database:
+    def __init__(self, url: str = SUPABASE_URL, key: str = SUPABASE_KEY):
+        self.url = url
+        self.key = key
+        self.metrics = {}
+        self._client = None
+        self._client_loop = None
+
+    def client(self):
+        # httpx connections belong to the event loop that opened them
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                base_url=self.url,
+                headers={"apikey": self.key, "Authorization": f"Bearer {self.key}"},
+                limits=httpx.Limits(max_connections=DB_MAX_CONNECTIONS, max_keepalive_connections=DB_MAX_KEEPALIVE, keepalive_expiry=DB_KEEPALIVE_EXPIRY),
+                timeout=httpx.Timeout(DB_TIMEOUT, connect=DB_CONNECT_TIMEOUT),
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def _request(self, operation: str, method: str, path: str, **kwargs):
+        metric = self.metrics.setdefault(operation, _Metric())
+        metric.calls += 1
+        start = time.perf_counter()
+        try:
+            res = await self.client().request(method, path, **kwargs)
+            if res.status_code >= 400:
+                raise DatabaseError(res.status_code, res.text)
+            return res
+        except Exception:
+            metric.errors += 1
+            raise
+        finally:
+            metric.latencies.append(time.perf_counter() - start)
+            db_request_seconds.observe(metric.latencies[-1], operation=operation)
+
+    async def select(self, table: str, filters: list = (), columns: str = "*", order_by: dict = None, limit: int = None):
+        params = [("select", columns)] + _filter_params(filters)
+        if order_by:
+            params.append(("order", f"{order_by['column']}.{'desc' if order_by['desc'] else 'asc'}"))
+        if limit:
+            params.append(("limit", str(limit)))
+        res = await self._request(f"select:{table}", "GET", f"/rest/v1/{_identifier(table)}", params=params)
+        return res.json()
+
+    async def count(self, table: str, filters: list = ()):
+        """Exact row count computed by PostgREST; no rows are transferred"""
+        res = await self._request(f"count:{table}", "HEAD", f"/rest/v1/{_identifier(table)}", params=[("select", "*")] + _filter_params(filters), headers={"Prefer": "count=exact"})
+        # Content-Range: 0-24/3573 (or */0 when empty)
+        return int(res.headers.get("content-range", "*/0").rsplit("/", 1)[-1])
+
+    async def rpc(self, function: str, params: dict):
+        res = await self._request(f"rpc:{function}", "POST", f"/rest/v1/rpc/{_identifier(function)}", json=params)
+        return res.json() if res.content else None
+
+    async def openapi(self):
+        """The PostgREST OpenAPI document (tables, columns and types of the exposed schema)"""
+        res = await self._request("openapi", "GET", "/rest/v1/", headers={"Accept": "application/openapi+json"})
+        return res.json()
+
+    async def get_user(self, token: str):
+        """Supabase Auth user for an access token; raises DatabaseError(401) if it is invalid"""
+        res = await self._request("auth:user", "GET", "/auth/v1/user", headers={"Authorization": f"Bearer {token}"})
+        return res.json()
+
+    def stats(self):
+        return {
+            "pool": {"max_connections": DB_MAX_CONNECTIONS, "max_keepalive": DB_MAX_KEEPALIVE, "timeout_s": DB_TIMEOUT},
+            "queries": {operation: metric.stats() for operation, metric in sorted(self.metrics.items())},
+        }
+
+db = Database()
@@ -0,0 +1,54 @@
+import importlib
+import threading
+import time
+
+# Heavy optional libraries (provider SDKs, file-format parsers) are imported the first
+# time they are used instead of when the app starts. On Vercel every cold start imports
+# backend/main.py; a plain text question should not pay for pandas, PyPDF2 or an SDK it
+# never calls.
+#
+#   pd = lazy_import("pandas")      # nothing imported yet
+#   pd.read_csv(...)                # first attribute access imports pandas
+#
+# Annotations that name lazy types must be strings ("pd.DataFrame"), or the import
+# happens at definition time. benchmarks/bench_startup.py fails if one of these modules
+# is imported at startup again.
+
+_registry = {}
+_lock = threading.Lock()
+
+class LazyModule:
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._load_seconds = None
+
+    def _load(self):
+        # The interpreter's import lock makes concurrent first uses safe
+        start = time.perf_counter()
+        module = importlib.import_module(self._name)
+        if self._module is None:
+            self._load_seconds = time.perf_counter() - start
+            self._module = module
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._module or self._load(), attr)
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r} ({'loaded' if self._module else 'not loaded'})>"
+
+def lazy_import(name: str):
+    """Shared proxy for a module that is imported on first attribute access"""
+    with _lock:
+        module = _registry.get(name)
+        if module is None:
+            module = _registry[name] = LazyModule(name)
+        return module
+
+def import_stats():
+    """Which lazy modules this process has loaded, and how long each import took"""
+    return {
+        name: {"loaded": module._module is not None, "import_ms": round(module._load_seconds * 1000, 1) if module._load_seconds else None}
+        for name, module in sorted(_registry.items())
+    }
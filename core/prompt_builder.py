@@ -0,0 +1,120 @@
+from core.config_manager import config
+
+# Prompt assembly under a token budget. Query results are encoded as a compact table
+# (header once, then one line per row) instead of JSON objects that repeat every column
+# name on every row, and each prompt section gets a share of the budget. Sections that
+# need less than their share give the rest to the others.
+PROMPT_TOKEN_BUDGET = int(config.get("PROMPT_TOKEN_BUDGET", "6000"))
+
+# Token counts are estimated (about 4 characters per token for English and JSON-ish text);
+# Gemini and the OpenRouter models use different tokenizers, so no single one is exact.
+CHARS_PER_TOKEN = 4
+
+# Long cell values are cut to this many characters, then shorter ones if rows still do not fit
+CELL_CHARS = (80, 40, 20)
+
+TRUNCATED_NOTE = "\n...(truncated to fit the prompt budget)"
+
+def count_tokens(text: str):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def truncate_tokens(text: str, max_tokens: int):
+    if count_tokens(text) <= max_tokens:
+        return text
+    keep = max(0, max_tokens * CHARS_PER_TOKEN - len(TRUNCATED_NOTE))
+    return text[:keep] + TRUNCATED_NOTE
+
+def _cell(value, max_chars: int):
+    if value is None:
+        return ""
+    text = " ".join(str(value).split()).replace("|", "/")
+    return text if len(text) <= max_chars else text[:max_chars - 1] + "…"
+
+def encode_rows(rows: list, max_tokens: int = None):
+    """
+    Rows (list of dicts) as a compact table: 'a | b | c' header, then one line per row.
+    Columns empty in every row are dropped and columns with a single value across all
+    rows are stated once above the table. Long values are abbreviated, and rows that do
+    not fit max_tokens are left out with a note saying how many.
+    """
+    if not rows:
+        return "(no rows)"
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+
+    for max_chars in CELL_CHARS:
+        cells = {c: [_cell(row.get(c), max_chars) for row in rows] for c in columns}
+        lines = []
+        empty = [c for c in columns if not any(cells[c])]
+        constant = [c for c in columns if c not in empty and len(rows) > 1 and len(set(cells[c])) == 1]
+        kept = [c for c in columns if c not in empty and c not in constant]
+        if constant:
+            lines.append("Same in every row: " + ", ".join(f"{c}={cells[c][0]}" for c in constant))
+        if empty:
+            lines.append("Empty in every row: " + ", ".join(empty))
+        if kept:
+            lines.append(" | ".join(kept))
+            lines.extend(" | ".join(cells[c][i] for c in kept) for i in range(len(rows)))
+        text = "\n".join(lines)
+        if max_tokens is None or count_tokens(text) <= max_tokens:
+            return text
+
+    if not kept:
+        return truncate_tokens(text, max_tokens)
+
+    # Still too large with the shortest cells: keep as many rows as fit
+    head = len(lines) - len(rows)
+    note = "... {} more rows left out (prompt budget)"
+    used = count_tokens("\n".join(lines[:head])) + count_tokens(note) + 1
+    for i, line in enumerate(lines[head:]):
+        used += count_tokens(line) + 1
+        if used > max_tokens:
+            return "\n".join(lines[:head + i] + [note.format(len(rows) - i)])
+    return "\n".join(lines)
+
+class PromptBuilder:
+    """
+    Collects prompt sections and fits them into a token budget.
+    Fixed sections (instructions, the question) are always kept whole; the rest of the
+    budget is shared by weight, and a section that needs less than its share passes the
+    remainder on. A section's content is a string (truncated if needed) or a function
+    taking a token limit (None = unlimited) that renders itself within it.
+    """
+
+    def __init__(self, budget: int = PROMPT_TOKEN_BUDGET):
+        self.budget = budget
+        self._sections = []
+
+    def add(self, name: str, content, weight: float = 1.0, fixed: bool = False):
+        render = content if callable(content) else (lambda limit, text=content or "": text if limit is None else truncate_tokens(text, limit))
+        self._sections.append({"name": name, "render": render, "weight": weight, "fixed": fixed})
+        return self
+
+    def build(self):
+        """Returns ({section: text}, usage report)"""
+        texts = {s["name"]: s["render"](None) for s in self._sections}
+        full = {name: count_tokens(text) for name, text in texts.items()}
+
+        remaining = self.budget - sum(full[s["name"]] for s in self._sections if s["fixed"])
+        flexible = sorted((s for s in self._sections if not s["fixed"]), key=lambda s: full[s["name"]] / s["weight"])
+        weights = sum(s["weight"] for s in flexible)
+        limits = {}
+        for s in flexible:
+            share = max(0, int(remaining * s["weight"] / weights)) if weights else 0
+            limits[s["name"]] = min(full[s["name"]], share)
+            remaining -= limits[s["name"]]
+            weights -= s["weight"]
+            if full[s["name"]] > share:
+                texts[s["name"]] = s["render"](share)
+
+        used = {name: count_tokens(text) for name, text in texts.items()}
+        report = {
+            "budget": self.budget,
+            "total": sum(used.values()),
+            "sections": {name: {"tokens": used[name], "full": full[name]} for name in texts},
+        }
+        return texts, report
+
+def format_usage(report: dict):
+    """One-line usage summary, e.g. for a response header or the log"""
+    sections = ";".join(f"{name}={s['tokens']}" + (f"/{s['full']}" if s["tokens"] < s["full"] else "") for name, s in report["sections"].items())
+    return f"{sections};total={report['total']}/{report['budget']}"
@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import deque
+from core.config_manager import config
+from core.ttl_cache import TTLCache, MISSING
+
+# Per-provider health: a rolling window of recent calls (error rate, latency percentiles)
+# and a circuit breaker on top. When a provider keeps failing its circuit opens and
+# requests go straight to the fallback instead of waiting for yet another timeout; after
+# a cool-down one probe request is let through, and its outcome closes or re-opens it.
+HEALTH_WINDOW_SECONDS = float(config.get("PROVIDER_HEALTH_WINDOW", "60"))
+CIRCUIT_MIN_CALLS = int(config.get("CIRCUIT_MIN_CALLS", "5"))
+CIRCUIT_ERROR_RATE = float(config.get("CIRCUIT_ERROR_RATE", "0.5"))
+CIRCUIT_CONSECUTIVE_FAILURES = int(config.get("CIRCUIT_CONSECUTIVE_FAILURES", "3"))
+CIRCUIT_OPEN_SECONDS = float(config.get("CIRCUIT_OPEN_SECONDS", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+def _percentile(values: list, q: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class ProviderHealth:
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.consecutive_failures = 0
+        self.last_error = None
+        self._calls = deque()  # (timestamp, ok, latency seconds or None)
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _trim(self, now: float):
+        while self._calls and self._calls[0][0] < now - HEALTH_WINDOW_SECONDS:
+            self._calls.popleft()
+
+    def available(self):
+        """Whether the circuit would let a request through, without claiming the probe slot"""
+        with self._lock:
+            if self.state == OPEN:
+                return time.monotonic() - self.opened_at >= CIRCUIT_OPEN_SECONDS
+            return not (self.state == HALF_OPEN and self._probe_in_flight)
+
+    def allow(self):
+        """Whether a request may use this provider now (claims the probe slot when half-open)"""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= CIRCUIT_OPEN_SECONDS:
+                self.state = HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self, latency: float):
+        with self._lock:
+            now = time.monotonic()
+            self._calls.append((now, True, latency))
+            self._trim(now)
+            self.consecutive_failures = 0
+            if self.state != CLOSED:
+                print(f"Circuit for {self.name} closed")
+                self._calls = deque([(now, True, latency)])
+            self.state = CLOSED
+            self._probe_in_flight = False
+
+    def record_failure(self, error=None):
+        with self._lock:
+            now = time.monotonic()
+            self._calls.append((now, False, None))
+            self._trim(now)
+            self.consecutive_failures += 1
+            self.last_error = str(error) if error is not None else None
+            self._probe_in_flight = False
+            failures = sum(1 for _, ok, _ in self._calls if not ok)
+            tripped = (
+                self.state == HALF_OPEN
+                or self.consecutive_failures >= CIRCUIT_CONSECUTIVE_FAILURES
+                or (len(self._calls) >= CIRCUIT_MIN_CALLS and failures / len(self._calls) >= CIRCUIT_ERROR_RATE)
+            )
+            if tripped and self.state != OPEN:
+                print(f"Circuit for {self.name} opened: {self.last_error}")
+            if tripped:
+                self.state = OPEN
+                self.opened_at = now
+
+    def release(self):
+        """Give back a probe slot that ended without an outcome (e.g. a cancelled hedge)"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def stats(self):
+        with self._lock:
+            self._trim(time.monotonic())
+            calls = list(self._calls)
+            latencies = [latency for _, ok, latency in calls if ok]
+            failures = sum(1 for _, ok, _ in calls if not ok)
+            return {
+                "state": self.state,
+                "calls": len(calls),
+                "error_rate": round(failures / len(calls), 4) if calls else 0.0,
+                "latency_p50_ms": round(_percentile(latencies, 0.5) * 1000, 1) if latencies else None,
+                "latency_p95_ms": round(_percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+                "latency_p99_ms": round(_percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+                "consecutive_failures": self.consecutive_failures,
+                "last_error": self.last_error,
+            }
+
+class HealthRegistry:
+    """
+    Health per provider for calls made with the global keys, and separately per
+    (provider, user) for calls made with a user's own key: a BYOK key that is rate
+    limited or revoked only opens that user's circuit, never the shared one.
+    """
+
+    def __init__(self):
+        self._providers = {}
+        # Idle users' entries expire; a fresh entry is a closed circuit
+        self._user_keys = TTLCache(maxsize=int(config.get("USER_KEY_HEALTH_SIZE", "10000")), ttl=HEALTH_WINDOW_SECONDS + CIRCUIT_OPEN_SECONDS)
+        self._lock = threading.Lock()
+
+    def get(self, name: str, user_id: str = None):
+        with self._lock:
+            if user_id is not None:
+                health = self._user_keys.get((name, user_id))
+                if health is MISSING:
+                    health = ProviderHealth(name)
+                # Sliding expiry while the key is in use
+                self._user_keys.set((name, user_id), health)
+                return health
+            if name not in self._providers:
+                self._providers[name] = ProviderHealth(name)
+            return self._providers[name]
+
+    def reset(self):
+        with self._lock:
+            self._providers.clear()
+            self._user_keys.clear()
+
+    def stats(self):
+        """Shared (global key) health per provider; user-key circuits are only counted, not listed"""
+        with self._lock:
+            providers = list(self._providers.values())
+            user_keys = len(self._user_keys)
+        return {**{p.name: p.stats() for p in providers}, "user_keys_tracked": user_keys}
+
+provider_health = HealthRegistry()
@@ -0,0 +1,154 @@
+import json
+import re
+from core.lazy_imports import lazy_import
+from core.db import db
+
+fuzz = lazy_import("rapidfuzz.fuzz")
+
+# A query plan is a small JSON document the model produces from the question:
+# {
+#   "filters":  [{"column": "status", "op": "ilike", "value": "active"}],
+#   "aggregate": {"func": "count" | "sum" | "avg" | "min" | "max", "column": "amount"} | null,
+#   "group_by": ["region"],
+#   "order_by": {"column": "created_at", "desc": true} | null,
+#   "limit": 20
+# }
+# It is validated against the known columns and executed by Postgres (database tables)
+# or backend/parsing/local_query.py (uploaded files), so only the small result reaches
+# the answering model.
+
+FILTER_OPS = {"eq", "neq", "gt", "gte", "lt", "lte", "ilike", "is"}
+AGGREGATES = {"count", "sum", "avg", "min", "max"}
+MAX_ROWS = 50
+MAX_GROUPS = 200
+
+def build_planner_messages(question: str, table: str, column_types: list, previous: dict = None):
+    """previous: {"question", "plan"} of the last turn on this table, so follow-ups can refine it"""
+    columns = ", ".join(f"{c['name']} ({c['type']})" for c in column_types)
+    follow_up = ""
+    if previous:
+        follow_up = (
+            f"\n        The previous question on this table was \"{previous['question']}\" with plan {json.dumps(previous['plan'])}."
+            f"\n        If the question refers back to it (\"and by region?\", \"only the active ones\"), adjust that plan.\n"
+        )
+    return [{"role": "user", "content": f"""
+        You translate questions about the table '{table}' into a JSON query plan.
+        Columns: {columns}
+
+        Reply with ONLY a JSON object of this shape (no prose, no code fences):
+        {{"filters": [{{"column": "...", "op": "eq|neq|gt|gte|lt|lte|ilike|is", "value": "..."}}],
+          "aggregate": {{"func": "count|sum|avg|min|max", "column": "..."}} or null,
+          "group_by": ["..."],
+          "order_by": {{"column": "...", "desc": true}} or null,
+          "limit": 20}}
+
+        Rules:
+        - Questions like "how many" use aggregate count. Totals use sum, averages avg.
+        - Use "ilike" for text equality so case does not matter. Use "is" only with "null".
+        - Use "group_by" for "by region", "per status" etc. Leave aggregate null to list rows.
+        - Only use the columns listed above.
+{follow_up}
+        QUESTION: "{question}"
+        """}]
+
+def parse_plan(text: str):
+    """Extract the JSON plan from model output. Returns None if there is none."""
+    if not isinstance(text, str):
+        return None
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    if not match:
+        return None
+    try:
+        plan = json.loads(match.group(0))
+    except ValueError:
+        return None
+    return plan if isinstance(plan, dict) else None
+
+def validate_plan(plan: dict, columns: list):
+    """Drop anything that does not reference a known column or a supported operation"""
+    known = set(columns)
+
+    filters = []
+    for f in plan.get("filters") or []:
+        if isinstance(f, dict) and f.get("column") in known and f.get("op") in FILTER_OPS and f.get("value") is not None:
+            filters.append({"column": f["column"], "op": f["op"], "value": str(f["value"])})
+
+    aggregate = None
+    agg = plan.get("aggregate")
+    if isinstance(agg, dict) and agg.get("func") in AGGREGATES:
+        if agg["func"] == "count":
+            aggregate = {"func": "count", "column": None}
+        elif agg.get("column") in known:
+            aggregate = {"func": agg["func"], "column": agg["column"]}
+
+    group_by = [c for c in plan.get("group_by") or [] if c in known] if aggregate else []
+
+    order_by = None
+    order = plan.get("order_by")
+    if isinstance(order, dict) and order.get("column") in known:
+        order_by = {"column": order["column"], "desc": bool(order.get("desc", True))}
+
+    try:
+        limit = int(plan.get("limit") or MAX_ROWS)
+    except (TypeError, ValueError):
+        limit = MAX_ROWS
+    limit = max(1, min(limit, MAX_GROUPS if group_by else MAX_ROWS))
+
+    return {"filters": filters, "aggregate": aggregate, "group_by": group_by, "order_by": order_by, "limit": limit}
+
+def heuristic_plan(question: str, columns: list):
+    """Fallback when the planner reply is unusable: the old 'active status' filter plus counting"""
+    q_lower = question.lower()
+    plan = {"filters": [], "aggregate": None, "group_by": [], "order_by": None, "limit": MAX_ROWS}
+    if "status" in columns and fuzz.partial_ratio("active", q_lower) > 80:
+        plan["filters"].append({"column": "status", "op": "ilike", "value": "active"})
+    if re.search(r"\b(how many|count|number of)\b", q_lower):
+        plan["aggregate"] = {"func": "count", "column": None}
+    return plan
+
+def describe_plan(plan: dict):
+    """Human readable summary, shown to the answering model next to the result"""
+    parts = []
+    if plan["aggregate"]:
+        agg = plan["aggregate"]
+        parts.append(f"{agg['func']}({agg['column'] or '*'})")
+    if plan["group_by"]:
+        parts.append(f"grouped by {', '.join(plan['group_by'])}")
+    for f in plan["filters"]:
+        parts.append(f"where {f['column']} {f['op']} '{f['value']}'")
+    if plan["order_by"]:
+        parts.append(f"ordered by {plan['order_by']['column']} {'desc' if plan['order_by']['desc'] else 'asc'}")
+    if not plan["aggregate"]:
+        parts.append(f"limit {plan['limit']}")
+    return ", ".join(parts)
+
+async def execute_plan(table: str, plan: dict):
+    """
+    Run a validated plan in the database (async, see core/db.py).
+    Returns {"rows": [...], "exact": bool}. exact=False means the aggregate could not be pushed
+    down and rows is only a sample.
+    """
+    agg = plan["aggregate"]
+
+    # Plain count: PostgREST computes it server side, no rows are transferred
+    if agg and agg["func"] == "count" and not plan["group_by"]:
+        return {"rows": [{"count": await db.count(table, plan["filters"])}], "exact": True}
+
+    # Sums, averages and grouped aggregates: public.query_aggregate (database/schema.sql)
+    if agg:
+        try:
+            rows = await db.rpc("query_aggregate", {
+                "p_table": table,
+                "p_func": agg["func"],
+                "p_column": agg["column"],
+                "p_group_by": plan["group_by"],
+                "p_filters": plan["filters"],
+                "p_order_desc": plan["order_by"]["desc"] if plan["order_by"] else True,
+                "p_limit": plan["limit"],
+            })
+            return {"rows": rows or [], "exact": True}
+        except Exception as e:
+            print(f"Aggregate pushdown failed for '{table}', falling back to a row sample: {e}")
+
+    rows = await db.select(table, plan["filters"], order_by=plan["order_by"], limit=plan["limit"] if not agg else MAX_ROWS)
+    return {"rows": rows, "exact": not agg}
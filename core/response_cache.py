@@ -0,0 +1,61 @@
+import hashlib
+import json
+import re
+from core.ai_gateway import is_error_reply
+from core.config_manager import config
+from core.ttl_cache import TTLCache
+
+# Finished model answers, keyed by everything that determines them: the normalized
+# question, mode, table, a fingerprint of the data the answer was built from and the
+# upload's content hash. A changed row changes the fingerprint, so stale answers are
+# never served; the TTL only bounds how long unchanged data keeps its answer.
+RESPONSE_CACHE_TTL = int(config.get("RESPONSE_CACHE_TTL", "300"))
+RESPONSE_CACHE_SIZE = int(config.get("RESPONSE_CACHE_SIZE", "512"))
+
+# Send "Cache-Control: no-cache" or "X-Cache-Bypass: 1" to force a fresh answer
+BYPASS_HEADER = "x-cache-bypass"
+
+# Replayed answers are streamed in pieces of this size, like a live generation
+REPLAY_CHUNK_CHARS = 256
+
+response_cache = TTLCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+# Query plans depend only on the question and the table's columns, so the planner call is cached too
+plan_cache = TTLCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+
+def normalize_question(question: str):
+    """Case, whitespace and trailing punctuation do not change the answer"""
+    return re.sub(r"\s+", " ", question.lower()).strip().rstrip("?!. ")
+
+def fingerprint(value):
+    """Stable short hash of any JSON-serializable value (query results, messages...)"""
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def cache_key(*parts):
+    return fingerprint(list(parts))
+
+def cache_bypassed(request):
+    if "no-cache" in request.headers.get("cache-control", "").lower():
+        return True
+    return request.headers.get(BYPASS_HEADER, "").lower() in ("1", "true", "yes")
+
+def is_cacheable(reply):
+    # arun_ai reports provider failures as text; those are never cached
+    return isinstance(reply, str) and bool(reply.strip()) and not is_error_reply(reply)
+
+async def record_stream(key: str, stream):
+    """
+    Pass an arun_ai text stream through and cache the full answer once it completes.
+    Interrupted or failed streams are not cached.
+    """
+    parts = []
+    async for text in stream:
+        parts.append(text)
+        yield text
+    answer = "".join(parts)
+    if is_cacheable(answer):
+        response_cache.set(key, answer)
+
+async def replay(answer: str):
+    """A cached answer as an async text stream, for sse_chunks"""
+    for i in range(0, len(answer), REPLAY_CHUNK_CHARS):
+        yield answer[i:i + REPLAY_CHUNK_CHARS]
@@ -0,0 +1,66 @@
+import asyncio
+import time
+from core.config_manager import config
+from core.db import db
+from core.telemetry import span
+
+# Never offered to routing or queried by Chat with Data: the backend reads with the
+# service role key, so anything left in the exposed schema would otherwise be readable
+EXCLUDED_TABLES = {t.strip() for t in config.get("SCHEMA_EXCLUDE_TABLES", "user_api_keys").split(",") if t.strip()}
+
+# Used only if introspection fails, so table routing keeps working
+DEFAULT_TABLES = [t for t in ["subscribers", "orders", "products", "woocommerce", "users", "profiles"] if t not in EXCLUDED_TABLES]
+
+class SchemaCatalog:
+    """
+    Tables, columns and types of the exposed schema, read once from the PostgREST
+    OpenAPI document (one request, works on empty tables) and cached with a TTL.
+    """
+
+    def __init__(self, ttl: float = 600.0):
+        self.ttl = ttl
+        self._tables = {}
+        self._loaded_at = 0.0
+        # Concurrent requests on a stale catalog share one refresh
+        self._refreshing = None
+
+    def _is_fresh(self):
+        return self._tables and time.monotonic() - self._loaded_at < self.ttl
+
+    async def _load(self):
+        try:
+            definitions = (await db.openapi()).get("definitions", {})
+            self._tables = {
+                table: [
+                    {"name": col, "type": prop.get("format") or prop.get("type", "unknown")}
+                    for col, prop in spec.get("properties", {}).items()
+                ]
+                for table, spec in definitions.items()
+                if table not in EXCLUDED_TABLES
+            }
+        except Exception as e:
+            print(f"Schema introspection failed: {e}")
+            if not self._tables:
+                self._tables = {t: [] for t in DEFAULT_TABLES}
+            # Retry in 30s instead of serving the fallback for a full TTL
+            self._loaded_at = time.monotonic() - self.ttl + 30
+            return self._tables
+        self._loaded_at = time.monotonic()
+        return self._tables
+
+    async def refresh(self):
+        """Re-read the schema from PostgREST. Keeps the previous catalog if the request fails."""
+        if self._refreshing is None or self._refreshing.done() or self._refreshing.get_loop() is not asyncio.get_running_loop():
+            self._refreshing = asyncio.ensure_future(self._load())
+        return await asyncio.shield(self._refreshing)
+
+    async def aget(self):
+        if self._is_fresh():
+            return self._tables
+        with span("schema"):
+            return await self.refresh()
+
+    def invalidate(self):
+        self._loaded_at = 0.0
+
+schema_catalog = SchemaCatalog(ttl=float(config.get("SCHEMA_CACHE_TTL", "600")))
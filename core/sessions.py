@@ -0,0 +1,136 @@
+import asyncio
+import time
+import uuid
+from core.ai_gateway import arun_ai, is_error_reply
+from core.config_manager import config
+from core.prompt_builder import count_tokens, truncate_tokens
+from core.ttl_cache import TTLCache
+
+# Server-side conversation state for analyze and /ai/run. Each session keeps its recent
+# turns verbatim plus a rolling summary of older ones: once the verbatim history passes
+# SESSION_HISTORY_TOKENS, the oldest turns are folded into the summary by the model, so
+# the history a prompt carries stays bounded however long the conversation runs.
+# Sessions also remember what the last turn resolved (table, query plan and result,
+# uploaded file) so follow-up questions can reuse it instead of starting over.
+#
+# Sessions live in process memory; a session that expired or was served by another
+# worker is simply started fresh.
+SESSION_TTL = float(config.get("SESSION_TTL", "3600"))
+SESSION_MAX = int(config.get("SESSION_MAX", "10000"))
+SESSION_HISTORY_TOKENS = int(config.get("SESSION_HISTORY_TOKENS", "1500"))
+SESSION_SUMMARY_TOKENS = 400
+# Turns always kept verbatim, even past the threshold
+SESSION_KEEP_TURNS = 2
+# A follow-up with the same table and query plan reuses the stored result for this long
+SESSION_RESULT_TTL = float(config.get("SESSION_RESULT_TTL", "60"))
+# Answers are stored cut to this many tokens; the full text went to the client already
+TURN_ANSWER_TOKENS = 300
+
+def _turn_text(turn: dict):
+    return f"User: {turn['question']}\nAssistant: {turn['answer']}"
+
+class Session:
+    def __init__(self, user_id: str):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.summary = ""
+        self.turns = []
+        # What the last turn resolved: table, question, plan, result, rows_at, file_id
+        self.context = {}
+        self._summarizing = False
+
+    def history_tokens(self):
+        return sum(count_tokens(_turn_text(t)) for t in self.turns)
+
+    def history(self):
+        """Summary plus recent turns, for the prompt"""
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of the earlier conversation: {self.summary}")
+        parts.extend(_turn_text(t) for t in self.turns)
+        return "\n".join(parts)
+
+    def messages(self):
+        """Summary plus recent turns as chat messages, to prepend to a /ai/run request"""
+        messages = []
+        for turn in self.turns:
+            messages.append({"role": "user", "content": turn["question"]})
+            messages.append({"role": "assistant", "content": turn["answer"]})
+        if self.summary and messages:
+            messages[0] = {"role": "user", "content": f"(Summary of the earlier conversation: {self.summary})\n\n{messages[0]['content']}"}
+        return messages
+
+    def remember(self, **context):
+        self.context.update({k: v for k, v in context.items() if v is not None})
+
+    def recent_result(self, table: str, plan: dict):
+        """Query result from the previous turn if it ran the same plan on the same table moments ago"""
+        c = self.context
+        if c.get("table") == table and c.get("plan") == plan and time.monotonic() - c.get("rows_at", 0) < SESSION_RESULT_TTL:
+            return c.get("result")
+        return None
+
+    def add_turn(self, question: str, answer: str, **details):
+        self.turns.append({"question": question, "answer": truncate_tokens(answer, TURN_ANSWER_TOKENS), **details})
+
+    async def summarize(self, user_id: str):
+        """Fold the oldest turns into the rolling summary once the history is over the threshold"""
+        if self._summarizing or self.history_tokens() <= SESSION_HISTORY_TOKENS or len(self.turns) <= SESSION_KEEP_TURNS:
+            return
+        self._summarizing = True
+        try:
+            old = self.turns[:-SESSION_KEEP_TURNS]
+            transcript = "\n".join(_turn_text(t) for t in old)
+            reply = await arun_ai(user_id, [{"role": "user", "content": (
+                f"Update the running summary of a conversation about the user's data.\n"
+                f"Keep the facts, numbers, tables and files that were discussed; drop small talk.\n"
+                f"Reply with the new summary only, at most {SESSION_SUMMARY_TOKENS * 3 // 4} words.\n\n"
+                f"CURRENT SUMMARY: {self.summary or '(none)'}\n\nNEW TURNS:\n{transcript}"
+            )}], temperature=0.2, provider="gemini")
+            if not isinstance(reply, str) or is_error_reply(reply) or not reply.strip():
+                # Model unavailable: keep the history bounded anyway with a plain cut
+                reply = f"{self.summary}\n{transcript}".strip()
+            self.summary = truncate_tokens(reply.strip(), SESSION_SUMMARY_TOKENS)
+            # Turns added while the model was summarizing stay
+            self.turns = self.turns[len(old):]
+        finally:
+            self._summarizing = False
+
+class SessionStore:
+    def __init__(self, maxsize: int = SESSION_MAX, ttl: float = SESSION_TTL):
+        self._sessions = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get_or_create(self, session_id: str, user_id: str):
+        """The caller's session, or a new one if the id is unknown, expired or someone else's"""
+        session = self._sessions.get(session_id, None) if session_id else None
+        if session is None or session.user_id != user_id:
+            session = Session(user_id)
+        # Every use extends the session's lifetime
+        self._sessions.set(session.id, session)
+        return session
+
+    def stats(self):
+        return self._sessions.stats()
+
+session_store = SessionStore()
+# Summaries run as background tasks; keep references so they are not garbage collected
+_background = set()
+
+async def record_turn(session: Session, question: str, stream, **details):
+    """
+    Pass an answer stream through, then store the turn and summarize in the background.
+    Interrupted streams are not stored.
+    """
+    parts = []
+    async for text in stream:
+        parts.append(text)
+        yield text
+    finish_turn(session, question, "".join(parts), **details)
+
+def finish_turn(session: Session, question: str, answer: str, **details):
+    if not answer or is_error_reply(answer):
+        return
+    session.add_turn(question, answer, **details)
+    task = asyncio.get_running_loop().create_task(session.summarize(session.user_id))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
@@ -0,0 +1,144 @@
+import json
+import re
+from collections import defaultdict
+from core.config_manager import config
+
+# Words that never name a table; keeps "how many ..." from fuzzy-matching short table names
+STOPWORDS = {
+    "how", "many", "much", "what", "which", "who", "the", "are", "is", "all", "show", "list", "from",
+    "with", "for", "and", "have", "has", "total", "count", "number", "give", "top", "per", "there",
+    "was", "were", "been", "this", "that", "these", "those", "any", "our", "their", "last", "first",
+}
+
+DEFAULT_SYNONYMS = {
+    "subs": "subscribers",
+    "customers": "users",
+    "clients": "users",
+    "purchases": "orders",
+    "items": "products",
+}
+
+# Score multipliers per term kind. Columns shared by many tables (id, status...) are
+# further divided by the number of tables that have them, and dropped past a cutoff.
+TABLE_WEIGHT = 1.0
+SYNONYM_WEIGHT = 0.95
+COLUMN_WEIGHT = 0.6
+MAX_COLUMN_TABLES = 8
+
+PREFIX_SCORE = 0.85
+MIN_GRAM_SCORE = 0.5
+# Trigrams shared by more terms than this carry little signal and are skipped at query time
+MAX_GRAM_POSTINGS = 64
+
+def _trigrams(text: str):
+    padded = f"${text}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _tokens(question: str):
+    words = [w for w in re.findall(r"[a-z0-9]+", question.lower()) if len(w) >= 3 and w not in STOPWORDS]
+    # Adjacent word pairs let "order items" hit a table named order_items
+    return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+def load_synonyms():
+    """Default synonyms plus TABLE_SYNONYMS (JSON object) from the environment"""
+    synonyms = dict(DEFAULT_SYNONYMS)
+    try:
+        synonyms.update(json.loads(config.get("TABLE_SYNONYMS", "{}")))
+    except ValueError as e:
+        print(f"Ignoring invalid TABLE_SYNONYMS: {e}")
+    return synonyms
+
+class RoutingIndex:
+    """
+    Precomputed lookup structures for mapping question words to tables.
+    Built once per schema catalog; a query only touches the postings of its own
+    words, so routing cost does not grow with the number of tables.
+    """
+
+    def __init__(self, catalog: dict, synonyms: dict = None):
+        # Distinct term -> {table: weight}; a column shared by many tables is one term
+        targets = defaultdict(dict)
+
+        column_tables = defaultdict(set)
+        for table, columns in catalog.items():
+            targets[table.lower()][table] = TABLE_WEIGHT
+            for col in columns:
+                column_tables[col["name"].lower()].add(table)
+
+        for col, tables in column_tables.items():
+            if len(tables) > MAX_COLUMN_TABLES:
+                continue
+            for table in tables:
+                weight = COLUMN_WEIGHT / len(tables)
+                targets[col][table] = max(targets[col].get(table, 0.0), weight)
+
+        for alias, table in (synonyms if synonyms is not None else load_synonyms()).items():
+            if table in catalog:
+                alias = alias.lower()
+                targets[alias][table] = max(targets[alias].get(table, 0.0), SYNONYM_WEIGHT)
+
+        self.terms = []  # (term, {table: weight})
+        self._exact = {}
+        self._prefix = defaultdict(list)
+        self._grams = defaultdict(list)
+        self._gram_sizes = []
+        for term, tables in targets.items():
+            self._add(term, tables)
+
+    def _add(self, term: str, tables: dict):
+        term_id = len(self.terms)
+        self.terms.append((term, tables))
+        self._exact[term] = term_id
+        for n in range(3, min(len(term), 12) + 1):
+            self._prefix[term[:n]].append(term_id)
+        grams = _trigrams(term)
+        self._gram_sizes.append(len(grams))
+        for gram in grams:
+            self._grams[gram].append(term_id)
+
+    def _score_token(self, token: str, scores: dict):
+        term_id = self._exact.get(token)
+        if term_id is not None:
+            scores[term_id] = 1.0
+        for term_id in self._prefix.get(token, ()):
+            scores[term_id] = max(scores.get(term_id, 0.0), PREFIX_SCORE)
+
+        grams = _trigrams(token)
+        overlap = defaultdict(int)
+        for gram in grams:
+            postings = self._grams.get(gram, ())
+            if len(postings) > MAX_GRAM_POSTINGS:
+                continue
+            for term_id in postings:
+                overlap[term_id] += 1
+        for term_id, common in overlap.items():
+            dice = 2 * common / (len(grams) + self._gram_sizes[term_id])
+            if dice >= MIN_GRAM_SCORE and dice > scores.get(term_id, 0.0):
+                scores[term_id] = dice
+
+    def route(self, question: str, limit: int = 5):
+        """Ranked [(table, score, matched_term)] for the question, best first. Scores are 0..1."""
+        best = {}
+        for token in _tokens(question):
+            scores = {}
+            self._score_token(token, scores)
+            for term_id, score in scores.items():
+                term, tables = self.terms[term_id]
+                for table, weight in tables.items():
+                    weighted = score * weight
+                    if weighted > best.get(table, (0.0, None))[0]:
+                        best[table] = (weighted, term)
+
+        ranked = sorted(((table, round(score, 4), term) for table, (score, term) in best.items()), key=lambda r: -r[1])
+        return ranked[:limit]
+
+_index = None
+_index_catalog = None
+
+def get_routing_index(catalog: dict):
+    """Index for this catalog, rebuilt only when the schema catalog is refreshed"""
+    global _index, _index_catalog
+    if _index is None or _index_catalog is not catalog:
+        _index = RoutingIndex(catalog)
+        _index_catalog = catalog
+    return _index
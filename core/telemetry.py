@@ -0,0 +1,193 @@
+import bisect
+import contextvars
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from core.config_manager import config
+from core.prompt_builder import count_tokens
+
+# Per-request tracing and Prometheus metrics, without extra dependencies.
+#
+# A Trace is started per HTTP request (backend/tracing.py) and carried in a context
+# variable, so code anywhere below the endpoint can time a stage with
+#
+#   with span("db_fetch"):
+#       ...
+#
+# Every span also feeds the kr_stage_seconds histogram. Metrics are plain in-process
+# counters rendered in the Prometheus text format by /metrics; nothing runs in the
+# background, so an idle server does no telemetry work at all.
+
+# Requests slower than this are logged with all their spans (0 = never)
+TRACE_LOG_SLOW_MS = float(config.get("TRACE_LOG_SLOW_MS", "5000"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+REGISTRY = []
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            lines += [f"{self.name}{_labels(self.labelnames, key)} {value}" for key, value in sorted(self._values.items())]
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple = LATENCY_BUCKETS, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labelnames = labelnames
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', bound)])} {cumulative}")
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', '+Inf')])} {series[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+class CallbackMetric:
+    """Gauge or counter read at scrape time from existing stats: fn() returns {label values: value}"""
+
+    def __init__(self, name: str, help: str, kind: str, labelnames: tuple, fn):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = labelnames
+        self.fn = fn
+        REGISTRY.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            lines += [f"{self.name}{_labels(self.labelnames, key)} {value}" for key, value in sorted(self.fn().items())]
+        except Exception as e:
+            print(f"Metrics: {self.name} failed: {e}")
+        return lines
+
+def render_metrics():
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+request_seconds = Histogram("kr_request_seconds", "HTTP request latency, until the last body byte (streams included)", labelnames=("route", "method", "status"))
+stage_seconds = Histogram("kr_stage_seconds", "Time spent in one stage of a request (auth, key_lookup, table_routing, db_fetch, file_parse, first_token, streaming...)", labelnames=("stage",))
+ttft_seconds = Histogram("kr_time_to_first_token_seconds", "Request start to first streamed answer token", labelnames=("endpoint",))
+tokens_per_second = Histogram("kr_stream_tokens_per_second", "Estimated answer tokens per second while streaming", buckets=(1, 5, 10, 25, 50, 100, 200, 400, 800), labelnames=("endpoint",))
+prompt_tokens = Histogram("kr_prompt_tokens", "Estimated input tokens per model call", buckets=(100, 250, 500, 1000, 2000, 4000, 6000, 8000, 16000, 32000), labelnames=("endpoint",))
+db_request_seconds = Histogram("kr_db_request_seconds", "PostgREST / Supabase Auth request latency", labelnames=("operation",))
+
+class Trace:
+    def __init__(self, name: str):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.start = time.perf_counter()
+        self.spans = []  # (stage, start offset, duration) in seconds
+
+    def add(self, stage: str, start: float, duration: float):
+        self.spans.append((stage, start - self.start, duration))
+
+    def server_timing(self):
+        """Server-Timing header value for the spans finished so far (shown in browser dev tools)"""
+        return ", ".join(f"{stage};dur={duration * 1000:.1f}" for stage, _, duration in self.spans)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.id,
+            "name": self.name,
+            "duration_ms": round((time.perf_counter() - self.start) * 1000, 1),
+            "spans": [{"stage": s, "start_ms": round(o * 1000, 1), "duration_ms": round(d * 1000, 1)} for s, o, d in self.spans],
+        }
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+
+def current_trace():
+    return _current_trace.get()
+
+def start_trace(name: str):
+    trace = Trace(name)
+    return trace, _current_trace.set(trace)
+
+def end_trace(trace: Trace, token):
+    _current_trace.reset(token)
+    if TRACE_LOG_SLOW_MS and (time.perf_counter() - trace.start) * 1000 >= TRACE_LOG_SLOW_MS:
+        print(f"Slow request: {json.dumps(trace.to_dict())}")
+
+def record_stage(stage: str, start: float, duration: float):
+    stage_seconds.observe(duration, stage=stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(stage, start, duration)
+
+@contextmanager
+def span(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, start, time.perf_counter() - start)
+
+async def instrument_stream(stream, endpoint: str, start: float):
+    """
+    Pass an answer stream through, recording the first_token stage (from start, taken
+    before the model call), time to first token (from request start), the streaming
+    stage and tokens per second.
+    """
+    trace = _current_trace.get()
+    first = None
+    tokens = 0
+    try:
+        async for text in stream:
+            if first is None:
+                first = time.perf_counter()
+                record_stage("first_token", start, first - start)
+                ttft_seconds.observe(first - (trace.start if trace else start), endpoint=endpoint)
+            tokens += count_tokens(text)
+            yield text
+    finally:
+        if first is not None:
+            duration = time.perf_counter() - first
+            record_stage("streaming", first, duration)
+            if duration > 0 and tokens:
+                tokens_per_second.observe(tokens / duration, endpoint=endpoint)
@@ -34,3 +34,71 @@ create policy "Users can update own profile." on public.profiles for update usin
 
 create policy "Users can view own api keys." on public.user_api_keys for select using (auth.uid() = user_id);
 create policy "Users can insert own api keys." on public.user_api_keys for insert with check (auth.uid() = user_id);
+
+-- Server-side aggregates for Chat with Data (core/query_plan.py).
+-- Identifiers are quoted with %I and values with %L, so the plan cannot inject SQL.
+-- Only the service role (backend) may call it.
+create or replace function public.query_aggregate(
+  p_table text,
+  p_func text,
+  p_column text default null,
+  p_group_by text[] default '{}',
+  p_filters jsonb default '[]',
+  p_order_desc boolean default true,
+  p_limit int default 50
+) returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  f jsonb;
+  op text;
+  agg_expr text;
+  where_sql text := '';
+  group_sql text;
+  result jsonb;
+begin
+  if p_func not in ('count', 'sum', 'avg', 'min', 'max') then
+    raise exception 'Unsupported aggregate: %', p_func;
+  end if;
+  agg_expr := case when p_func = 'count' then 'count(*)' else format('%s(%I)', p_func, p_column) end;
+
+  for f in select * from jsonb_array_elements(coalesce(p_filters, '[]'::jsonb)) loop
+    op := case f->>'op'
+      when 'eq' then '=' when 'neq' then '<>'
+      when 'gt' then '>' when 'gte' then '>='
+      when 'lt' then '<' when 'lte' then '<='
+      when 'ilike' then 'ilike' when 'is' then 'is'
+    end;
+    if op is null then
+      raise exception 'Unsupported filter: %', f->>'op';
+    end if;
+    where_sql := where_sql || case when where_sql = '' then ' where ' else ' and ' end ||
+      case
+        when op = 'ilike' then format('%I::text ilike %L', f->>'column', f->>'value')
+        when op = 'is' then format('%I is %s', f->>'column',
+          case lower(f->>'value') when 'true' then 'true' when 'false' then 'false' else 'null' end)
+        else format('%I %s %L', f->>'column', op, f->>'value')
+      end;
+  end loop;
+
+  if coalesce(array_length(p_group_by, 1), 0) > 0 then
+    select string_agg(format('%I', g), ', ') into group_sql from unnest(p_group_by) g;
+    execute format(
+      'select coalesce(jsonb_agg(t), ''[]''::jsonb) from (select %s, %s as value from %I%s group by %s order by value %s limit %s) t',
+      group_sql, agg_expr, p_table, where_sql, group_sql,
+      case when p_order_desc then 'desc nulls last' else 'asc nulls last' end,
+      least(greatest(coalesce(p_limit, 50), 1), 200)
+    ) into result;
+  else
+    execute format('select jsonb_build_array(jsonb_build_object(''value'', %s)) from %I%s', agg_expr, p_table, where_sql)
+      into result;
+  end if;
+
+  return result;
+end;
+$$;
+
+revoke execute on function public.query_aggregate(text, text, text, text[], jsonb, boolean, int) from public, anon, authenticated;
+grant execute on function public.query_aggregate(text, text, text, text[], jsonb, boolean, int) to service_role;
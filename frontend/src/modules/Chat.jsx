@@ -10,6 +10,8 @@ export default function Chat({ session }) {
   ]);
   const [input, setInput] = useState('');
   const [selectedFile, setSelectedFile] = useState(null);
+  const [activeFile, setActiveFile] = useState(null); // { id, name } of the last upload, reused for follow-ups
+  const [chatSessionId, setChatSessionId] = useState(null); // server-side conversation (history and summary live there)
   const [isLoading, setIsLoading] = useState(false);
   const [mode, setMode] = useState('database'); // 'general' or 'database'
   const messagesEndRef = useRef(null);
@@ -65,6 +67,15 @@ export default function Chat({ session }) {
         formData.append('mode', mode); // Send selected mode
         if (selectedFile) {
             formData.append('file', selectedFile);
+        } else if (activeFile) {
+            // Follow-up question: the server still has the parsed file, send only its id
+            formData.append('file_id', activeFile.id);
+        } else {
+            // The file chip was closed: stop using the conversation's file
+            formData.append('file_id', 'none');
+        }
+        if (chatSessionId) {
+            formData.append('session_id', chatSessionId);
         }
         
         const token = session?.access_token;
@@ -93,6 +104,11 @@ export default function Chat({ session }) {
             body: formData
         });
 
+        if (res.status === 404 && !selectedFile && activeFile) {
+            // Cached copy expired; the user has to attach the file again
+            setActiveFile(null);
+        }
+
         if (!res.ok) {
             let errorMessage = `Server responded with status ${res.status}. `;
 
@@ -129,6 +145,14 @@ export default function Chat({ session }) {
                         if (jsonStr === "[DONE]") break;
                         
                         const data = JSON.parse(jsonStr);
+
+                        if (data.session_id) {
+                            setChatSessionId(data.session_id);
+                        }
+
+                        if (data.file_id) {
+                            setActiveFile({ id: data.file_id, name: selectedFile ? selectedFile.name : activeFile?.name });
+                        }
                         
                         if (data.chunk) {
                             aiResponse += data.chunk;
@@ -253,13 +277,20 @@ export default function Chat({ session }) {
                   <button onClick={() => setSelectedFile(null)} className="hover:text-red-500 ml-1">×</button>
               </div>
           )}
+          {!selectedFile && activeFile && (
+              <div className="mb-2 inline-flex items-center gap-2 px-3 py-1.5 bg-slate-50 text-slate-600 rounded-full text-xs font-medium border border-slate-200" title="Follow-up questions use this file">
+                  <FileText className="w-3 h-3" />
+                  {activeFile.name}
+                  <button onClick={() => setActiveFile(null)} className="hover:text-red-500 ml-1">×</button>
+              </div>
+          )}
           <div className="relative flex items-end gap-2">
             <input 
                 type="file" 
                 ref={fileInputRef}
                 className="hidden" 
                 onChange={handleFileSelect}
-                accept=".csv,.txt,.md,.pdf,.xlsx,.xls,.docx,.json,.py,.js,.html,.css,.xml,.png,.jpg,.jpeg,.webp"
+                accept=".csv,.txt,.md,.pdf,.xlsx,.xls,.docx,.json,.py,.js,.html,.css,.xml,.png,.jpg,.jpeg,.webp,.heic,.heif"
             />
             <button 
                 onClick={() => fileInputRef.current?.click()}